@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Time every stage of btags on synthetic binaries and compare the result
+with a stored baseline.
+
+    python -m benchmarks.run_benchmarks                    # compare with benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --update-baseline  # record a new baseline
+    python -m benchmarks.run_benchmarks -s wide -s deep    # only some scenarios
+
+Every stage is timed relatively to a fixed reference workload run between the
+scenarios, so the results do not depend on how fast the machine is, and a
+baseline recorded on one machine can be compared with on another.
+Exit status is 1 if any stage got slower than baseline * threshold, the threshold
+being raised by how much the reference workload was slowed down by the rest of
+the machine meanwhile.
+"""
+from collections import OrderedDict
+import argparse as ap
+import tempfile
+import sqlite3
+import json
+import time
+import sys
+import os
+
+from btagslib.debuginfo.runner import Runner
+from btagslib.debuginfo.dwarfformat import DwarfParseTaskGenerator
+from btagslib.db.operation import Operation, Database
+from btagslib.tagfile.ctag import CtagWriter
+from btagslib.tagfile.writer import TagFileGenerator
+from btagslib.terminal.jsonprogress import JsonProgressReporter
+from btagslib.profiling.profiler import profiler
+from .synthelf import DwarfShape, write_synthetic_elf
+
+
+SCENARIOS = OrderedDict([
+    ('small', DwarfShape(cu_count=4, dies_per_cu=200, nesting_depth=2, header_dup_ratio=0.5, macros_per_cu=20)),
+    ('wide', DwarfShape(cu_count=64, dies_per_cu=150, nesting_depth=1, header_dup_ratio=0.5, macros_per_cu=10)),
+    ('deep', DwarfShape(cu_count=8, dies_per_cu=400, nesting_depth=12, header_dup_ratio=0.3, macros_per_cu=0)),
+    ('dup-heavy', DwarfShape(cu_count=32, dies_per_cu=300, nesting_depth=2, header_dup_ratio=0.9, macros_per_cu=0)),
+    ('macro-heavy', DwarfShape(cu_count=8, dies_per_cu=50, nesting_depth=1, header_dup_ratio=0.5, macros_per_cu=2000)),
+])
+
+# the stages reported, in pipeline order, with the profiler stages they are made of
+STAGES = OrderedDict([
+    ('file_map', ['file_map']),
+    ('die_parse', ['before_run', 'decode', 'parse']),
+    ('fold', ['fold']),
+    ('db_commit', ['commit', 'macro']),
+    ('tag_file', ['query', 'sort', 'tag_file']),
+])
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def run_scenario(shape: DwarfShape, jobs, work_dir):
+    """
+    :return: dict of stage name -> wall time in seconds
+    """
+    bin_path = write_synthetic_elf(os.path.join(work_dir, 'synthetic.elf'), shape)
+    db_path = os.path.join(work_dir, 'tag.sqlite')
+    tag_path = os.path.join(work_dir, 'tags')
+    for path in [db_path, tag_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    profiler.reset()
+    with open(os.devnull, 'w') as devnull, open(tag_path, 'w') as tag_stream:
+        status_bar = JsonProgressReporter(jobs + 2, devnull)
+        database = Database(db_path)
+        Runner(DwarfParseTaskGenerator(bin_path, status_bar, lambda: Operation(database)), jobs, status_bar).run()
+        generator = TagFileGenerator(db_path, status_bar, database)
+        generator.get_tag_files([CtagWriter(tag_stream)], work_dir)
+        generator.close()
+        database.close()
+
+    summary = profiler.get_stage_summary()
+    result = OrderedDict()
+    for stage, parts in STAGES.items():
+        result[stage] = sum(summary[part]['wall'] for part in parts if part in summary)
+    result['total'] = sum(result.values())
+    return result
+
+
+def time_reference():
+    """
+    Time a fixed workload like the one of btags, building, sorting and storing
+    many small records, whatever the code of btags is.
+
+    :return: wall time in seconds
+    """
+    start = time.perf_counter()
+    records = [dict(name='name_{}'.format(i * 7919 % 30011), line_no=i, scope='scope_{}'.format(i % 97))
+               for i in range(30000)]
+    records.sort(key=lambda record: (record['name'], record['line_no']))
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE tag (id INTEGER PRIMARY KEY, name TEXT, line_no INTEGER, scope TEXT)')
+    connection.executemany(
+        'INSERT INTO tag (name, line_no, scope) VALUES (?, ?, ?)',
+        ((record['name'], record['line_no'], record['scope']) for record in records)
+    )
+    connection.commit()
+    connection.close()
+    return time.perf_counter() - start
+
+
+def run_benchmarks(scenario_names, repeat, jobs):
+    """
+    :return: dict of scenario name -> dict of stage name -> wall time relative to the reference workload,
+        and how much the reference workload was slowed down by the rest of the machine
+    """
+    profiler.enable()
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory(prefix='btags-bench-') as work_dir:
+        # the first run pays for the lazy imports and the cold caches
+        run_scenario(SCENARIOS['small'], jobs, work_dir)
+        references = [time_reference()]
+        for name in scenario_names:
+            runs = list()
+            for _ in range(repeat):
+                runs.append(run_scenario(SCENARIOS[name], jobs, work_dir))
+                references.append(time_reference())
+            # the fastest run is the least disturbed by the rest of the machine
+            results[name] = OrderedDict((stage, min(run[stage] for run in runs)) for stage in runs[0])
+    # the same for the reference workload, how fast the machine is when undisturbed
+    reference = min(references)
+    for stages in results.values():
+        for stage in stages:
+            stages[stage] /= reference
+    # how much slower the machine usually was than when undisturbed
+    noise = sorted(references)[len(references) // 2] / reference
+    return results, noise
+
+
+def compare(results, baseline, threshold, min_time):
+    """
+    :return: list of (scenario, stage, baseline time, current time) which regressed
+    """
+    regressions = list()
+    for name, stages in results.items():
+        for stage, current in stages.items():
+            expected = baseline.get(name, {}).get(stage)
+            if expected is None or expected < min_time:
+                continue
+            if current > expected * threshold:
+                regressions.append((name, stage, expected, current))
+    return regressions
+
+
+def print_results(results, baseline, stream):
+    stream.write('%-12s %-10s %12s %13s %8s\n' % ('scenario', 'stage', 'time(ref)', 'baseline(ref)', 'ratio'))
+    for name, stages in results.items():
+        for stage, current in stages.items():
+            expected = baseline.get(name, {}).get(stage)
+            if expected:
+                stream.write('%-12s %-10s %12.4f %13.4f %8.2f\n' % (name, stage, current, expected, current / expected))
+            else:
+                stream.write('%-12s %-10s %12.4f %13s %8s\n' % (name, stage, current, '-', '-'))
+    stream.flush()
+
+
+def main():
+    parser = ap.ArgumentParser(description='Benchmark btags on synthetic DWARF binaries.')
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS.keys(),
+                        help='Scenario to run, can be repeated, default is all of them')
+    parser.add_argument('-r', '--repeat', default=3, type=int, help='Runs of every scenario, the fastest one counts')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='Number of work threads')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE, help='Baseline file to compare with')
+    parser.add_argument('-t', '--threshold', default=1.25, type=float,
+                        help='A stage regressed if it is slower than baseline times this')
+    parser.add_argument('--min-time', default=0.25, type=float,
+                        help='Stages faster than this in the baseline are too noisy to be compared, '
+                             'in times of the reference workload')
+    parser.add_argument('-u', '--update-baseline', action='store_true', help='Save the results as the new baseline')
+    nb = parser.parse_args()
+
+    results, noise = run_benchmarks(nb.scenario or list(SCENARIOS.keys()), nb.repeat, nb.jobs)
+
+    baseline = dict()
+    if os.path.exists(nb.baseline):
+        with open(nb.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline, sys.stdout)
+
+    if nb.update_baseline:
+        for name, stages in results.items():
+            baseline[name] = OrderedDict((stage, round(wall, 4)) for stage, wall in stages.items())
+        with open(nb.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        return
+
+    sys.stdout.write('machine noise %.2f, threshold %.2f\n' % (noise, nb.threshold * noise))
+    regressions = compare(results, baseline, nb.threshold * noise, nb.min_time)
+    for name, stage, expected, current in regressions:
+        sys.stdout.write('REGRESSION %s/%s: %.4f -> %.4f\n' % (name, stage, expected, current))
+    if len(regressions) != 0:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+"""
+Generate ELF files with synthetic DWARF debug information, so the
+benchmarks do not depend on a compiler or on binaries lying around.
+
+The shape of the debug information is controlled by DwarfShape:
+
+* cu_count: number of compile units
+* dies_per_cu: approximate number of DIEs in every compile unit
+* nesting_depth: how deep structures are nested into each other
+* header_dup_ratio: the fraction of declarations which come from shared
+  headers, these have the same name, file and line in every compile unit,
+  just like types of a header included everywhere
+* macros_per_cu: number of DW_MACINFO_define entries of every compile unit
+"""
+from collections import namedtuple
+import random
+import struct
+
+
+DwarfShape = namedtuple('DwarfShape', 'cu_count dies_per_cu nesting_depth header_dup_ratio macros_per_cu')
+
+# DWARF constants, only the ones used here
+DW_TAG_compile_unit = 0x11
+DW_TAG_structure_type = 0x13
+DW_TAG_member = 0x0d
+DW_TAG_base_type = 0x24
+DW_TAG_typedef = 0x16
+DW_TAG_subprogram = 0x2e
+DW_TAG_formal_parameter = 0x05
+DW_TAG_variable = 0x34
+DW_TAG_enumeration_type = 0x04
+DW_TAG_enumerator = 0x28
+
+DW_AT_name = 0x03
+DW_AT_byte_size = 0x0b
+DW_AT_stmt_list = 0x10
+DW_AT_comp_dir = 0x1b
+DW_AT_const_value = 0x1c
+DW_AT_producer = 0x25
+DW_AT_decl_file = 0x3a
+DW_AT_decl_line = 0x3b
+DW_AT_encoding = 0x3e
+DW_AT_external = 0x3f
+DW_AT_type = 0x49
+DW_AT_macro_info = 0x43
+
+DW_FORM_data1 = 0x0b
+DW_FORM_data2 = 0x05
+DW_FORM_strp = 0x0e
+DW_FORM_ref4 = 0x13
+DW_FORM_sec_offset = 0x17
+DW_FORM_flag_present = 0x19
+
+DW_ATE_signed = 0x05
+
+DW_MACINFO_define = 0x01
+DW_MACINFO_start_file = 0x03
+DW_MACINFO_end_file = 0x04
+
+DECL = [(DW_AT_name, DW_FORM_strp), (DW_AT_decl_file, DW_FORM_data2), (DW_AT_decl_line, DW_FORM_data2)]
+
+# abbreviation code -> (tag, has children, attributes)
+ABBREVS = {
+    1: (DW_TAG_compile_unit, True,
+        [(DW_AT_producer, DW_FORM_strp), (DW_AT_name, DW_FORM_strp), (DW_AT_comp_dir, DW_FORM_strp),
+         (DW_AT_stmt_list, DW_FORM_sec_offset), (DW_AT_macro_info, DW_FORM_sec_offset)]),
+    2: (DW_TAG_compile_unit, True,
+        [(DW_AT_producer, DW_FORM_strp), (DW_AT_name, DW_FORM_strp), (DW_AT_comp_dir, DW_FORM_strp),
+         (DW_AT_stmt_list, DW_FORM_sec_offset)]),
+    3: (DW_TAG_structure_type, True, DECL + [(DW_AT_byte_size, DW_FORM_data1)]),
+    4: (DW_TAG_member, False, DECL + [(DW_AT_type, DW_FORM_ref4)]),
+    5: (DW_TAG_base_type, False,
+        [(DW_AT_name, DW_FORM_strp), (DW_AT_byte_size, DW_FORM_data1), (DW_AT_encoding, DW_FORM_data1)]),
+    6: (DW_TAG_typedef, False, DECL + [(DW_AT_type, DW_FORM_ref4)]),
+    7: (DW_TAG_subprogram, True, [(DW_AT_external, DW_FORM_flag_present)] + DECL + [(DW_AT_type, DW_FORM_ref4)]),
+    8: (DW_TAG_formal_parameter, False, DECL + [(DW_AT_type, DW_FORM_ref4)]),
+    9: (DW_TAG_variable, False, DECL + [(DW_AT_type, DW_FORM_ref4), (DW_AT_external, DW_FORM_flag_present)]),
+    10: (DW_TAG_enumeration_type, True, DECL + [(DW_AT_byte_size, DW_FORM_data1)]),
+    11: (DW_TAG_enumerator, False, [(DW_AT_name, DW_FORM_strp), (DW_AT_const_value, DW_FORM_data1)]),
+}
+
+COMP_DIR = '/synthetic/build'
+HEADER_COUNT = 8
+
+
+def _uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _cstring(value):
+    return value.encode() + b'\0'
+
+
+class _StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets = dict()
+
+    def offset(self, value):
+        if value not in self._offsets:
+            self._offsets[value] = len(self.data)
+            self.data += _cstring(value)
+        return self._offsets[value]
+
+
+def _encode_abbrevs():
+    out = bytearray()
+    for code in sorted(ABBREVS):
+        tag, has_children, attributes = ABBREVS[code]
+        out += _uleb128(code) + _uleb128(tag) + bytes([1 if has_children else 0])
+        for name, form in attributes:
+            out += _uleb128(name) + _uleb128(form)
+        out += b'\0\0'
+    return bytes(out + b'\0')
+
+
+class _UnitWriter:
+    """
+    Writes the DIEs of one compile unit, references are unit relative
+    offsets as DW_FORM_ref4 requires.
+    """
+    HEADER_SIZE = 11
+
+    def __init__(self, strings: _StringTable):
+        self._strings = strings
+        self.body = bytearray()
+        self.die_count = 0
+
+    def offset(self):
+        return self.HEADER_SIZE + len(self.body)
+
+    def die(self, code, *values):
+        offset = self.offset()
+        self.die_count += 1
+        self.body += _uleb128(code)
+        attributes = [(name, form) for name, form in ABBREVS[code][2] if form != DW_FORM_flag_present]
+        for (name, form), value in zip(attributes, values):
+            if form == DW_FORM_strp:
+                self.body += struct.pack('<I', self._strings.offset(value))
+            elif form == DW_FORM_data1:
+                self.body += struct.pack('<B', value)
+            elif form == DW_FORM_data2:
+                self.body += struct.pack('<H', value)
+            elif form in (DW_FORM_ref4, DW_FORM_sec_offset):
+                self.body += struct.pack('<I', value)
+        return offset
+
+    def end_children(self):
+        self.die_count += 1
+        self.body += b'\0'
+
+    def get_bytes(self, abbrev_offset):
+        unit_length = self.HEADER_SIZE - 4 + len(self.body)
+        return struct.pack('<IHIB', unit_length, 4, abbrev_offset, 8) + bytes(self.body)
+
+
+class SyntheticElfBuilder:
+    def __init__(self, shape: DwarfShape, seed=0):
+        self.shape = shape
+        self._random = random.Random(seed)
+        self._strings = _StringTable()
+        self._info = bytearray()
+        self._line = bytearray()
+        self._macinfo = bytearray()
+
+    @staticmethod
+    def _file_names(cu_index):
+        # file 1 is the source of the compile unit, the rest are the shared headers
+        return ['cu_%d.c' % cu_index] + ['common_%d.h' % i for i in range(HEADER_COUNT)]
+
+    def _line_program(self, cu_index):
+        body = bytearray()
+        body += bytes([1, 1, (-5) & 0xff, 14, 13])
+        body += bytes([0, 1, 1, 1, 1, 0, 0, 0, 1, 0, 0, 1])
+        body += _cstring('src') + _cstring('include') + b'\0'
+        for file_index, name in enumerate(self._file_names(cu_index)):
+            body += _cstring(name) + _uleb128(1 if file_index == 0 else 2) + _uleb128(0) + _uleb128(0)
+        body += b'\0'
+        header = struct.pack('<HI', 2, len(body))
+        # only the end of sequence instruction
+        program = bytes([0, 1, 1])
+        return struct.pack('<I', len(header) + len(body) + len(program)) + header + bytes(body) + program
+
+    def _macro_info(self, cu_index):
+        out = bytearray()
+        out += bytes([DW_MACINFO_start_file]) + _uleb128(0) + _uleb128(1)
+        for i in range(self.shape.macros_per_cu):
+            if self._random.random() < self.shape.header_dup_ratio:
+                header = i % HEADER_COUNT
+                out += bytes([DW_MACINFO_start_file]) + _uleb128(i + 1) + _uleb128(header + 2)
+                out += bytes([DW_MACINFO_define]) + _uleb128(i + 1) + _cstring('COMMON_MACRO_%d %d' % (i, i))
+                out += bytes([DW_MACINFO_end_file])
+            else:
+                out += bytes([DW_MACINFO_define]) + _uleb128(i + 1) + \
+                    _cstring('CU%d_MACRO_%d(x) ((x) + %d)' % (cu_index, i, i))
+        out += bytes([DW_MACINFO_end_file]) + b'\0'
+        return bytes(out)
+
+    def _declaration(self, cu_index, serial):
+        """
+        :return: (name prefix, file index, line) of the serial-th declaration of a compile unit
+        """
+        if self._random.random() < self.shape.header_dup_ratio:
+            header = serial % HEADER_COUNT
+            return 'common_%d' % serial, header + 2, serial + 1
+        return 'cu%d_%d' % (cu_index, serial), 1, serial + 1
+
+    def _write_struct(self, unit, prefix, file_index, line, int_offset, depth):
+        offset = unit.die(3, prefix + '_s', file_index, line, 8)
+        unit.die(4, prefix + '_member', file_index, line, int_offset)
+        if depth > 1:
+            self._write_struct(unit, prefix + '_in', file_index, line, int_offset, depth - 1)
+        unit.end_children()
+        return offset
+
+    def _write_unit(self, cu_index):
+        unit = _UnitWriter(self._strings)
+        has_macro = self.shape.macros_per_cu > 0
+        line_offset = len(self._line)
+        self._line += self._line_program(cu_index)
+        if has_macro:
+            macro_offset = len(self._macinfo)
+            self._macinfo += self._macro_info(cu_index)
+            unit.die(1, 'btags synthetic', 'src/cu_%d.c' % cu_index, COMP_DIR, line_offset, macro_offset)
+        else:
+            unit.die(2, 'btags synthetic', 'src/cu_%d.c' % cu_index, COMP_DIR, line_offset)
+        int_offset = unit.die(5, 'int', 4, DW_ATE_signed)
+
+        serial = 0
+        while unit.die_count < self.shape.dies_per_cu:
+            prefix, file_index, line = self._declaration(cu_index, serial)
+            kind = serial % 4
+            if kind == 0:
+                struct_offset = self._write_struct(unit, prefix, file_index, line, int_offset,
+                                                   max(1, self.shape.nesting_depth))
+                unit.die(6, prefix + '_t', file_index, line, struct_offset)
+            elif kind == 1:
+                unit.die(7, prefix + '_func', file_index, line, int_offset)
+                unit.die(8, prefix + '_arg0', file_index, line, int_offset)
+                unit.die(8, prefix + '_arg1', file_index, line, int_offset)
+                unit.end_children()
+            elif kind == 2:
+                unit.die(9, prefix + '_var', file_index, line, int_offset)
+            else:
+                unit.die(10, prefix + '_enum', file_index, line, 4)
+                for i in range(3):
+                    unit.die(11, '%s_E%d' % (prefix.upper(), i), i)
+                unit.end_children()
+            serial += 1
+        unit.end_children()
+        self._info += unit.get_bytes(0)
+
+    def build(self):
+        for cu_index in range(self.shape.cu_count):
+            self._write_unit(cu_index)
+        sections = [
+            ('.debug_info', bytes(self._info)),
+            ('.debug_abbrev', _encode_abbrevs()),
+            ('.debug_str', bytes(self._strings.data)),
+            ('.debug_line', bytes(self._line)),
+        ]
+        if self.shape.macros_per_cu > 0:
+            sections.append(('.debug_macinfo', bytes(self._macinfo)))
+        return build_elf(sections)
+
+
+def build_elf(sections):
+    """
+    Lay out a little endian ELF64 x86-64 executable holding nothing but *sections*
+    :param sections: list of (name, bytes)
+    :return: bytes
+    """
+    shstrtab = _StringTable()
+    shstrtab.offset('')
+    names = [shstrtab.offset(name) for name, _ in sections]
+    shstrtab_name = shstrtab.offset('.shstrtab')
+    sections = list(sections) + [('.shstrtab', bytes(shstrtab.data))]
+    names.append(shstrtab_name)
+
+    data = bytearray(b'\0' * 64)
+    headers = [struct.pack('<IIQQQQIIQQ', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)]
+    for (name, content), name_offset in zip(sections, names):
+        sh_type = 3 if name == '.shstrtab' else 1
+        headers.append(struct.pack('<IIQQQQIIQQ', name_offset, sh_type, 0, 0, len(data), len(content), 0, 0, 1, 0))
+        data += content
+    while len(data) % 8 != 0:
+        data += b'\0'
+    shoff = len(data)
+    for header in headers:
+        data += header
+
+    ident = b'\x7fELF' + bytes([2, 1, 1, 0]) + b'\0' * 8
+    data[0:64] = ident + struct.pack('<HHIQQQIHHHHHH', 2, 62, 1, 0, 0, shoff, 0, 64, 56, 0, 64,
+                                     len(headers), len(headers) - 1)
+    return bytes(data)
+
+
+def write_synthetic_elf(path, shape: DwarfShape, seed=0):
+    with open(path, 'wb') as f:
+        f.write(SyntheticElfBuilder(shape, seed).build())
+    return path
@@ -1,20 +1,42 @@
 #!/usr/bin/env python3
 import os
 import sys
+import shutil
+import importlib
 from os.path import dirname
-from btagslib.debuginfo.runner import Runner
-from btagslib.debuginfo.dwarfformat import DwarfParseTaskGenerator
-from btagslib.db.operation import Operation
-from btagslib.tagfile.ctag import CtagFormat
 from btagslib.terminal.statusbar import MultiProgressBar
+from btagslib.terminal.jsonprogress import JsonProgressReporter
+from btagslib.profiling.profiler import profiler
 import argparse as ap
 
+
+def load_class(path):
+    """
+    Import the class only when it is used, SQLAlchemy and pyelftools take several times
+    longer to import than generating the tag file from an existing database takes
+    :param path: module and class name, e.g. btagslib.tagfile.ctag.CtagWriter
+    """
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        from btagslib.cli.query import main as query_main
+        query_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from btagslib.cli.serve import main as serve_main
+        serve_main(sys.argv[2:])
+        return
+
     debug_info_mapper = {
-        'dwarf': DwarfParseTaskGenerator
+        'dwarf': 'btagslib.debuginfo.dwarfformat.DwarfParseTaskGenerator'
     }
     tag_format_mapper = {
-        'ctag': CtagFormat
+        'ctag': 'btagslib.tagfile.ctag.CtagWriter',
+        'etag': 'btagslib.tagfile.etag.EtagWriter',
+        'json': 'btagslib.tagfile.jsonlines.JsonLinesWriter',
     }
     parser = ap.ArgumentParser(
         prog='Binary tag file generator.',
@@ -35,6 +57,10 @@ def main():
                      action='store_true')
     parser. \
         add_argument('-j', '--jobs', help='Number of work threads', default=1, type=int)
+    parser. \
+        add_argument('--max-memory', help='Memory to stay under while parsing, e.g. 4G or 512M, fewer compile '
+                                          'units are parsed at once when they are estimated to take more, '
+                                          'a large one alone', type=parse_memory)
 
     db_group = parser.add_mutually_exclusive_group()
     db_group. \
@@ -51,44 +77,361 @@ def main():
         add_argument('-f', '--debug-info-format', help='The debug info format in binary file',
                      default='dwarf', choices=debug_info_mapper.keys())
     parser. \
-        add_argument('-F', '--tag-file-format', help='The debug info format in binary file',
+        add_argument('-F', '--tag-file-format', help='The format of the tag file',
                      default='ctag', choices=tag_format_mapper.keys())
+    parser. \
+        add_argument('--extra-tag-file', help='Also generate a tag file of this format, e.g. etag=TAGS or '
+                                              'json=tags.jsonl, in the same pass over the tags, can be repeated',
+                     metavar='FORMAT=PATH', action='append', default=[])
 
     parser. \
-        add_argument('binary_file', nargs=1, help='The path of the binary file with debug info',
-                     type=ap.FileType('rb'))
+        add_argument('--debug-dir', help='Directory searched for the debug files of stripped binaries, by build-id '
+                                         'and .gnu_debuglink like gdb, can be repeated, default is /usr/lib/debug',
+                     action='append')
+
+    parser. \
+        add_argument('--name-index', help='Only parse the global names listed by the .gdb_index of the binary, '
+                                          'e.g. of gold --gdb-index, the DIEs in function bodies are skipped',
+                     action='store_true')
+    parser. \
+        add_argument('--direct', help='Generate the tag file straight from the binary, without a database',
+                     action='store_true')
+    parser. \
+        add_argument('--cache-dir', help='Directory of the databases cached by binary build-id, '
+                                         'default is $XDG_CACHE_HOME/btags')
+    parser. \
+        add_argument('--no-cache', help='Neither reuse nor store a cached database', action='store_true')
+    parser. \
+        add_argument('--resume', help='Resume the interrupted run which filled the database, only the compile units '
+                                      'it did not commit are parsed', action='store_true')
+    parser. \
+        add_argument('--recent-first', help='Parse the compile units whose source files were modified most recently '
+                                            'first', action='store_true')
+    parser. \
+        add_argument('--partial-interval', help='Generate the tag file with the tags parsed so far every this many '
+                                                'seconds while parsing', type=float)
+    parser. \
+        add_argument('--watch', help='Stay resident and generate the tag file again whenever a binary is linked '
+                                     'again, only the compile units whose sources have changed are parsed again',
+                     action='store_true')
+    parser. \
+        add_argument('--watch-interval', help='Seconds between two checks of the binaries by --watch',
+                     default=1.0, type=float)
+    parser. \
+        add_argument('-P', '--progress', help='How to report progress, "json" writes JSON lines records',
+                     default='bar' if sys.stdout.isatty() else 'json', choices=['bar', 'json'])
+    parser. \
+        add_argument('--progress-file', help='Where the json progress records go, default is stderr',
+                     type=ap.FileType('w'), default=sys.stderr)
+    parser. \
+        add_argument('--progress-interval', help='Seconds between two json progress records',
+                     default=1.0, type=float)
+    parser. \
+        add_argument('--profile', help='Print time, CPU, item count and peak RSS of every stage at exit',
+                     action='store_true')
+    parser. \
+        add_argument('--profile-top', help='Number of slowest compile units listed by --profile',
+                     default=10, type=int)
+    parser. \
+        add_argument('--profile-pstats', help='Dump cProfile statistics of the whole run to this pstats file')
+    parser. \
+        add_argument('--profile-trace', help='Dump the profiled stages to this Chrome trace JSON file')
+
+    parser. \
+        add_argument('--include', help='Only index the compile units and files under this path glob, '
+                                       'can be repeated', action='append')
+    parser. \
+        add_argument('--exclude', help='Do not index the compile units and files under this path glob, '
+                                       'e.g. /usr/include, can be repeated', action='append')
+    parser. \
+        add_argument('--kinds', help='Only index the tags of these kinds, comma separated ctags kind letters '
+                                     'or type names, e.g. p,s,m', type=parse_kinds)
+
+    parser. \
+        add_argument('binary_file', nargs='+', help='The paths of the binary files with debug info, e.g. an '
+                                                    'executable and its shared libraries, or directories of them')
 
     nb = parser.parse_args()
-    bin_path = nb.binary_file[0].name
+    if nb.direct and nb.only_database:
+        parser.error('--direct does not generate a database')
+    if nb.partial_interval is not None and (nb.only_database or nb.append_tag):
+        parser.error('--partial-interval replaces the tag file')
+    if nb.watch and (nb.only_database or nb.append_tag):
+        parser.error('--watch keeps the tags in memory and replaces the tag file')
+    # the format and path of every tag file, all generated in one pass
+    tag_paths = [(nb.tag_file_format, nb.tag_file)]
+    for extra_tag_file in nb.extra_tag_file:
+        tag_format, _, path = extra_tag_file.partition('=')
+        if tag_format not in tag_format_mapper or len(path) == 0:
+            parser.error('argument --extra-tag-file: expected FORMAT=PATH with FORMAT one of {}, got {}'.format(
+                ', '.join(tag_format_mapper), extra_tag_file
+            ))
+        tag_paths.append((tag_format, path))
+    for bin_path in nb.binary_file:
+        if not os.path.exists(bin_path):
+            parser.error("argument binary_file: can't open '{}'".format(bin_path))
     db_path = nb.database_file
-    tag_path = nb.tag_file
     project_path = dirname(nb.tag_file) if nb.project_dir is None else nb.project_dir
 
-    if not nb.append_tag:
-        if os.path.exists(tag_path):
-            os.remove(tag_path)
+    # replaced by --watch once generated, the old one is used meanwhile
+    if not nb.append_tag and not nb.watch:
+        for _, tag_path in tag_paths:
+            if os.path.exists(tag_path):
+                os.remove(tag_path)
     if nb.new_db:
         if os.path.exists(db_path):
             os.remove(db_path)
+    resume = False
+    if not nb.direct and not nb.watch and os.path.exists(db_path):
+        from btagslib.db.connection import connect, is_complete, is_intact
+        connection = connect(db_path)
+        try:
+            # the database of an interrupted run is not taken for complete
+            if not is_complete(connection):
+                if not nb.resume:
+                    parser.error('the run filling {} was interrupted, resume it with --resume or start over '
+                                 'with -n'.format(db_path))
+                if not is_intact(connection):
+                    parser.error('{} is damaged, start over with -n'.format(db_path))
+                resume = True
+        finally:
+            connection.close()
+
+    if nb.profile or nb.profile_pstats is not None or nb.profile_trace is not None:
+        profiler.enable(cprofile=nb.profile_pstats is not None)
+
+    # a line for every worker, the runner and the task generator
+    if nb.progress == 'json':
+        status_bar = JsonProgressReporter(nb.jobs + 2, nb.progress_file, nb.progress_interval)
+    else:
+        status_bar = MultiProgressBar(nb.jobs + 2, "Task ", sys.stdout)
+
+    tag_filter = None
+    if nb.include is not None or nb.exclude is not None or nb.kinds is not None:
+        from btagslib.debuginfo.tagfilter import TagFilter
+        tag_filter = TagFilter(nb.include, nb.exclude, nb.kinds)
 
-    status_bar = MultiProgressBar(nb.jobs + 1, "Task ", sys.stdout)
-    df = debug_info_mapper[nb.debug_info_format](bin_path, status_bar)
-    if not df.has_debug_info():
-        status_bar.info(None, 'No debug info found in binary file.')
+    tag_files = None if nb.only_database else \
+        [(load_class(tag_format_mapper[tag_format]), tag_path) for tag_format, tag_path in tag_paths]
+
+    if nb.watch:
+        watch(nb, status_bar, tag_filter, tag_files, project_path)
+        status_bar.close()
+        report_profile(nb)
         exit()
 
-    if not os.path.exists(db_path):
-        status_bar.info(None, 'Parsing tags and filling database...', status_bar.term.BLUE)
-        Operation.prepare(db_path)
-        Runner(df, nb.jobs, status_bar).run()
+    # the tags of a database filled before, without the filters or with others, are filtered when written
+    written_tag_filter = tag_filter if not resume and os.path.exists(db_path) else None
+
+    # fast path, the tags are already in the database, the binary is not even opened
+    if nb.direct or resume or not os.path.exists(db_path):
+        from btagslib.debuginfo.runner import open_task_generators, get_runner
+        from btagslib.db.operation import Operation
+        from btagslib.db.cache import IndexCache
+        from btagslib.db.memory import TagRecordStore, MemoryOperation
+        from btagslib.indexer import get_binary_paths
+        store = TagRecordStore() if nb.direct else None
+        operation_factory = (lambda: MemoryOperation(store)) if nb.direct else Operation
+        task_generator_class = load_class(debug_info_mapper[nb.debug_info_format])
+        task_generators = open_task_generators(
+            get_binary_paths(nb.binary_file), status_bar, lambda bin_path: task_generator_class(
+                bin_path, status_bar, operation_factory, tag_filter, recent_first=nb.recent_first,
+                debug_dirs=nb.debug_dir, name_index=nb.name_index
+            )
+        )
+        if len(task_generators) == 0:
+            status_bar.close()
+            exit()
+
+    if nb.direct:
+        status_bar.info(None, 'Parsing tags...', status_bar.term.BLUE)
+        from btagslib.tagfile.writer import DirectTagFileGenerator
+        run_writing_partial_tag_files(
+            get_runner(task_generators, nb.jobs, status_bar, nb.max_memory), nb,
+            lambda partial_status_bar: DirectTagFileGenerator(store.snapshot(), partial_status_bar), tag_files,
+            project_path
+        )
+        status_bar.info(None, 'Generating tag file...')
+        write_tag_files(nb, DirectTagFileGenerator(store, status_bar), tag_files, project_path)
+        status_bar.info(None, 'Done!')
+        status_bar.close()
+        report_profile(nb)
+        exit()
+
+    if resume or not os.path.exists(db_path):
+        cache = None if nb.no_cache else IndexCache(nb.cache_dir)
+        binary_id = get_binary_id(task_generators) if cache is not None else None
+        if binary_id is not None and tag_filter is not None:
+            binary_id += '-filter-' + tag_filter.get_id()
+        if binary_id is not None and nb.name_index:
+            binary_id += '-name-index'
+        cached_db_path = cache.lookup(binary_id) if cache is not None and not resume else None
+        if cached_db_path is not None:
+            status_bar.info(None, 'Reusing cached database {}'.format(cached_db_path), status_bar.term.BLUE)
+            if nb.only_database:
+                shutil.copyfile(cached_db_path, db_path)
+            else:
+                db_path = cached_db_path
+        else:
+            status_bar.info(
+                None, 'Resuming the interrupted run...' if resume else 'Parsing tags and filling database...',
+                status_bar.term.BLUE
+            )
+            Operation.prepare(db_path)
+            from btagslib.tagfile.writer import TagFileGenerator
+            run_writing_partial_tag_files(
+                get_runner(task_generators, nb.jobs, status_bar, nb.max_memory), nb,
+                lambda partial_status_bar: TagFileGenerator(db_path, partial_status_bar), tag_files, project_path
+            )
+            # the references between the compile units parsed before and after the interruption are not resolved
+            if cache is not None and not resume:
+                Operation.checkpoint()
+                cache.store(binary_id, db_path)
 
     if nb.only_database:
+        status_bar.close()
+        report_profile(nb)
         exit()
 
     status_bar.info(None, 'Generating tag file...')
-    ct = tag_format_mapper[nb.tag_file_format](db_path, status_bar)
-    ct.get_tag_file(open(tag_path, 'a+'), project_path, nb.compile_dir)
+    from btagslib.tagfile.writer import TagFileGenerator
+    write_tag_files(nb, TagFileGenerator(db_path, status_bar, tag_filter=written_tag_filter), tag_files, project_path)
     status_bar.info(None, 'Done!')
+    status_bar.close()
+    report_profile(nb)
+
+
+def run_writing_partial_tag_files(runner, nb, generator_factory, tag_files, project_path):
+    """
+    Runs the runner, generating the tag files with the tags parsed so far every --partial-interval seconds
+    :param generator_factory: called with a status bar, creates the TagFileGenerator of the tags parsed so far
+    :param tag_files: list of the TagWriter class and the path of every tag file
+    """
+    if nb.partial_interval is None:
+        runner.run()
+        return
+    from btagslib.tagfile.partial import PartialTagFileWriter
+    partial_writer = PartialTagFileWriter(
+        generator_factory, tag_files, nb.partial_interval, project_path, nb.compile_dir
+    )
+    partial_writer.start()
+    try:
+        runner.run()
+    finally:
+        partial_writer.stop()
+
+
+def write_tag_files(nb, generator, tag_files, project_path):
+    """
+    Generates all the tag files in one pass over the tags
+    :param tag_files: list of the TagWriter class and the path of every tag file
+    """
+    if nb.partial_interval is not None:
+        # the partial tag files are in use until the complete ones replace them
+        from btagslib.tagfile.partial import replace_tag_files
+        profiler.call(replace_tag_files, generator, tag_files, project_path, nb.compile_dir)
+    else:
+        streams = [open(tag_path, 'a+') for _, tag_path in tag_files]
+        writers = [writer_class(stream) for (writer_class, _), stream in zip(tag_files, streams)]
+        try:
+            profiler.call(generator.get_tag_files, writers, project_path, nb.compile_dir)
+        finally:
+            for stream in streams:
+                stream.close()
+
+
+def watch(nb, status_bar, tag_filter, tag_files, project_path):
+    """
+    Keeps the tags of the binaries in memory and generates the tag file again whenever a binary
+    has been linked again, until interrupted
+    :param tag_files: list of the TagWriter class and the path of every tag file
+    """
+    import time
+    from btagslib.debuginfo.incremental import IncrementalIndex, BinaryWatcher
+    from btagslib.tagfile.partial import replace_tag_files
+    from btagslib.tagfile.writer import DirectTagFileGenerator
+    from btagslib.indexer import get_binary_paths
+    binary_paths = get_binary_paths(nb.binary_file)
+    # watching from before the first parse, a binary linked meanwhile is parsed again
+    watcher = BinaryWatcher(binary_paths, nb.watch_interval)
+    index = IncrementalIndex(
+        status_bar, nb.jobs, tag_filter, max_memory=nb.max_memory, debug_dirs=nb.debug_dir, name_index=nb.name_index
+    )
+    changed_paths = binary_paths
+    try:
+        while True:
+            status_bar.info(None, 'Parsing tags of {}...'.format(', '.join(changed_paths)), status_bar.term.BLUE)
+            start_time = time.time()
+            try:
+                updated = index.update(changed_paths)
+                if updated:
+                    generator = DirectTagFileGenerator(index.store, status_bar)
+                    try:
+                        profiler.call(replace_tag_files, generator, tag_files, project_path, nb.compile_dir)
+                    finally:
+                        generator.close()
+            except Exception as e:
+                # e.g. a binary being written by a linker which does not stop for a poll interval
+                status_bar.info(None, 'Keeping the tag file, cannot index {}: {}'.format(', '.join(changed_paths), e))
+            else:
+                status_bar.info(None, 'Done! {} compile units parsed, {} kept, in {:.2f}s.'.format(
+                    index.parsed_count, index.reused_count, time.time() - start_time
+                ) if updated else 'Nothing changed.')
+            changed_paths = watcher.wait_changed()
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_kinds(kinds):
+    """
+    :param kinds: comma separated ctags kind letters or TagType names, e.g. p,structure
+    :return: list of TagType
+    """
+    from btagslib.cli.query import parse_kind
+    return [parse_kind(kind.strip()) for kind in kinds.split(',') if len(kind.strip()) != 0]
+
+
+def parse_memory(memory):
+    """
+    :param memory: bytes, or kilo, mega or gigabytes, e.g. 4G
+    :return: bytes
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    size = memory.strip().upper().rstrip('B')
+    try:
+        if len(size) != 0 and size[-1] in units:
+            size = int(float(size[:-1]) * units[size[-1]])
+        else:
+            size = int(size)
+    except (ValueError, OverflowError):
+        raise ap.ArgumentTypeError("invalid memory size: '{}'".format(memory))
+    if size <= 0:
+        raise ap.ArgumentTypeError("invalid memory size: '{}'".format(memory))
+    return size
+
+
+def get_binary_id(task_generators):
+    """
+    :return: the id the database of the binaries is cached by
+    """
+    if len(task_generators) == 1:
+        return task_generators[0].get_binary_id()
+    import hashlib
+    digest = hashlib.sha1()
+    for binary_id in sorted(task_generator.get_binary_id() for task_generator in task_generators):
+        digest.update(binary_id.encode() + b'\n')
+    return 'multi-' + digest.hexdigest()
+
+
+def report_profile(nb):
+    if not profiler.enabled:
+        return
+    if nb.profile:
+        profiler.print_report(sys.stderr, nb.profile_top)
+    if nb.profile_pstats is not None:
+        profiler.dump_pstats(nb.profile_pstats)
+    if nb.profile_trace is not None:
+        profiler.dump_chrome_trace(nb.profile_trace)
 
 if __name__ == '__main__':
     main()
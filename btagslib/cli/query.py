@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+from btagslib.db.record import TagMatch, TAG_TYPE_NAMES, match_to_dict
+from btagslib.server.client import LookupClient, LookupServerError
+from btagslib.tagfile.kinds import CTAG_KINDS
+import argparse as ap
+
+
+def parse_kind(kind):
+    """
+    :param kind: a ctags kind letter, e.g. p, or a TagType name, e.g. function
+    :return: the TagType
+    """
+    for tag_type, letter in CTAG_KINDS.items():
+        if letter == kind:
+            return tag_type
+    for tag_type, name in TAG_TYPE_NAMES.items():
+        if name.lower() == kind.lower():
+            return tag_type
+    raise ap.ArgumentTypeError('Unknown kind {}'.format(kind))
+
+
+def format_match(match):
+    qualified_name = match.name if match.scope is None else '%s::%s' % (match.scope, match.name)
+    path = os.path.join(match.file_directory, match.file_name) if match.file_name is not None else '-'
+    if match.line_no is not None:
+        path = '%s:%d' % (path, match.line_no)
+    return '%d\t%s\t%s\t%s' % (match.id, TAG_TYPE_NAMES.get(match.type, '-'), qualified_name, path)
+
+
+def main(argv=None):
+    parser = ap.ArgumentParser(
+        prog='btags query',
+        description='Look tags up in a tag info database.',
+    )
+    parser. \
+        add_argument('-d', '--database-file', default='{}/tag.sqlite'.format(os.getcwd()),
+                     help='The tag info database to look up')
+    parser. \
+        add_argument('-p', '--prefix', help='Match the names beginning with NAME', action='store_true')
+    parser. \
+        add_argument('-i', '--ignore-case', help='Match ASCII letters case insensitively', action='store_true')
+    parser. \
+        add_argument('-S', '--substring', help='Match the names containing NAME, slower than the others',
+                     action='store_true')
+    parser. \
+        add_argument('-k', '--kind', help='Only tags of this kind, a ctags kind letter or a type name, '
+                                          'can be repeated', action='append', type=parse_kind)
+    parser. \
+        add_argument('--file', help='Only tags in this file, a file name or the end of a path')
+    parser. \
+        add_argument('--cu', help='Only tags of this compile unit, its id or the end of its source path')
+    parser. \
+        add_argument('-m', '--members', help='List the members or parameters of the matched tags instead',
+                     action='store_true')
+    parser. \
+        add_argument('--children', help='List the tags declared in the scope of the matched tags instead',
+                     action='store_true')
+    parser. \
+        add_argument('-l', '--limit', help='Maximum number of matched tags', default=None, type=int)
+    parser. \
+        add_argument('--json', help='Write JSON lines instead of tab separated fields', action='store_true')
+    parser. \
+        add_argument('--socket', help='Ask the btags serve process listening on this socket instead of '
+                                      'opening the database')
+    parser. \
+        add_argument('--build-substring-index', help='Index the names of the database for fast --substring lookups',
+                     action='store_true')
+    parser. \
+        add_argument('name', nargs='?', help='The name of the tags')
+
+    nb = parser.parse_args(argv)
+    if nb.name is None and not nb.build_substring_index:
+        parser.error('the following arguments are required: name')
+    compile_unit = None
+    if nb.cu is not None:
+        compile_unit = int(nb.cu) if nb.cu.isdigit() else nb.cu
+
+    if nb.socket is not None:
+        if nb.build_substring_index:
+            parser.error('--build-substring-index needs the database, not --socket')
+        try:
+            matches = find_with_server(nb, compile_unit)
+        except (OSError, LookupServerError) as e:
+            parser.error(str(e))
+        write_matches(matches, nb.json)
+        return
+
+    # SQLAlchemy takes longer to import than a lookup takes, the socket does not need it
+    from btagslib.db.query import TagQuery, TagQueryError
+    try:
+        query = TagQuery(nb.database_file)
+    except TagQueryError as e:
+        parser.error(str(e))
+    if nb.build_substring_index:
+        try:
+            query.build_substring_index()
+        except TagQueryError as e:
+            parser.error(str(e))
+        if nb.name is None:
+            query.close()
+            return
+    matches = query.find(
+        nb.name, prefix=nb.prefix, ignore_case=nb.ignore_case, substring=nb.substring,
+        types=nb.kind, file=nb.file, compile_unit=compile_unit, limit=nb.limit
+    )
+    if nb.members or nb.children:
+        matches = [
+            child for match in matches
+            for child in (query.members(match.id) if nb.members else query.children(match.id))
+        ]
+    query.close()
+    write_matches(matches, nb.json)
+
+
+def find_with_server(nb, compile_unit):
+    """
+    The lookup of main, answered by a LookupServer
+    """
+    client = LookupClient(nb.socket)
+    try:
+        def request(op, **arguments):
+            response = client.request(op, **arguments)
+            if not response['ok']:
+                raise LookupServerError(response['error'])
+            return [TagMatch(**dict((field, tag[field]) for field in TagMatch._fields)) for tag in response['tags']]
+        matches = request(
+            'find', name=nb.name, prefix=nb.prefix, ignore_case=nb.ignore_case, substring=nb.substring,
+            types=nb.kind, file=nb.file, compile_unit=compile_unit, limit=nb.limit
+        )
+        if nb.members or nb.children:
+            matches = [
+                child for match in matches
+                for child in request('members' if nb.members else 'children', tag_id=match.id)
+            ]
+    finally:
+        client.close()
+    return matches
+
+
+def write_matches(matches, as_json):
+    for match in matches:
+        if as_json:
+            sys.stdout.write(json.dumps(match_to_dict(match), sort_keys=True) + '\n')
+        else:
+            sys.stdout.write(format_match(match) + '\n')
+    if len(matches) == 0:
+        exit(1)
@@ -0,0 +1,45 @@
+import os
+import sys
+import signal
+from btagslib.db.connection import connect
+from btagslib.server.daemon import LookupServer, LookupServerError
+import argparse as ap
+
+
+def main(argv=None):
+    parser = ap.ArgumentParser(
+        prog='btags serve',
+        description='Keep the tags of a tag info database in memory and answer lookups on a Unix socket.',
+    )
+    parser. \
+        add_argument('-d', '--database-file', default='{}/tag.sqlite'.format(os.getcwd()),
+                     help='The tag info database to serve')
+    parser. \
+        add_argument('-S', '--socket', help='Path of the Unix socket, default is the database path with .sock')
+    parser. \
+        add_argument('--reload-interval', help='Seconds between two checks whether the database changed',
+                     default=1.0, type=float)
+
+    nb = parser.parse_args(argv)
+    db_path = os.path.abspath(nb.database_file)
+    socket_path = nb.socket if nb.socket is not None else db_path + '.sock'
+    if not os.path.exists(db_path):
+        parser.error('Database {} does not exist'.format(db_path))
+
+    # databases of older versions are migrated before they are loaded
+    connect(db_path).close()
+    try:
+        server = LookupServer(socket_path, db_path, nb.reload_interval)
+    except LookupServerError as e:
+        parser.error(str(e))
+    sys.stderr.write('Serving {} tags of {} on {}\n'.format(len(server.get_index()), db_path, socket_path))
+    sys.stderr.flush()
+    server.start_watching()
+    # the socket is removed on termination as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,53 @@
+from os.path import join, exists, expanduser
+import tempfile
+import shutil
+import os
+
+
+class IndexCacheError(Exception):
+    pass
+
+
+class IndexCache:
+    """
+    A directory of tag info databases named after the binary they were parsed from,
+    so an artifact which has been indexed once does not need to be parsed again.
+
+    The key of a binary is given by the debug info task generator, e.g. the
+    ELF build-id, see DwarfParseTaskGenerator.get_binary_id.
+    """
+    # bump this whenever the database schema or the parsed content changes
+    FORMAT_VERSION = 10
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = join(os.environ.get('XDG_CACHE_HOME', expanduser('~/.cache')), 'btags')
+        self._cache_dir = cache_dir
+
+    def _get_path(self, binary_id):
+        if binary_id is None or len(binary_id) == 0:
+            raise IndexCacheError("Binary id should not be empty")
+        return join(self._cache_dir, 'v{}-{}.sqlite'.format(self.FORMAT_VERSION, binary_id))
+
+    def lookup(self, binary_id):
+        """
+        :return: path of the cached database, None if the binary has not been indexed
+        """
+        path = self._get_path(binary_id)
+        return path if exists(path) else None
+
+    def store(self, binary_id, db_path):
+        """
+        Copy a complete database into the cache, the copy becomes visible atomically
+        so concurrent btags runs never see a half written one.
+        """
+        os.makedirs(self._cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(db_path, tmp_path)
+            os.replace(tmp_path, self._get_path(binary_id))
+        except:
+            os.remove(tmp_path)
+            raise
+        return self._get_path(binary_id)
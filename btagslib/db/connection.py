@@ -0,0 +1,40 @@
+import sqlite3
+
+
+# kept in PRAGMA user_version by Database, bump it whenever the schema changes
+SCHEMA_VERSION = 3
+
+
+def get_schema_version(connection):
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def connect(db_path):
+    """
+    A plain sqlite3 connection to a tag info database, for the readers which should not
+    pay for importing SQLAlchemy, it takes longer than a lookup.
+    Databases of older versions are migrated by Database first.
+    :rtype: sqlite3.Connection
+    """
+    connection = sqlite3.connect(db_path)
+    if get_schema_version(connection) < SCHEMA_VERSION:
+        connection.close()
+        from .operation import Database
+        Database(db_path).close()
+        connection = sqlite3.connect(db_path)
+    return connection
+
+
+def is_complete(connection):
+    """
+    :return: False if the run filling the database was interrupted, it can be resumed, see Operation.add_binary
+    """
+    try:
+        return connection.execute('SELECT count(*) FROM "Binary" WHERE done IS NULL').fetchone()[0] == 0
+    except sqlite3.OperationalError:
+        # older versions did not record the binaries
+        return True
+
+
+def is_intact(connection):
+    return connection.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
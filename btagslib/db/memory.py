@@ -0,0 +1,256 @@
+from os.path import basename, dirname, normpath
+from collections import defaultdict
+from threading import Lock
+from .record import TagRecord, FileRecord
+
+
+class TagRecordStore:
+    """
+    Files and tags of the binaries kept in memory rather than in a database, for
+    generating a tag file straight from the debug info.
+
+    The tasks fill it through MemoryOperation, the tag file writers read
+    it through TagRecordView.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._file_id_counter = 0
+        self._tag_id_counter = 0
+        self._compile_unit_id_counter = 0
+        # (file name, directory, directory relative to the compile directory) -> id, like Operation.file_ids
+        self._file_ids = dict()
+        self.files = dict()
+        self.tags = list()
+        self._tags_by_id = None
+        self._assoc_from = None
+
+    def get_file_id(self, key):
+        """
+        :return: (id of the file, whether it is new)
+        """
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id is not None:
+                return file_id, False
+            self._file_id_counter += 1
+            self._file_ids[key] = self._file_id_counter
+            return self._file_id_counter, True
+
+    def new_compile_unit_ids(self, count):
+        with self._lock:
+            first = self._compile_unit_id_counter
+            self._compile_unit_id_counter += count
+            return first
+
+    def new_tag_id_block(self, size):
+        """
+        :return: the first id of *size* consecutive tag ids
+        """
+        with self._lock:
+            first = self._tag_id_counter + 1
+            self._tag_id_counter += size
+            return first
+
+    def add(self, files, tags):
+        """
+        :type files: list[FileRecord]
+        :type tags: list[TagRecord]
+        """
+        with self._lock:
+            for file in files:
+                self.files[file.id] = file
+            self.tags.extend(tags)
+            self._tags_by_id = None
+            self._assoc_from = None
+
+    def snapshot(self):
+        """
+        :return: a TagRecordStore of the files and tags committed so far, which the tasks do not change,
+                 e.g. for generating a partial tag file meanwhile
+        """
+        store = TagRecordStore()
+        with self._lock:
+            store.files = dict(self.files)
+            store.tags = list(self.tags)
+        return store
+
+    def remove_compile_units(self, compile_unit_ids):
+        """
+        Drops the tags of the compile units, e.g. parsed again from a binary linked again
+        """
+        compile_unit_ids = set(compile_unit_ids)
+        if len(compile_unit_ids) == 0:
+            return
+        with self._lock:
+            self.tags = [tag for tag in self.tags if tag.compile_unit_id not in compile_unit_ids]
+            self._tags_by_id = None
+            self._assoc_from = None
+
+    def _build_index(self):
+        with self._lock:
+            if self._tags_by_id is None:
+                self._tags_by_id = dict((tag.id, tag) for tag in self.tags)
+                self._assoc_from = None
+            if self._assoc_from is None:
+                self._assoc_from = defaultdict(list)
+                for tag in self.tags:
+                    if tag.assoc_to_tag_id is not None:
+                        self._assoc_from[tag.assoc_to_tag_id].append(tag.id)
+
+    def set_assoc_to_tags(self, tag_id_assoc_id_pairs):
+        self._build_index()
+        with self._lock:
+            for tag_id, assoc_id in tag_id_assoc_id_pairs:
+                self._tags_by_id[tag_id].assoc_to_tag_id = assoc_id
+            self._assoc_from = None
+
+    def get_tag(self, tag_id):
+        """
+        :rtype: TagRecord
+        """
+        if tag_id is None:
+            return None
+        if self._tags_by_id is None:
+            self._build_index()
+        return self._tags_by_id.get(tag_id)
+
+    def get_assoc_from_ids(self, tag_id):
+        """
+        :return: ids of the tags associated to the tag
+        """
+        if self._assoc_from is None:
+            self._build_index()
+        return self._assoc_from.get(tag_id, [])
+
+    def get_file(self, file_id):
+        """
+        :rtype: FileRecord
+        """
+        return self.files.get(file_id) if file_id is not None else None
+
+
+class TagRecordView:
+    """
+    Looks like an ORM Tag to the tag file writers, but reads a TagRecord of a TagRecordStore.
+    """
+    __slots__ = ['_record', '_store', 'type']
+
+    def __init__(self, record: TagRecord, store: TagRecordStore):
+        self._record = record
+        self._store = store
+        self.type = record.type
+
+    @property
+    def id(self):
+        return self._record.id
+
+    @property
+    def name(self):
+        return self._record.name
+
+    @property
+    def line_no(self):
+        return self._record.line_no
+
+    @property
+    def scope(self):
+        return self._record.scope
+
+    @property
+    def scope_type(self):
+        return self._record.scope_type
+
+    @property
+    def file(self):
+        return self._store.get_file(self._record.file_id)
+
+    @property
+    def parent_tag(self):
+        return self._get_view(self._record.parent_tag_id)
+
+    @property
+    def assoc_to_tag(self):
+        return self._get_view(self._record.assoc_to_tag_id)
+
+    @property
+    def assoc_from_tags(self):
+        return [self._get_view(tag_id) for tag_id in self._store.get_assoc_from_ids(self._record.id)]
+
+    def _get_view(self, tag_id):
+        record = self._store.get_tag(tag_id)
+        return TagRecordView(record, self._store) if record is not None else None
+
+
+class MemoryOperation:
+    """
+    Has the interface of Operation used by the parse tasks, but stores into
+    a TagRecordStore. Like Operation, nothing is visible before commit.
+    """
+    TAG_ID_BLOCK = 4096
+
+    def __init__(self, store: TagRecordStore):
+        self._store = store
+        self._files = []
+        self._tags = []
+        self._assocs = []
+        self._next_tag_id = 0
+        self._tag_id_end = 0
+
+    def add_binary(self, path, stamp):
+        # nothing to resume, the store lives as long as the run
+        return None, dict()
+
+    def set_binary_done(self, binary_id):
+        pass
+
+    def set_macros_done(self, compile_unit_ids):
+        pass
+
+    def add_compilation_unit(self, comp_dir, comp_file, index, binary_id=None, offset=None):
+        # the tags already refer to their compile unit by index, nothing reads it back
+        return None
+
+    def new_compile_unit_ids(self, count):
+        return self._store.new_compile_unit_ids(count)
+
+    def new_tag_id(self):
+        if self._next_tag_id == self._tag_id_end:
+            self._next_tag_id = self._store.new_tag_id_block(MemoryOperation.TAG_ID_BLOCK)
+            self._tag_id_end = self._next_tag_id + MemoryOperation.TAG_ID_BLOCK
+        tag_id = self._next_tag_id
+        self._next_tag_id += 1
+        return tag_id
+
+    def get_stored_tag_id(self, tag_id):
+        # the ids are final once handed out, the store keeps the duplicates
+        return tag_id
+
+    def add_tag_records(self, records):
+        """
+        :type records: list[TagRecord]
+        """
+        self._tags.extend(records)
+
+    def set_assoc_to_tags(self, tag_id_assoc_id_pairs):
+        self._assocs.extend(tag_id_assoc_id_pairs)
+
+    def add_file(self, filename, dir_reltocompdir):
+        path = normpath("{}/{}".format(dir_reltocompdir, filename))
+        key = (basename(path), dirname(path), dir_reltocompdir)
+        file_id, is_new = self._store.get_file_id(key)
+        file = FileRecord(file_id, *key)
+        if is_new:
+            self._files.append(file)
+        return file
+
+    def commit(self):
+        if len(self._files) != 0 or len(self._tags) != 0:
+            self._store.add(self._files, self._tags)
+            self._files = []
+            self._tags = []
+        if len(self._assocs) != 0:
+            self._store.set_assoc_to_tags(self._assocs)
+            self._assocs = []
+
+    def close(self):
+        pass
@@ -1,6 +1,8 @@
 from sqlalchemy import *
 from sqlalchemy.orm import *
 from sqlalchemy.ext.declarative import declared_attr, declarative_base
+from sqlalchemy.ext.associationproxy import association_proxy
+from .record import TagType
 
 
 class Model(object):
@@ -19,11 +21,28 @@ class File(Base):
     file_dir_rel_to_comp_dir = Column(Text, nullable=False)
 
 
+class Binary(Base):
+    """
+    A binary indexed into the database, done once its compile units, macros and type references all are,
+    an interrupted run is resumed after the compile units committed, see Operation.add_binary
+    """
+    id = Column(Integer, primary_key=True)
+    path = Column(Text, nullable=False)
+    # build-id, or size and modification time, tells whether the binary has changed since
+    stamp = Column(Text, nullable=False)
+    done = Column(Boolean, nullable=True)
+
+
 class CompileUnit(Base):
     id = Column(Integer, Sequence('compile_unit_seq'), primary_key=True)
     comp_dir = Column(String, nullable=False)
     comp_file = Column(String, nullable=False)
     object_name = Column(Text, nullable=False)
+    binary_id = Column(Integer, ForeignKey('Binary.id'), nullable=True)
+    # in .debug_info, the compile unit is committed with its tags, so it is complete if it is there
+    offset = Column(Integer, nullable=True)
+    # the macros are committed apart from the other tags
+    macros_done = Column(Boolean, nullable=True)
 
 
 class CompileUnitFile(Base):
@@ -32,38 +51,55 @@ class CompileUnitFile(Base):
     file_id = Column(Integer, ForeignKey('File.id'), nullable=False)
 
 
-class TagType:
-    Variable = 1
-    Function = 2
-    EnumerationMember = 3
-    Macro = 4
-    Structure = 5
-    Class = 6
-    Union = 7
-    Typedef = 8
-    Type = 9
-    Enumeration = 10
-    Member = 11
-    BaseType = 12
-    FormalParameter = 13
+class Name(Base):
+    """
+    Every distinct tag name and scope once, tags refer to them by id
+    """
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+# case insensitive lookups, SQLite only folds ASCII letters
+Index('ix_name_name_nocase', collate(Name.__table__.c.name, 'NOCASE'))
 
 
 class Tag(Base):
     id = Column(Integer, Sequence('fild_id_seq'), primary_key=True)
-    name = Column(String, nullable=False)
+    name_id = Column(Integer, ForeignKey('Name.id'), nullable=False)
     file_id = Column(Integer, ForeignKey('File.id'), nullable=True)
     compile_unit_id = Column(Integer, ForeignKey('CompileUnit.id'), nullable=True)
     line_no = Column(Integer, nullable=True)
     column_no = Column(Integer, nullable=True)
     parent_tag_id = Column(Integer, ForeignKey('Tag.id'), nullable=True)
     assoc_to_tag_id = Column(Integer, ForeignKey('Tag.id'), nullable=True)
-    type = Column(String, nullable=True)
-
+    # one of TagType
+    type = Column(Integer, nullable=True)
+    # qualified name of the enclosing scopes, namespaces included, e.g. ns::outer
+    scope_id = Column(Integer, ForeignKey('Name.id'), nullable=True)
+    # TagType of the enclosing type or function when it is not the parent tag, see TagRecord
+    scope_type = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index('ix_tag_name_file_line', 'name_id', 'file_id', 'line_no'),
+        # members of a struct, parameters of a function...
+        Index('ix_tag_parent_tag', 'parent_tag_id'),
+        Index('ix_tag_assoc_to_tag', 'assoc_to_tag_id'),
+    )
+
+    name_item = relation("Name", foreign_keys=[name_id])
+    name = association_proxy('name_item', 'name')
+    scope_item = relation("Name", foreign_keys=[scope_id])
+    scope = association_proxy('scope_item', 'name')
     compile_unit = relation("CompileUnit", backref="tags")
     file = relation("File", backref="tags")
     parent_tag = relation("Tag", backref=backref("children_tags"), foreign_keys=[parent_tag_id], remote_side=[id])
     assoc_to_tag = relation("Tag", backref=backref("assoc_from_tags"), foreign_keys=[assoc_to_tag_id], remote_side=[id])
 
-    def __init__(self,*args):
-        self.tmp_assoc_to_tag = None
-        super().__init__(*args)
+
+class TagCompileUnit(Base):
+    """
+    The other compile units of a tag stored once for all the compile units declaring it, e.g. in a header they
+    include, Tag.compile_unit_id is the one committed first, see Operation._merge_duplicates
+    """
+    tag_id = Column(Integer, ForeignKey('Tag.id'), primary_key=True)
+    compile_unit_id = Column(Integer, ForeignKey('CompileUnit.id'), primary_key=True)
@@ -3,63 +3,424 @@ import os
 from threading import Lock
 from sqlalchemy import event
 from .model import *
+from .record import TagRecord, FileRecord
+from .connection import SCHEMA_VERSION
 
 
-class Operation:
-    engine = None
-    file_id_counter = 0
-    file_id_lock = Lock()
-    @classmethod
-    def prepare(cls, db_path):
-        if cls.engine is None:
-            cls.engine = create_engine('sqlite:///' + db_path, echo=False, connect_args={'timeout': 3600})
-            if db_path == ':memory:' or not os.path.exists(db_path):
-                Base.metadata.create_all(cls.engine)
-        event.listen(cls.engine, 'connect', Operation._set_no_synchronous)
+class BinaryChangedError(Exception):
+    pass
+
+
+class Database:
+    """
+    A tag info database with what all the operations on it share: the engine, the id allocators,
+    and the names, files and tags stored so far. Nothing is shared between two of them, so several
+    databases can be filled in one process, e.g. by Indexers of different binaries.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.engine = create_engine('sqlite:///' + db_path, echo=False, connect_args={'timeout': 3600})
+        event.listen(self.engine, 'connect', Database._set_no_synchronous)
+        self.file_id_counter = 0
+        self.file_id_lock = Lock()
+        # the tag ids are allocated on commit, with the name id lock held
+        self.tag_id_counter = 0
+        # name -> id of table Name
+        self.name_ids = dict()
+        self.name_id_counter = 0
+        self.name_id_lock = Lock()
+        # (file name, directory, directory relative to the compile directory) -> id of table File, files are
+        # stored once however many compile units and binaries include them
+        self.file_ids = dict()
+        # ids of the files in table File, the others are inserted by every operation referring to them
+        self.committed_file_ids = set()
+        self.compile_unit_id_counter = 0
+        self.compile_unit_id_lock = Lock()
+        if db_path == ':memory:' or not os.path.exists(db_path):
+            Base.metadata.create_all(self.engine)
+        else:
+            self._migrate_name_table()
+            # the tables added since, e.g. Binary
+            Base.metadata.create_all(self.engine)
+            self._add_missing_columns()
+            self._add_missing_indexes()
+            self._init_id_counters()
+        # lets the readers tell without SQLAlchemy whether the schema is up to date
+        self.engine.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    def checkpoint(self):
+        """
+        Move the commits from the write-ahead log into the database file, before it is copied
+        """
+        self.engine.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self):
+        self.engine.dispose()
+
+    def _migrate_name_table(self):
+        """
+        Databases written by older versions keep the names and scopes in table Tag and the tag types as strings,
+        move the names to table Name and rebuild table Tag, SQLite cannot change the type of a column.
+        """
+        inspector = inspect(self.engine)
+        old_columns = set(column['name'] for column in inspector.get_columns('Tag'))
+        if 'name_id' in old_columns:
+            return
+        has_scope = 'scope' in old_columns
+        with self.engine.begin() as connection:
+            # the journal is off, an interrupted migration may have left it behind
+            Name.__table__.drop(connection, checkfirst=True)
+            Name.__table__.create(connection)
+            connection.execute(
+                'INSERT INTO "Name" (name) SELECT DISTINCT name FROM "Tag" {}'.format(
+                    'UNION SELECT scope FROM "Tag" WHERE scope IS NOT NULL' if has_scope else ''
+                )
+            )
+            connection.execute('ALTER TABLE "Tag" RENAME TO "Tag_old"')
+            Tag.__table__.create(connection)
+            connection.execute(
+                'INSERT INTO "Tag" (id, name_id, file_id, compile_unit_id, line_no, column_no, '
+                'parent_tag_id, assoc_to_tag_id, type, scope_id) '
+                'SELECT t.id, n.id, t.file_id, t.compile_unit_id, t.line_no, t.column_no, '
+                't.parent_tag_id, t.assoc_to_tag_id, CAST(t.type AS INTEGER), {} '
+                'FROM "Tag_old" t JOIN "Name" n ON n.name = t.name {}'.format(
+                    's.id' if has_scope else 'NULL',
+                    'LEFT JOIN "Name" s ON s.name = t.scope' if has_scope else ''
+                )
+            )
+            connection.execute('DROP TABLE "Tag_old"')
+        self.engine.execute('VACUUM')
+
+    def _add_missing_columns(self):
+        """
+        Databases written by older versions lack the columns added since, they are all nullable.
+        """
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set(column['name'] for column in inspector.get_columns(table.name))
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    self.engine.execute('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(
+                        table.name, column.name, column.type.compile(self.engine.dialect)
+                    ))
+
+    def _add_missing_indexes(self):
+        """
+        Indexes added since the database was written are built when it is opened
+        """
+        inspector = inspect(self.engine)
+        for table in Base.metadata.sorted_tables:
+            existing = set(index['name'] for index in inspector.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(self.engine)
+
+    def _init_id_counters(self):
+        """
+        Ids are allocated here rather than by the database, continue after the existing ones
+        """
+        self.file_id_counter = self.engine.execute('SELECT coalesce(max(id), 0) FROM File').scalar()
+        self.tag_id_counter = self.engine.execute('SELECT coalesce(max(id), 0) FROM Tag').scalar()
+        self.name_ids = dict((name, name_id) for name_id, name in self.engine.execute('SELECT id, name FROM Name'))
+        self.name_id_counter = max(self.name_ids.values()) if len(self.name_ids) != 0 else 0
+        self.file_ids = dict(
+            ((file_name, file_directory, file_dir_rel_to_comp_dir), file_id)
+            for file_id, file_name, file_directory, file_dir_rel_to_comp_dir in
+            self.engine.execute('SELECT id, file_name, file_directory, file_dir_rel_to_comp_dir FROM File')
+        )
+        self.committed_file_ids = set(self.file_ids.values())
+        self.compile_unit_id_counter = \
+            self.engine.execute('SELECT coalesce(max(id) + 1, 0) FROM CompileUnit').scalar()
 
     @staticmethod
     def _set_no_synchronous(dbapi_con, con_record):
         dbapi_con.execute('PRAGMA synchronous=OFF')
-        dbapi_con.execute('PRAGMA journal_mode=OFF')
+        # unlike without journal, a run killed while committing leaves the database as of the last commit,
+        # and it can be resumed from there
+        dbapi_con.execute('PRAGMA journal_mode=WAL')
         dbapi_con.execute('PRAGMA temp_store=MEMORY')
 
-    def __init__(self):
-        self._scoped_session = scoped_session(sessionmaker(bind=self.engine))
+
+class Operation:
+    # the Database of the operations created without one, see prepare
+    database = None
+
+    @classmethod
+    def prepare(cls, db_path):
+        """
+        Opens the database the operations created without one work on, unless it is open already
+        :rtype: Database
+        """
+        if cls.database is None or cls.database.db_path != db_path:
+            cls.database = Database(db_path)
+        return cls.database
+
+    @classmethod
+    def checkpoint(cls):
+        cls.database.checkpoint()
+
+    def __init__(self, database: Database = None):
+        """
+        :param database: the database stored into, the one opened by prepare if None
+        """
+        self._database = database if database is not None else Operation.database
+        self._scoped_session = scoped_session(sessionmaker(bind=self._database.engine))
         self._session = self._scoped_session()
-        self._file = None
+        self._files = []
         self._tags = []
+        self._tag_id_counter = 0
+        # provisional id -> stored id of the tags of the last commit, see get_stored_tag_id
+        self._stored_tag_ids = dict()
+
+    def add_binary(self, path, stamp):
+        """
+        Committed at once, the binary is done when TypeReferenceResolveTask commits, see set_binary_done
+        :param stamp: tells whether the binary has changed since it was added
+        :return: (id of the Binary, compile unit offset -> (id, whether its macros are committed) of the compile
+                 units committed by an interrupted run), the latter is None if the binary is in the database already
+        """
+        for binary_id, binary_stamp, done in self._session.execute(
+                'SELECT id, stamp, done FROM "Binary" WHERE path = :path', dict(path=path)
+        ):
+            if binary_stamp != stamp:
+                raise BinaryChangedError("{} has changed since it was indexed".format(path))
+            if done:
+                return binary_id, None
+            return binary_id, dict(
+                (offset, (cu_id, bool(macros_done))) for offset, cu_id, macros_done in self._session.execute(
+                    'SELECT "offset", id, macros_done FROM CompileUnit WHERE binary_id = :binary_id',
+                    dict(binary_id=binary_id)
+                )
+            )
+        binary_id = self._session.execute(
+            Binary.__table__.insert(), dict(path=path, stamp=stamp)
+        ).inserted_primary_key[0]
+        self._session.commit()
+        return binary_id, dict()
+
+    def set_binary_done(self, binary_id):
+        self._session.execute(
+            Binary.__table__.update().where(Binary.__table__.c.id == binary_id).values(done=True)
+        )
 
-    def add_compilation_unit(self, comp_dir, comp_file, index):
+    def set_macros_done(self, compile_unit_ids):
+        """
+        :param compile_unit_ids: of the compile units whose macros are committed with the flag
+        """
+        self._session.execute(
+            CompileUnit.__table__.update().where(CompileUnit.__table__.c.id == bindparam('cu_id')).
+            values(macros_done=True),
+            [dict(cu_id=cu_id) for cu_id in compile_unit_ids]
+        )
+
+    def add_compilation_unit(self, comp_dir, comp_file, index, binary_id=None, offset=None):
+        """
+        Committed with the tags of the compile unit, it is done if it is in the database
+        """
         cu = CompileUnit()
         path = normpath(comp_dir.strip() + os.path.sep + comp_file.strip())
         cu.comp_dir = comp_dir
         cu.comp_file = comp_file
         cu.object_name = path
         cu.id = index
+        cu.binary_id = binary_id
+        cu.offset = offset
         self._session.add(cu)
         return cu
 
-    def add_tag(self, tag):
-        self._session.add(tag)
-        return tag
+    def new_compile_unit_ids(self, count):
+        """
+        :return: the first of *count* consecutive compile unit ids
+        """
+        with self._database.compile_unit_id_lock:
+            first = self._database.compile_unit_id_counter
+            self._database.compile_unit_id_counter += count
+            return first
+
+    def new_tag_id(self):
+        """
+        The tags refer to each other by id before they are stored, the ids handed out here are provisional
+        and unique within the operation only. Commit replaces them with ids of table Tag, allocated densely
+        to the tags actually stored, see get_stored_tag_id.
+        """
+        self._tag_id_counter += 1
+        return self._tag_id_counter
+
+    def get_stored_tag_id(self, tag_id):
+        """
+        :param tag_id: provisional id of a tag of the last commit, see new_tag_id
+        :return: id of the tag in table Tag, the one of the tag stored before if it was dropped as a duplicate
+        """
+        return self._stored_tag_ids[tag_id]
+
+    def add_tag_records(self, records):
+        """
+        :type records: list[TagRecord]
+        The records are only turned into rows on commit, and inserted without the ORM.
+        """
+        self._tags.extend(records)
+
+    def set_assoc_to_tags(self, tag_id_assoc_id_pairs):
+        """
+        :param tag_id_assoc_id_pairs: list of (tag id, id of the tag it is associated to), ids of stored tags
+        """
+        self._session.execute(
+            Tag.__table__.update().where(Tag.__table__.c.id == bindparam('tag_id')).
+            values(assoc_to_tag_id=bindparam('assoc_id')),
+            [dict(tag_id=tag_id, assoc_id=assoc_id) for tag_id, assoc_id in tag_id_assoc_id_pairs]
+        )
 
     def add_file(self, filename, dir_reltocompdir):
-        file = File()
+        """
+        The file is inserted on commit unless it is in table File already, by every operation referring to it,
+        so no tag refers to a file of a compile unit which is not committed
+        :rtype: FileRecord
+        """
         file_path = "{}/{}".format(dir_reltocompdir, filename)
         path = normpath(file_path)
-        with Operation.file_id_lock:
-            Operation.file_id_counter += 1
-            file.id = Operation.file_id_counter
-        file.file_name = basename(path)
-        file.file_directory = dirname(path)
-        file.file_dir_rel_to_comp_dir = dir_reltocompdir
-        self._session.add(file)
+        key = (basename(path), dirname(path), dir_reltocompdir)
+        with self._database.file_id_lock:
+            file_id = self._database.file_ids.get(key)
+            if file_id is None:
+                self._database.file_id_counter += 1
+                file_id = self._database.file_id_counter
+                self._database.file_ids[key] = file_id
+        file = FileRecord(file_id, *key)
+        self._files.append(file)
         return file
 
+    def _get_name_id(self, name, new_names):
+        """
+        Called with the name id lock held, a name not in table Name yet gets an id and is added to *new_names*
+        """
+        name_id = self._database.name_ids.get(name)
+        if name_id is None:
+            self._database.name_id_counter += 1
+            name_id = self._database.name_id_counter
+            self._database.name_ids[name] = name_id
+            new_names.append(dict(id=name_id, name=name))
+        return name_id
+
+    def _get_name_ids(self, records):
+        """
+        Called with the name id lock held
+        :return: (name id, scope id) of every record, and the rows of the names which are not in table Name yet
+        """
+        name_ids = list()
+        new_names = list()
+        for record in records:
+            name_ids.append((
+                self._get_name_id(record.name, new_names),
+                self._get_name_id(record.scope, new_names) if record.scope is not None else None
+            ))
+        return name_ids, new_names
+
+    def _merge_duplicates(self, records, name_ids):
+        """
+        A tag stored before, by another compile unit or binary including the same header, is dropped,
+        and the tags referring to it refer to the stored one instead. The others get the next tag ids,
+        so the ids of table Tag have no gaps. Called with the name id lock held.
+        :return: the records which are not stored yet and their (name id, scope id), and the rows of
+                 table TagCompileUnit linking the stored tags to the compile units of their duplicates
+        """
+        keys = [
+            (name_id, record.type, record.file_id, record.line_no, scope_id)
+            for record, (name_id, scope_id) in zip(records, name_ids)
+        ]
+        # (name id, type, file id, line, scope id) -> (id, compile unit id) of the stored tag, of this commit only
+        tag_keys = self._find_stored_tags(keys)
+        stored_ids = dict()
+        new_records = list()
+        new_name_ids = list()
+        compile_unit_links = set()
+        for record, name_scope_ids, key in zip(records, name_ids, keys):
+            stored = tag_keys.get(key)
+            if stored is None:
+                self._database.tag_id_counter += 1
+                stored = tag_keys[key] = (self._database.tag_id_counter, record.compile_unit_id)
+                new_records.append(record)
+                new_name_ids.append(name_scope_ids)
+            elif record.compile_unit_id is not None and record.compile_unit_id != stored[1]:
+                # so the lookups filtered by compile unit find the tag for this one as well
+                compile_unit_links.add((stored[0], record.compile_unit_id))
+            stored_ids[record.id] = stored[0]
+        # the parents and associated tags are of the same commit, a typedef may be associated to a tag after it
+        for record in new_records:
+            record.id = stored_ids[record.id]
+            if record.parent_tag_id is not None:
+                record.parent_tag_id = stored_ids[record.parent_tag_id]
+            if record.assoc_to_tag_id is not None:
+                record.assoc_to_tag_id = stored_ids[record.assoc_to_tag_id]
+        self._stored_tag_ids = stored_ids
+        return new_records, new_name_ids, [
+            dict(tag_id=tag_id, compile_unit_id=compile_unit_id) for tag_id, compile_unit_id in compile_unit_links
+        ]
+
+    def _find_stored_tags(self, keys):
+        """
+        The keys are looked up in table Tag, by its index of names, files and lines, rather than in a dict
+        of the keys of all tags stored, which would grow with the run. Called with the name id lock held.
+        :param keys: list of (name id, type, file id, line, scope id)
+        :return: dict of the keys of tags stored -> (id, compile unit id) of the stored tag
+        """
+        self._session.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS TagKey (position INTEGER PRIMARY KEY, name_id INTEGER, type INTEGER, '
+            'file_id INTEGER, line_no INTEGER, scope_id INTEGER)'
+        )
+        unique_keys = list(set(keys))
+        self._session.execute(
+            'INSERT INTO TagKey VALUES (:position, :name_id, :type, :file_id, :line_no, :scope_id)',
+            [
+                dict(position=position, name_id=name_id, type=tag_type, file_id=file_id, line_no=line_no,
+                     scope_id=scope_id)
+                for position, (name_id, tag_type, file_id, line_no, scope_id) in enumerate(unique_keys)
+            ]
+        )
+        # the tags without file, line or scope are duplicates too, hence IS rather than =,
+        # the compile unit taken is the one of the row of the least id
+        stored = dict(
+            (unique_keys[position], (tag_id, compile_unit_id)) for position, tag_id, compile_unit_id in
+            self._session.execute(
+                'SELECT k.position, min(t.id), t.compile_unit_id FROM TagKey k JOIN Tag t ON t.name_id = k.name_id '
+                'AND t.file_id IS k.file_id AND t.line_no IS k.line_no AND t.type = k.type '
+                'AND t.scope_id IS k.scope_id GROUP BY k.position'
+            )
+        )
+        self._session.execute('DELETE FROM TagKey')
+        return stored
+
     def commit(self):
-        self._session.commit()
+        # the names and tags of the other operations are merged into under the lock, it is held till they are
+        # committed, a run interrupted after any commit is resumed with no reference to a row not committed
+        with self._database.name_id_lock:
+            if len(self._tags) != 0:
+                name_ids, new_names = self._get_name_ids(self._tags)
+                records, name_ids, compile_unit_links = self._merge_duplicates(self._tags, name_ids)
+                if len(new_names) != 0:
+                    self._session.execute(Name.__table__.insert(), new_names)
+                if len(records) != 0:
+                    self._session.execute(
+                        Tag.__table__.insert(),
+                        [record.to_row(name_id, scope_id) for record, (name_id, scope_id) in zip(records, name_ids)]
+                    )
+                if len(compile_unit_links) != 0:
+                    self._session.execute(
+                        TagCompileUnit.__table__.insert().prefix_with('OR IGNORE'), compile_unit_links
+                    )
+                self._tags = []
+            files = [file for file in self._files if file.id not in self._database.committed_file_ids]
+            if len(files) != 0:
+                self._session.execute(
+                    File.__table__.insert().prefix_with('OR IGNORE'), [file._asdict() for file in files]
+                )
+            self._files = []
+            self._session.commit()
+            self._database.committed_file_ids.update(file.id for file in files)
 
     def close(self):
+        # tasks are constructed in the generator thread but run in a worker,
+        # so the session is not necessarily the one registered for this thread
+        self._session.close()
         self._scoped_session.remove()
 
     def session(self):
@@ -0,0 +1,170 @@
+from os.path import basename, normpath
+import sqlite3
+import os
+from .connection import connect
+from .record import TagMatch, TAG_TYPE_NAMES, MEMBER_TYPES, match_to_dict, fold_case
+
+
+class TagQueryError(Exception):
+    pass
+
+
+class TagQuery:
+    """
+    Looks tags up in a tag info database through its indexes, without scanning table Tag.
+
+    Names are matched in table Name, which has one row per distinct name, then
+    the tags of the matched names are found by index ix_tag_name_file_line.
+    """
+    # FTS5 trigram index of table Name, see build_substring_index
+    SUBSTRING_INDEX = 'NameTrigram'
+
+    def __init__(self, db_path):
+        if not os.path.exists(db_path):
+            raise TagQueryError("Database {} does not exist".format(db_path))
+        # plain sqlite3, a lookup takes less time than importing SQLAlchemy
+        self._connection = connect(db_path)
+        self._has_substring_index = self._connection.execute(
+            'SELECT count(*) FROM sqlite_master WHERE type = \'table\' AND name = ?', (self.SUBSTRING_INDEX,)
+        ).fetchone()[0] != 0
+
+    def close(self):
+        self._connection.close()
+
+    def build_substring_index(self):
+        """
+        Index the names by trigram, so substring lookups of 3 characters or more do not scan table Name.
+        A trigger keeps the index up to date with the names added later. Needs SQLite 3.34 built with FTS5.
+        """
+        try:
+            self._connection.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS "{0}" USING '
+                'fts5(name, content=\'Name\', content_rowid=\'id\', tokenize=\'trigram\')'.format(self.SUBSTRING_INDEX)
+            )
+        except sqlite3.OperationalError as e:
+            raise TagQueryError("SQLite cannot build the substring index: {}".format(e))
+        self._connection.execute('INSERT INTO "{0}" ("{0}") VALUES (\'rebuild\')'.format(self.SUBSTRING_INDEX))
+        self._connection.execute(
+            'CREATE TRIGGER IF NOT EXISTS "{0}_insert" AFTER INSERT ON "Name" BEGIN '
+            'INSERT INTO "{0}" (rowid, name) VALUES (new.id, new.name); END'.format(self.SUBSTRING_INDEX)
+        )
+        self._connection.commit()
+        self._has_substring_index = True
+
+    @staticmethod
+    def _get_prefix_end(prefix):
+        """
+        :return: the smallest string greater than every string starting with *prefix*
+        """
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    SELECT_TAGS = (
+        'SELECT t.id, n.name, t.type, s.name, f.file_directory, f.file_name, t.line_no, t.compile_unit_id, '
+        't.parent_tag_id, t.assoc_to_tag_id FROM "Tag" t JOIN "Name" n ON t.name_id = n.id '
+        'LEFT OUTER JOIN "Name" s ON t.scope_id = s.id LEFT OUTER JOIN "File" f ON t.file_id = f.id'
+    )
+
+    @staticmethod
+    def _filter(conditions, parameters, types=None, file=None, compile_unit=None):
+        """
+        Add the conditions of the filters of find
+        """
+        if types is not None:
+            types = list(types)
+            conditions.append('t.type IN ({})'.format(', '.join('?' * len(types))))
+            parameters.extend(types)
+        if file is not None:
+            conditions.append('f.file_name = ?')
+            parameters.append(basename(file))
+            if basename(file) != file:
+                # a path matches the end of the full path of the file
+                conditions.append('(f.file_directory || \'/\' || f.file_name) LIKE ?')
+                parameters.append('%' + normpath(file))
+        if compile_unit is not None:
+            # a tag of a header is stored once, the other compile units including it are linked to it
+            if isinstance(compile_unit, int):
+                conditions.append(
+                    '(t.compile_unit_id = ? OR EXISTS (SELECT 1 FROM "TagCompileUnit" l '
+                    'WHERE l.tag_id = t.id AND l.compile_unit_id = ?))'
+                )
+                parameters.extend([compile_unit, compile_unit])
+            else:
+                conditions.append(
+                    '(t.compile_unit_id IN (SELECT id FROM "CompileUnit" WHERE object_name LIKE ?) '
+                    'OR EXISTS (SELECT 1 FROM "TagCompileUnit" l JOIN "CompileUnit" c ON c.id = l.compile_unit_id '
+                    'WHERE l.tag_id = t.id AND c.object_name LIKE ?))'
+                )
+                parameters.extend(['%' + normpath(compile_unit)] * 2)
+
+    def _execute(self, conditions, parameters, order_by, limit):
+        query = '{} WHERE {} ORDER BY {}'.format(self.SELECT_TAGS, ' AND '.join(conditions), order_by)
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters = parameters + [limit]
+        return [TagMatch(*row) for row in self._connection.execute(query, parameters)]
+
+    def find(self, name, prefix=False, ignore_case=False, substring=False,
+             types=None, file=None, compile_unit=None, limit=None):
+        """
+        :param name: the name, or the beginning of the names if *prefix*, or a part of them if *substring*
+        :param ignore_case: compare ASCII letters case insensitively
+        :param substring: match anywhere in the names, this scans table Name without build_substring_index
+        :param types: list of TagType, only tags of these types
+        :param file: only tags in this file, a file name or the end of a path
+        :param compile_unit: only tags of this compile unit, its id or the end of its source path
+        :param limit: maximum number of tags returned
+        :rtype: list[TagMatch]
+        """
+        if len(name) == 0 and not prefix:
+            raise TagQueryError("Name should not be empty")
+        if substring and self._has_substring_index and len(name) >= 3:
+            # the trigrams match case insensitively, non ASCII letters too, the case is checked afterwards
+            conditions = ['n.id IN (SELECT rowid FROM "{0}" WHERE "{0}" MATCH ?)'.format(self.SUBSTRING_INDEX)]
+            parameters = ['"%s"' % name.replace('"', '""')]
+            if not ignore_case:
+                conditions.append('instr(n.name, ?) > 0')
+                parameters.append(name)
+            else:
+                conditions.append('instr(lower(n.name), ?) > 0')
+                parameters.append(fold_case(name))
+        elif substring and ignore_case:
+            conditions, parameters = ['instr(lower(n.name), ?) > 0'], [fold_case(name)]
+        elif substring:
+            conditions, parameters = ['instr(n.name, ?) > 0'], [name]
+        else:
+            name_column = 'n.name'
+            if ignore_case:
+                # NOCASE compares the lower case letters, so does the end of the prefix range
+                name_column = 'n.name COLLATE NOCASE'
+                name = fold_case(name)
+            if not prefix:
+                conditions, parameters = ['{} = ?'.format(name_column)], [name]
+            elif len(name) != 0:
+                conditions = ['{0} >= ? AND {0} < ?'.format(name_column)]
+                parameters = [name, self._get_prefix_end(name)]
+            else:
+                conditions, parameters = ['1'], []
+
+        self._filter(conditions, parameters, types, file, compile_unit)
+        return self._execute(conditions, parameters, 'n.name, t.file_id, t.line_no', limit)
+
+    def get(self, tag_id):
+        """
+        :rtype: TagMatch
+        """
+        matches = self._execute(['t.id = ?'], [tag_id], 't.id', None)
+        return matches[0] if len(matches) != 0 else None
+
+    def members(self, tag_id, limit=None):
+        """
+        :return: members of a struct, class or enumeration, or parameters of a function, in declaration order
+        """
+        member_types = ', '.join(str(tag_type) for tag_type in MEMBER_TYPES)
+        conditions = ['t.assoc_to_tag_id = ?', 't.type IN ({})'.format(member_types)]
+        return self._execute(conditions, [tag_id], 't.line_no, t.id', limit)
+
+    def children(self, tag_id, limit=None):
+        """
+        :return: tags declared in the scope of the tag, nested types and methods included
+        """
+        return self._execute(['t.parent_tag_id = ?'], [tag_id], 't.line_no, t.id', limit)
@@ -0,0 +1,102 @@
+from collections import namedtuple
+import string
+import sys
+
+
+class TagType:
+    Variable = 1
+    Function = 2
+    EnumerationMember = 3
+    Macro = 4
+    Structure = 5
+    Class = 6
+    Union = 7
+    Typedef = 8
+    Type = 9
+    Enumeration = 10
+    Member = 11
+    BaseType = 12
+    FormalParameter = 13
+
+
+class TagRecord(object):
+    """
+    A parsed tag before it is stored, a plain object of ints and interned strings
+    instead of an ORM Tag, which is much heavier and cannot cross processes cheaply.
+    Parents and associated tags are referred to by id, see Operation.new_tag_id.
+    """
+    __slots__ = ['id', 'name', 'type', 'file_id', 'compile_unit_id', 'line_no', 'column_no',
+                 'parent_tag_id', 'assoc_to_tag_id', 'scope', 'scope_type']
+
+    def __init__(self, id, name, type, file_id=None, compile_unit_id=None, line_no=None,
+                 parent_tag_id=None, assoc_to_tag_id=None, scope=None, scope_type=None):
+        """
+        :param scope_type: TagType of the type or function enclosing the tag when it is not stored as its parent,
+                           e.g. a kind filtered out, None if only namespaces enclose it
+        """
+        self.id = id
+        self.name = sys.intern(name)
+        self.type = type
+        self.file_id = file_id
+        self.compile_unit_id = compile_unit_id
+        self.line_no = line_no
+        self.column_no = None
+        self.parent_tag_id = parent_tag_id
+        self.assoc_to_tag_id = assoc_to_tag_id
+        self.scope = scope
+        self.scope_type = scope_type
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+    def to_row(self, name_id, scope_id):
+        """
+        :param name_id: id of the name in table Name
+        :param scope_id: id of the scope in table Name
+        :return: dict of the columns of table Tag
+        """
+        return dict(
+            id=self.id, name_id=name_id, type=self.type, file_id=self.file_id,
+            compile_unit_id=self.compile_unit_id, line_no=self.line_no, column_no=self.column_no,
+            parent_tag_id=self.parent_tag_id, assoc_to_tag_id=self.assoc_to_tag_id, scope_id=scope_id,
+            scope_type=self.scope_type
+        )
+
+
+# a row of table File, for the stores which do not keep it in the database
+FileRecord = namedtuple('FileRecord', 'id file_name file_directory file_dir_rel_to_comp_dir')
+
+
+# a tag found by a lookup, see TagQuery
+TagMatch = namedtuple(
+    'TagMatch', 'id name type scope file_directory file_name line_no compile_unit_id parent_tag_id assoc_to_tag_id'
+)
+
+# TagType value -> its name, e.g. 2 -> 'Function'
+TAG_TYPE_NAMES = dict((value, key) for key, value in vars(TagType).items() if isinstance(value, int))
+
+MEMBER_TYPES = [TagType.Member, TagType.FormalParameter, TagType.EnumerationMember]
+
+
+def match_to_dict(match: TagMatch):
+    """
+    :return: the fields of the match and the name of its type as 'kind', for JSON output
+    """
+    record = match._asdict()
+    record['kind'] = TAG_TYPE_NAMES.get(match.type)
+    return record
+
+
+# the lower case of the ASCII letters only, like the NOCASE collation and lower() of SQLite
+ASCII_LOWER_CASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold_case(name):
+    """
+    :return: the name compared by case insensitive lookups, of TagQuery and TagIndex alike
+    """
+    return name.translate(ASCII_LOWER_CASE)
@@ -5,10 +5,21 @@ from os.path import sep
 from elftools.dwarf.descriptions import describe_attr_value
 from elftools.common.py3compat import bytes2str
 from collections import defaultdict, namedtuple
+from copy import copy
+from threading import Event
+import hashlib
 from .runner import Task
+from .typeresolver import TypeReferenceResolver, REFERENCE_FORMS, get_type_ref_offset, get_signature_key
+from .tagfilter import TagFilter
 from btagslib.db.operation import *
 from btagslib.terminal.statusbar import MultiProgressBar, get_status_bar_decorator
 from btagslib.elftoolsext.macro import Macro
+from btagslib.elftoolsext.dwarfcache import DwarfDecodeCache, decode_cache, get_decode_cache
+from btagslib.elftoolsext.splitdwarf import DwoFile, STR_INDEX_FORMS, DEBUG_DIRS, get_str_offset, get_dwo_path, \
+    has_debug_sections, get_build_id, find_separate_debug_file
+from btagslib.elftoolsext.typeunits import TypeUnit, iter_type_units
+from btagslib.elftoolsext.gdbindex import GdbIndex, GdbIndexError
+from btagslib.profiling.profiler import profiler
 
 
 
@@ -28,9 +39,18 @@ class DwarfInfoParseAfterError(Exception):
     pass
 
 
+# excluded: in a tag declared in a file excluded by the TagFilter, or in the declaration of a type of a type unit,
+# nothing is built for the DIE
+# scope_type: TagType of the declaration enclosing the type defined by a type unit, see TagRecord
+ScopeTuple = namedtuple('ScopeTuple', 'die tag named_tag qualified_name excluded scope_type')
+
+
 class DwarfInfoParseTask(Task):
-    _dwarf_info_bytes = None
-    _dwarf_line_bytes = None
+    # DWARFInfo -> (bytes of .debug_info, bytes of .debug_line), the tasks of several binaries may run together
+    _dwarf_buffers = dict()
+    # bytes taken while parsing for every byte of the compile unit, the DIEs read are kept until it is parsed,
+    # measured on compile units of 0.2 to 2.5MB
+    memory_per_byte = 300
 
     @staticmethod
     def _get_die_attributes_dict(die, global_offset):
@@ -39,6 +59,18 @@ class DwarfInfoParseTask(Task):
             name = attr.name
             if isinstance(name, int):
                 continue
+            elif attr.form == 'DW_FORM_strp':
+                # the shared name is decoded once, not in every compile unit referencing it
+                description = get_decode_cache(die.dwarfinfo).get_name(die.dwarfinfo, attr.raw_value)
+                if len(description) != 0:
+                    res[name] = description
+            elif attr.form in STR_INDEX_FORMS:
+                # in a .dwo file, through its table of string offsets
+                description = get_decode_cache(die.dwarfinfo).get_name(
+                    die.dwarfinfo, get_str_offset(die.dwarfinfo, attr.raw_value)
+                )
+                if len(description) != 0:
+                    res[name] = description
             else:
                 try:
                     description = str(describe_attr_value(attr, die, global_offset)).strip()
@@ -55,40 +87,164 @@ class DwarfInfoParseTask(Task):
     def set_dwarf_info_buffer(cls, dwarf_info : DWARFInfo):
         dwarf_info.debug_info_sec.stream.seek(0, os.SEEK_SET)
         dwarf_info.debug_line_sec.stream.seek(0, os.SEEK_SET)
-        cls._dwarf_info_bytes = dwarf_info.debug_info_sec.stream.getvalue()
-        cls._dwarf_line_bytes = dwarf_info.debug_line_sec.stream.getvalue()
+        cls._dwarf_buffers[dwarf_info] = (
+            dwarf_info.debug_info_sec.stream.getvalue(), dwarf_info.debug_line_sec.stream.getvalue()
+        )
 
     @classmethod
-    def clear_dwarf_buffer(cls):
-        cls._dwarf_info_bytes = None
-        cls._dwarf_line_bytes = None
+    def clear_dwarf_buffer(cls, dwarf_info: DWARFInfo = None):
+        """
+        :param dwarf_info: whose buffers are dropped, all of them if None
+        """
+        if dwarf_info is None:
+            cls._dwarf_buffers = dict()
+        else:
+            cls._dwarf_buffers.pop(dwarf_info, None)
 
-    __slots__ = ["_cu", "_op", "_dwarf_info", "_file_id_map", "_cu_db_item", "_status_bar"]
+    @classmethod
+    def set_type_units_buffer(cls, types_info: DWARFInfo):
+        """
+        :param types_info: of a .debug_types section, its type units read the line program of their compile unit
+        """
+        types_info.debug_info_sec.stream.seek(0, os.SEEK_SET)
+        cls._dwarf_buffers[types_info] = (types_info.debug_info_sec.stream.getvalue(), b'')
 
-    def __init__(self, cu: CompileUnit, file_id_map: dict, index: int, status_bar: MultiProgressBar):
+    @staticmethod
+    def _get_cu_path(top_die):
+        """
+        :return: (compile directory, absolute path of the source file) of the compile unit
+        """
+        attributes = top_die.attributes
+        comp_dir = bytes2str(attributes['DW_AT_comp_dir'].value) if 'DW_AT_comp_dir' in attributes else sep
+        name = bytes2str(attributes['DW_AT_name'].value) if 'DW_AT_name' in attributes else ''
+        return comp_dir, TagFilter.get_path(comp_dir, name)
+
+    @staticmethod
+    def _get_file_id_map(cu: CompileUnit, op: Operation, tag_filter: TagFilter = None, comp_dir=sep):
+        """
+        :return: file index of the line program -> file id, the files excluded by *tag_filter* are mapped to None
+                 and not added
+        """
+        line_program = cu.dwarfinfo.line_program_for_CU(cu)
+        if line_program is None:
+            return None
+        index = 1
+        file_map = dict()
+        for file_entry in line_program['file_entry']:
+            file_name = bytes2str(file_entry.name)
+            dir_index = file_entry.dir_index
+            if dir_index > 0:
+                dir_path = line_program['include_directory'][dir_index - 1]
+            else:
+                dir_path = b'.'
+            if tag_filter is not None and tag_filter.filters_paths() and \
+                    not tag_filter.accepts_path(TagFilter.get_path(comp_dir, bytes2str(dir_path), file_name)):
+                file_map[index] = None
+            else:
+                file_map[index] = op.add_file(file_name, bytes2str(dir_path))
+            index += 1
+        file_id_map = dict()
+        for key in file_map:
+            file_id_map[key] = file_map[key].id if file_map[key] is not None else None
+        return file_id_map
+
+    __slots__ = [
+        "_cu", "_op", "_dwarf_info", "_comp_dir", "_file_id_map", "_file_id_map_ready", "_cu_db_item", "_status_bar",
+        "_tag_filter", "_binary_id", "_type_units"
+    ]
+
+    def __init__(self, cu: CompileUnit, comp_dir, index: int, status_bar: MultiProgressBar,
+                 type_resolver: TypeReferenceResolver, op: Operation, tag_filter: TagFilter = None, binary_id=None,
+                 type_units=()):
+        """
+        :param comp_dir: compile directory of the compile unit, the file map is built by the task
+        :param binary_id: id of the Binary the compile unit is recorded in, see Operation.add_binary
+        :param type_units: the TypeUnit emitted with the compile unit, they share its line program,
+                           their tags are parsed and committed with its own
+        """
         super(DwarfInfoParseTask, self).__init__()
         self._cu = cu
-        self._op = Operation()
+        # of the compile unit in the binary, the one of a split compile unit is of its skeleton
+        self._cu_offset = cu.cu_offset
+        self._cu_size = cu['unit_length'] + cu.structs.initial_length_field_size()
+        self._type_units = type_units
+        self._binary_id = binary_id
+        self._comp_dir = comp_dir
+        self._tag_filter = tag_filter
+        self._type_resolver = type_resolver
+        self._op = op
         self._dwarf_info = None
         self.index = index
-        self._file_id_map = file_id_map
+        self._file_id_map = None
+        self._file_id_map_ready = Event()
         self._cu_db_item = None
         self._status_bar = status_bar
         self._status_bar_index = None
+        # (type links, (offset, tag id) of the tags, references leaving the compile unit) till committed
+        self._type_references = None
+
+    @property
+    def memory_estimate(self):
+        return self.memory_per_byte * (self._cu_size + sum(type_unit.size for type_unit in self._type_units))
+
+    def wait_file_id_map(self):
+        """
+        Called by the macro task, which shares the file map of the compile unit
+        :return: the file id map, None if the task failed before building it
+        """
+        self._file_id_map_ready.wait()
+        return self._file_id_map
+
+    def start(self):
+        try:
+            with profiler.stage('before_run', cu=self.index):
+                self._before_run()
+            # built by every task for its own compile unit rather than by the generator, so parsing starts at once
+            with profiler.stage('file_map', cu=self.index):
+                self._file_id_map = self._build_file_id_map()
+            if self._file_id_map is None:
+                raise DwarfInfoBeforeParseError("No file map found")
+        finally:
+            self._file_id_map_ready.set()
+        self._run()
+        self._after_run()
 
-    def _before_run(self):
-        super(DwarfInfoParseTask, self)._before_run()
-        if len(DwarfInfoParseTask._dwarf_info_bytes) == 0:
+    def _build_file_id_map(self):
+        return DwarfInfoParseTask._get_file_id_map(self._cu, self._op, self._tag_filter, self._comp_dir)
+
+    def _open_streams(self):
+        dwarf_info_bytes, dwarf_line_bytes = DwarfInfoParseTask._dwarf_buffers.get(self._cu.dwarfinfo, (b'', b''))
+        if len(dwarf_info_bytes) == 0:
             raise DwarfInfoBeforeParseError("Bytes of info section is empty")
-        if len(DwarfInfoParseTask._dwarf_line_bytes) == 0:
+        if len(dwarf_line_bytes) == 0:
             raise DwarfInfoBeforeParseError("Bytes of line section is empty")
-        if self._file_id_map is None:
-            raise DwarfInfoBeforeParseError("No file map found")
+        # the DIEs are read through the streams of the DWARFInfo, every task needs streams of its own,
+        # the DWARFInfo is shared by all compile units of a binary
+        dwarf_info = copy(self._cu.dwarfinfo)
+        dwarf_info.debug_info_sec = dwarf_info.debug_info_sec._replace(stream=BytesIO(dwarf_info_bytes))
+        dwarf_info.debug_line_sec = dwarf_info.debug_line_sec._replace(stream=BytesIO(dwarf_line_bytes))
+        self._cu.dwarfinfo = dwarf_info
+        # the DIEs parsed so far, the top DIE at least, read their children through the shared stream
+        self._cu._dielist = []
+        self._cu._diemap = []
+        # the type units of a .debug_types section share its streams
+        types_infos = dict()
+        for type_unit in self._type_units:
+            types_info = types_infos.get(type_unit.dwarfinfo)
+            if types_info is None:
+                types_info = copy(type_unit.dwarfinfo)
+                types_info.debug_info_sec = types_info.debug_info_sec._replace(
+                    stream=BytesIO(DwarfInfoParseTask._dwarf_buffers[type_unit.dwarfinfo][0])
+                )
+                types_info.debug_line_sec = dwarf_info.debug_line_sec
+                types_infos[type_unit.dwarfinfo] = types_info
+            type_unit.dwarfinfo = types_info
+            type_unit._dielist = []
+            type_unit._diemap = []
 
-        self._cu.dwarfinfo.debug_info_sec = \
-            self._cu.dwarfinfo.debug_info_sec._replace(stream=BytesIO(DwarfInfoParseTask._dwarf_info_bytes))
-        self._cu.dwarfinfo.debug_line_sec = \
-            self._cu.dwarfinfo.debug_line_sec._replace(stream=BytesIO(DwarfInfoParseTask._dwarf_line_bytes))
+    def _before_run(self):
+        super(DwarfInfoParseTask, self)._before_run()
+        self._open_streams()
 
         global_offset = self._cu.dwarfinfo.debug_info_sec.global_offset
         if global_offset == 0:
@@ -109,7 +265,9 @@ class DwarfInfoParseTask(Task):
         pair = attributes['DW_AT_comp_dir'].strip().split('): ')
         cu_file_directory = (pair[0] if len(pair) == 1 else pair[1]) if len(pair) != 0 else None
 
-        self._cu_db_item = self._op.add_compilation_unit(cu_file_directory, cu_file_name, self.index)
+        self._cu_db_item = self._op.add_compilation_unit(
+            cu_file_directory, cu_file_name, self.index, self._binary_id, self._cu_offset
+        )
         self._status_bar_index = self._status_bar.get_an_index()
         self._status_bar_decorator = get_status_bar_decorator(self._status_bar, self._status_bar_index)
 
@@ -117,120 +275,255 @@ class DwarfInfoParseTask(Task):
         if not os.path.exists(file_full_path):
             self._status_bar.info(self._status_bar_index, "Warning: file {} doesn't exist!".format(file_full_path))
 
+    @staticmethod
+    def _get_child_scope(scope, die, tag, attributes, excluded=False):
+        """
+        Every entry of the DIE stack carries its nearest named tag and qualified name,
+        so the children find their parent without walking the stack.
+        """
+        if excluded or scope.excluded:
+            return scope._replace(die=die, tag=None, excluded=True)
+        if tag is not None:
+            name = tag.name
+        elif die.tag == 'DW_TAG_namespace':
+            # namespaces are not tags, but they are a part of the qualified name
+            pair = attributes['DW_AT_name'].strip().split('):') if 'DW_AT_name' in attributes else ['__anon']
+            name = (pair[0] if len(pair) == 1 else pair[1]).strip()
+        else:
+            return scope._replace(die=die, tag=tag)
+        qualified_name = name if scope.qualified_name is None else scope.qualified_name + '::' + name
+        return scope._replace(
+            die=die, tag=tag, named_tag=tag if tag is not None else scope.named_tag, qualified_name=qualified_name,
+            scope_type=None
+        )
+
+    def _get_DIEs(self):
+        """
+        :return: the DIEs of the compile unit to parse, in order with the null DIEs ending the lists of children,
+                 and the offsets of the DIEs after which the rest of a list of children is left out
+        """
+        return list(self._cu.iter_DIEs()), ()
+
+    @staticmethod
+    def _get_type_unit_scope(scope, die, attributes, declarations, tag_type_map):
+        """
+        A type unit defines its type at its top, with DW_AT_specification referring to a declaration nested
+        in the declarations of its namespaces and enclosing types, they give it its qualified name and the
+        kind of its enclosing type
+        :param declarations: DIE offset -> (qualified name of the enclosing scope, TagType of the enclosing
+                             declaration or None, qualified name, TagType) of the declarations of the type unit
+                             seen so far
+        :return: the scope of the DIE
+        """
+        if 'DW_AT_declaration' in attributes and 'DW_AT_name' in attributes:
+            pair = attributes['DW_AT_name'].strip().split('):')
+            name = (pair[0] if len(pair) == 1 else pair[1]).strip()
+            enclosing = declarations.get(scope.die.offset)
+            enclosing_name, enclosing_type = enclosing[2:] if enclosing is not None else (scope.qualified_name, None)
+            declarations[die.offset] = (
+                enclosing_name, enclosing_type, name if enclosing_name is None else enclosing_name + '::' + name,
+                tag_type_map.get(die.tag)
+            )
+            return scope
+        specification = die.attributes.get('DW_AT_specification')
+        if specification is not None and specification.form in REFERENCE_FORMS:
+            declaration = declarations.get(specification.value + die.cu.cu_offset)
+            if declaration is not None:
+                return scope._replace(qualified_name=declaration[0], scope_type=declaration[1])
+        return scope
+
     def _run(self):
         file_id_map = self._file_id_map
-        tag_stack = [(self._cu.get_top_DIE(), Tag())]
+        tag_stack = []
+        tag_filter = self._tag_filter
         tag_to_add = []
-        tag_map = dict()
-
-        die_iter = self._cu.iter_DIEs()
-        die_len = len(self._cu._dielist)
+        # (typedef tag, offset of the referenced DIE) and (DIE offset, offset of the referenced DIE)
+        typedef_refs = []
+        type_links = []
+        # (DIE offset, tag id)
+        tag_offsets = []
+        # of the unit being parsed, the DIEs of a type unit are keyed apart from the ones of .debug_info
+        key_base = 0
+        declarations = None
+
+        # newer pyelftools parses DIEs lazily, so _dielist is not complete until iterated
+        with profiler.stage('decode', cu=self.index) as stage:
+            cu_dies, closing_offsets = self._get_DIEs()
+            units = [(self._cu, cu_dies)]
+            for type_unit in self._type_units:
+                units.append((type_unit, list(type_unit.iter_DIEs())))
+                type_links.append((get_signature_key(type_unit.signature), type_unit.get_type_key()))
+            die_len = sum(len(die_iter) for _, die_iter in units)
+            stage.items = die_len
+
+        tag_type_map = dict(
+            DW_TAG_variable=TagType.Variable,
+            DW_TAG_base_type=TagType.BaseType,
+            DW_TAG_typedef=TagType.Typedef,
+            DW_TAG_member=TagType.Member,
+            DW_TAG_structure_type=TagType.Structure,
+            DW_TAG_union_type=TagType.Union,
+            DW_TAG_subprogram=TagType.Function,
+            DW_TAG_class_type=TagType.Class,
+            DW_TAG_enumeration_type=TagType.Enumeration,
+            DW_TAG_enumerator=TagType.EnumerationMember,
+            DW_TAG_formal_parameter=TagType.FormalParameter
+        )
 
         @self._status_bar_decorator(0, 0.5, die_len, "Parsing tags {0}/{1}")
         def parse_tags(die):
-            tag_mapper_key = '<0x%x>' % die.offset
-            try:
-                tag = tag_map[tag_mapper_key]
-            except KeyError:
-                tag = Tag()
-                tag_map[tag_mapper_key] = tag
-
-            tag_type_map = dict(
-                DW_TAG_variable=TagType.Variable,
-                DW_TAG_base_type=TagType.BaseType,
-                DW_TAG_typedef=TagType.Typedef,
-                DW_TAG_member=TagType.Member,
-                DW_TAG_structure_type=TagType.Structure,
-                DW_TAG_union_type=TagType.Union,
-                DW_TAG_subprogram=TagType.Function,
-                DW_TAG_class_type=TagType.Class,
-                DW_TAG_enumeration_type=TagType.Enumeration,
-                DW_TAG_enumerator=TagType.EnumerationMember,
-                DW_TAG_formal_parameter=TagType.FormalParameter
-            )
+            tag = None
+            excluded = False
+            if tag_stack[-1].excluded or (
+                    tag_filter is not None and not die.has_children and die.tag in tag_type_map and
+                    not tag_filter.accepts_kind(tag_type_map[die.tag]) and
+                    (declarations is None or 'DW_AT_declaration' not in die.attributes)
+            ):
+                # the attributes are not even decoded for the DIEs in excluded tags and the unwanted kinds of leaves,
+                # but for the declarations of a type unit, which name the scope of its type
+                ref_offset = get_type_ref_offset(die, key_base)
+                if ref_offset is not None:
+                    type_links.append((die.offset + key_base, ref_offset))
+                if die.has_children:
+                    tag_stack.append(tag_stack[-1]._replace(die=die, tag=None))
+                elif die.is_null():
+                    tag_stack.pop()
+                return
+            signature = die.attributes.get('DW_AT_signature')
+            if signature is not None:
+                # a declaration of a type defined by a type unit, which is parsed once for all compile units
+                type_links.append((die.offset + key_base, get_signature_key(signature.value)))
+                if die.has_children:
+                    tag_stack.append(tag_stack[-1]._replace(die=die, tag=None, excluded=True))
+                return
             attributes = self._get_die_attributes_dict(die, self._cu.dwarfinfo.debug_line_sec.global_offset)
-            tag_type = die.tag
+            scope = tag_stack[-1] if declarations is None else \
+                self._get_type_unit_scope(tag_stack[-1], die, attributes, declarations, tag_type_map)
             try:
-                tag.type = tag_type_map[tag_type]
+                tag_type = tag_type_map[die.tag]
                 pair = attributes['DW_AT_name'].strip().split('):')
-
-                tag.name = pair[0] if len(pair) == 1 else pair[1]
-                tag.name = tag.name.strip()
-
-                if tag.type != TagType.EnumerationMember:
-                    tag.line_no = int(attributes['DW_AT_decl_line']) if tag.type != TagType.BaseType else None
-                    tag.file_id = file_id_map[int(attributes['DW_AT_decl_file'])] \
-                        if tag.type != TagType.BaseType else file_id_map[1]
-
-                if tag.type in [TagType.Typedef] and 'DW_AT_type' in attributes.keys():
-                    to_type = attributes['DW_AT_type']
-                    if to_type not in tag_map.keys():
-                        tag_map[to_type] = Tag()
-                    tag.tmp_assoc_to_tag = tag_map[to_type]
+                name = (pair[0] if len(pair) == 1 else pair[1]).strip()
+
+                line_no = None
+                file_id = None
+                if tag_type != TagType.EnumerationMember:
+                    line_no = int(attributes['DW_AT_decl_line']) if tag_type != TagType.BaseType else None
+                    file_id = file_id_map[int(attributes['DW_AT_decl_file'])] \
+                        if tag_type != TagType.BaseType else file_id_map[1]
+                    if file_id is None:
+                        # so are its members, parameters and nested tags
+                        excluded = True
+                        raise TagMapperError("Declared in an excluded file")
             except KeyError:
-                tag.name = None
+                pass
             except TagMapperError:
-                tag.name = None
+                pass
             else:
-                i = len(tag_stack) - 1
-                while i > 0:
-                    (parent_die, parent_tag) = tag_stack[i]
-                    if parent_tag.name is not None:
-                        tag.parent_tag = parent_tag
-                    i -= 1
-                if tag.name is None:
-                    raise Exception
+                parent_tag = scope.named_tag
+                # a tag of an unwanted kind is only built for the scope of its children, without id it is not stored
+                stored = tag_filter is None or tag_filter.accepts_kind(tag_type)
+                tag = TagRecord(
+                    self._op.new_tag_id() if stored else None, name, tag_type, file_id, self.index, line_no,
+                    parent_tag_id=parent_tag.id if parent_tag is not None else None, scope=scope.qualified_name,
+                    scope_type=scope.scope_type if parent_tag is None else
+                    parent_tag.type if parent_tag.id is None else None
+                )
                 if tag.type in [TagType.EnumerationMember, TagType.FormalParameter, TagType.Member] \
-                        and tag.parent_tag is not None \
-                        and tag.parent_tag.type in \
+                        and parent_tag is not None \
+                        and parent_tag.type in \
                                 [TagType.Enumeration, TagType.Function, TagType.Structure, TagType.Class]:
-                    tag.tmp_assoc_to_tag = tag.parent_tag
+                    tag.assoc_to_tag_id = parent_tag.id
 
                 if tag.type == TagType.EnumerationMember:
                     """
                     find a parent with file field
                     """
-                    tmp_tag = tag.tmp_assoc_to_tag
-                    while tmp_tag is not None and tmp_tag.file is None:
-                        tmp_tag = tmp_tag.parent_tag
-                    if tmp_tag is not None:
-                        tag.file = tmp_tag.file
-
-                tag.compile_unit = self._cu_db_item
+                    for enclosing in reversed(tag_stack):
+                        if enclosing.named_tag is not None and enclosing.named_tag.file_id is not None:
+                            tag.file_id = enclosing.named_tag.file_id
+                            if enclosing.named_tag.id is None:
+                                # the tag file takes the line of the parent, which is not stored
+                                tag.line_no = enclosing.named_tag.line_no
+                            break
+
+                if not stored:
+                    return
                 tag_to_add.append(tag)
+                tag_offsets.append((die.offset + key_base, tag.id))
+                if tag.type == TagType.Typedef:
+                    ref_offset = get_type_ref_offset(die, key_base)
+                    if ref_offset is not None:
+                        typedef_refs.append((tag.id, ref_offset))
             finally:
+                if tag is None:
+                    # pointer, const, ... types link a typedef to the tag it is defined as
+                    ref_offset = get_type_ref_offset(die, key_base)
+                    if ref_offset is not None:
+                        type_links.append((die.offset + key_base, ref_offset))
                 # 处理栈
                 if die.has_children:
-                    tag_stack.append((die, tag))
+                    tag_stack.append(self._get_child_scope(scope, die, tag, attributes, excluded))
                 elif die.is_null():
                     tag_stack.pop()
-        top = True
-        for cur_die in die_iter:
-            if top:
-                top = False
-                continue
-            else:
-                parse_tags(cur_die)
-
-        # fold the tags
-        @self._status_bar_decorator(0.5, 0.3, len(tag_to_add), "Folding tags {0}/{1}")
-        def fold_tags(cur_tag):
-            tmp_tag = cur_tag.tmp_assoc_to_tag
-            while tmp_tag is not None:
-                if tmp_tag.name is not None:
-                    break
-                else:
-                    tmp_tag = tmp_tag.assoc_to_tag
-            cur_tag.assoc_to_tag = tmp_tag
-            self._op.add_tag(cur_tag)
-        for tag in tag_to_add:
-            fold_tags(tag)
+        with profiler.stage('parse', cu=self.index, items=die_len):
+            for unit, die_iter in units:
+                if isinstance(unit, TypeUnit):
+                    key_base = unit.key_base
+                    declarations = dict()
+                tag_stack[:] = [
+                    ScopeTuple(
+                        die=die_iter[0], tag=None, named_tag=None, qualified_name=None, excluded=False, scope_type=None
+                    )
+                ]
+                top = True
+                for cur_die in die_iter:
+                    if top:
+                        top = False
+                        continue
+                    else:
+                        parse_tags(cur_die)
+                        if cur_die.offset in closing_offsets:
+                            # the rest of the children is left out, so is the null DIE ending them
+                            tag_stack.pop()
+                closing_offsets = ()
+
+        # hand the records over, they become rows on commit
+        with profiler.stage('fold', cu=self.index, items=len(tag_to_add)):
+            # the typedefs referring to tags of the compile unit are resolved here, and committed with it
+            local_resolver = TypeReferenceResolver()
+            local_resolver.add_links(type_links)
+            local_resolver.add_tags(tag_offsets)
+            local_resolver.add_pending(typedef_refs)
+            cu_end = self._cu.cu_offset + self._cu['unit_length'] + self._cu.structs.initial_length_field_size()
+            resolved, leaving = local_resolver.resolve_local(self._cu.cu_offset, cu_end)
+            if len(resolved) != 0:
+                typedefs = dict((tag.id, tag) for tag in tag_to_add if tag.type == TagType.Typedef)
+                for tag_id, assoc_tag_id in resolved:
+                    typedefs[tag_id].assoc_to_tag_id = assoc_tag_id
+            self._op.add_tag_records(tag_to_add)
+            # the references leaving the compile unit are resolved binary wide later, by the ids the tags are
+            # stored with, which are known once committed
+            self._type_references = (type_links, tag_offsets, leaving)
+        self._status_bar.record('dies', die_len)
+        self._status_bar.record('tags', len(tag_to_add))
+
+    def _add_type_references(self):
+        type_links, tag_offsets, leaving = self._type_references
+        get_stored_tag_id = self._op.get_stored_tag_id
+        self._type_resolver.add_links(type_links)
+        self._type_resolver.add_tags([(offset, get_stored_tag_id(tag_id)) for offset, tag_id in tag_offsets])
+        self._type_resolver.add_pending([(get_stored_tag_id(tag_id), ref_offset) for tag_id, ref_offset in leaving])
+        self._type_references = None
 
     def _after_run(self):
         try:
             self._status_bar.update(self._status_bar_index, 0.8, "Committing tags to database")
-            self._op.commit()
+            with profiler.stage('commit', cu=self.index):
+                self._op.commit()
+                self._add_type_references()
             self._status_bar.update(self._status_bar_index, 1, "Tags committed")
+            self._status_bar.record('cus_done')
+            self._status_bar.record('bytes_done', self._cu_size)
         except:
             raise DwarfInfoParseAfterError("Error when commit {}")
         finally:
@@ -239,6 +532,126 @@ class DwarfInfoParseTask(Task):
         super(DwarfInfoParseTask, self)._after_run()
 
 
+class DwarfDwoParseTask(DwarfInfoParseTask):
+    """
+    Parses a compile unit of -gsplit-dwarf: its DIEs are in a .dwo file, its line program is in the skeleton
+    compile unit of the binary. Every task reads its own .dwo file, so they are read in parallel.
+    """
+    def __init__(self, cu: CompileUnit, dwo_path, *args, **kwargs):
+        """
+        :param cu: the skeleton compile unit
+        :param dwo_path: of the .dwo file of the compile unit
+        """
+        super(DwarfDwoParseTask, self).__init__(cu, *args, **kwargs)
+        self._skeleton_cu = cu
+        self._dwo_path = dwo_path
+
+    @property
+    def memory_estimate(self):
+        try:
+            return self.memory_per_byte * os.stat(self._dwo_path).st_size
+        except OSError:
+            return 0
+
+    def _build_file_id_map(self):
+        # the decl_file of the DIEs of the .dwo file are indexes of the line program of the skeleton
+        return DwarfInfoParseTask._get_file_id_map(self._skeleton_cu, self._op, self._tag_filter, self._comp_dir)
+
+    def _open_streams(self):
+        super(DwarfDwoParseTask, self)._open_streams()
+        dwo_file = DwoFile(self._dwo_path)
+        get_decode_cache(self._skeleton_cu.dwarfinfo).install(dwo_file.dwarf_info)
+        dwo_file.dwarf_info.debug_line_sec = self._skeleton_cu.dwarfinfo.debug_line_sec
+        dwo_id = self._skeleton_cu.get_top_DIE().attributes.get('DW_AT_GNU_dwo_id')
+        self._cu = dwo_file.get_compile_unit(dwo_id.value if dwo_id is not None else None)
+
+
+class DwarfNameIndexParseTask(DwarfInfoParseTask):
+    """
+    Parses the DIEs of the global names a name index lists for a compile unit, the scopes enclosing them
+    and the members of the types. The bodies of the functions are skipped through DW_AT_sibling without
+    being decoded, they hold most of the DIEs, only the parameters are parsed.
+    """
+    type_tags = frozenset([
+        'DW_TAG_structure_type', 'DW_TAG_class_type', 'DW_TAG_union_type', 'DW_TAG_enumeration_type'
+    ])
+
+    def __init__(self, cu: CompileUnit, names, *args, **kwargs):
+        """
+        :param names: the qualified names of the compile unit listed by the name index, e.g. ``geo::Point``
+        """
+        super(DwarfNameIndexParseTask, self).__init__(cu, *args, **kwargs)
+        self._names = names
+        self._scopes = set()
+        for name in names:
+            # the name of a template may have :: in its arguments, a scope which is not found costs nothing
+            parts = name.split('::')
+            for i in range(1, len(parts)):
+                self._scopes.add('::'.join(parts[:i]))
+
+    @staticmethod
+    def _get_die_name(die):
+        if die.tag == 'DW_TAG_namespace' and 'DW_AT_name' not in die.attributes:
+            return '(anonymous namespace)'
+        attr = die.attributes.get('DW_AT_name')
+        if attr is None:
+            return None
+        if attr.form == 'DW_FORM_strp':
+            return get_decode_cache(die.dwarfinfo).get_name(die.dwarfinfo, attr.raw_value)
+        return bytes2str(attr.value)
+
+    def _get_DIEs(self):
+        dies = list()
+        closing_offsets = set()
+
+        def add_children(die, qualified_name):
+            for child in die.iter_children():
+                dies.append(child)
+                if not child.has_children:
+                    continue
+                name = self._get_die_name(child)
+                child_name = None if name is None else name if qualified_name is None else \
+                    qualified_name + '::' + name
+                if child.tag == 'DW_TAG_subprogram':
+                    # the parameters come first, they give the arity of the function
+                    last = child
+                    for grandchild in child.iter_children():
+                        if grandchild.tag != 'DW_TAG_formal_parameter' or grandchild.has_children:
+                            break
+                        dies.append(grandchild)
+                        last = grandchild
+                    closing_offsets.add(last.offset)
+                elif child.tag in self.type_tags or child_name in self._names or child_name in self._scopes:
+                    add_children(child, child_name)
+                    dies.append(child._terminator)
+                else:
+                    closing_offsets.add(child.offset)
+        top_die = self._cu.get_top_DIE()
+        dies.append(top_die)
+        add_children(top_die, None)
+        dies.append(top_die._terminator)
+        return dies, closing_offsets
+
+
+class DwarfFileMapTask(DwarfInfoParseTask):
+    """
+    Stands for a compile unit committed by the interrupted run being resumed, which is not parsed again,
+    only its file map is built for the macro task.
+    """
+    # waited for by the macro task, which is not limited by the memory budget either
+    memory_estimate = 0
+
+    def start(self):
+        try:
+            self._open_streams()
+            self._file_id_map = DwarfInfoParseTask._get_file_id_map(
+                self._cu, self._op, self._tag_filter, self._comp_dir
+            )
+        finally:
+            self._file_id_map_ready.set()
+            self._op.close()
+
+
 class DwarfMacroBeforeParseError(Exception):
     pass
 
@@ -252,11 +665,19 @@ class DwarfMacroParseAfterError(Exception):
 
 
 class DwarfMacroParseTask(Task):
-    def __init__(self, macro: Macro, cu_index_list: list, file_id_map_list: list, status_bar: MultiProgressBar):
+    # the macros of several compile units are committed together until this many are pending,
+    # a commit for every compile unit costs more than its macros when they are few
+    commit_tags = 4096
+
+    def __init__(self, macro: Macro, parse_tasks: list, status_bar: MultiProgressBar, op: Operation):
+        """
+        :param parse_tasks: the DwarfInfoParseTask of every compile unit with macros, in the order of the macro lists,
+                            None for the compile units excluded by the TagFilter and the ones
+                            whose macros are committed already
+        """
         self._macro = macro
-        self._op = Operation()
-        self._cu_id_list = cu_index_list
-        self._file_id_map_list = file_id_map_list
+        self._op = op
+        self._parse_tasks = parse_tasks
         self._status_bar = status_bar
 
     def _before_run(self):
@@ -265,31 +686,56 @@ class DwarfMacroParseTask(Task):
         self._status_bar_decorator = get_status_bar_decorator(self._status_bar, self._status_bar_index)
 
     def _run(self):
+        with profiler.stage('macro') as stage:
+            self._parse_macro_list()
+            stage.items = sum(len(macro_list_item) for macro_list_item in self._macro.get_macro_list())
+
+    def _commit(self, cu_ids):
+        self._op.set_macros_done(cu_ids)
+        self._op.commit()
+
+    def _parse_macro_list(self):
         macro_list = self._macro.get_macro_list()
         cu_list_index = 0
+        # the compile units whose macros are pending, and the number of their tags
+        pending_cu_ids = list()
+        pending_tags = 0
         for macro_list_item in macro_list:
-            assert cu_list_index < len(self._cu_id_list)
-            cu_id = self._cu_id_list[cu_list_index]
-            file_id_map = self._file_id_map_list[cu_list_index]
+            assert cu_list_index < len(self._parse_tasks)
+            parse_task = self._parse_tasks[cu_list_index]
+            # the file map is built by the parse task of the compile unit, which is started before this task
+            file_id_map = parse_task.wait_file_id_map() if parse_task is not None else None
+            if file_id_map is None:
+                cu_list_index += 1
+                continue
+            cu_id = parse_task.index
 
             @self._status_bar_decorator(
                 0, 0.8, len(macro_list_item),
-                "Parsing macro tags for compile unit %d/%d progress: {0}/{1}" % (cu_list_index, len(self._cu_id_list))
+                "Parsing macro tags for compile unit %d/%d progress: {0}/{1}" % (cu_list_index, len(self._parse_tasks))
             )
             def parse_macro_list_item(item):
-                if item.file_idx <= 0:
+                if item.file_idx <= 0 or file_id_map[item.file_idx] is None:
                     return
-                tag = Tag()
-                tag.file_id = file_id_map[item.file_idx]
-                tag.compile_unit_id = cu_id
-                tag.line_no = item.line_num
-                tag.name = item.macro_name
-                tag.type = TagType.Macro
-                self._op.add_tag(tag)
+                self._op.add_tag_records([TagRecord(
+                    self._op.new_tag_id(), item.macro_name, TagType.Macro, file_id_map[item.file_idx], cu_id,
+                    item.line_num
+                )])
+                added[0] += 1
+            # only the macros of the files mapped become tags
+            added = [0]
             for item in macro_list_item:
                 parse_macro_list_item(item)
+            self._status_bar.record('tags', added[0])
             cu_list_index += 1
-            self._op.commit()
+            pending_cu_ids.append(cu_id)
+            pending_tags += added[0]
+            if pending_tags >= self.commit_tags:
+                self._commit(pending_cu_ids)
+                pending_cu_ids = list()
+                pending_tags = 0
+        if len(pending_cu_ids) != 0:
+            self._commit(pending_cu_ids)
 
     def _after_run(self):
         self._status_bar.update(self._status_bar_index, 1, "Done")
@@ -298,6 +744,43 @@ class DwarfMacroParseTask(Task):
         super(DwarfMacroParseTask, self)._after_run()
 
 
+class TypeReferenceResolveTask(Task):
+    """
+    Links typedefs to the tags they are defined as, once every compile unit has
+    been parsed, since the definition may live in another compile unit.
+    """
+    wait_for_previous = True
+
+    def __init__(self, type_resolver: TypeReferenceResolver, status_bar: MultiProgressBar, op: Operation,
+                 binary_id=None):
+        """
+        :param binary_id: id of the Binary, which is done once the task has committed
+        """
+        self._type_resolver = type_resolver
+        self._op = op
+        self._status_bar = status_bar
+        self._binary_id = binary_id
+
+    def _before_run(self):
+        super(TypeReferenceResolveTask, self)._before_run()
+        self._status_bar_index = self._status_bar.get_an_index()
+
+    def _run(self):
+        self._status_bar.update(self._status_bar_index, 0, "Resolving type references")
+        with profiler.stage('resolve', items=self._type_resolver.pending_count()):
+            resolved = list(self._type_resolver.iter_resolved())
+            if len(resolved) != 0:
+                self._op.set_assoc_to_tags(resolved)
+            self._op.set_binary_done(self._binary_id)
+            self._op.commit()
+
+    def _after_run(self):
+        self._status_bar.update(self._status_bar_index, 1, "Type references resolved")
+        self._status_bar.return_an_index(self._status_bar_index)
+        self._op.close()
+        super(TypeReferenceResolveTask, self)._after_run()
+
+
 class DwarfParseTaskGenerateError(Exception):
     pass
 
@@ -306,82 +789,276 @@ FileMapTuple = namedtuple('FileMapTuple', 'dir_rel_path file_rel_path')
 
 
 class DwarfParseTaskGenerator:
-    def __init__(self, file_path, status_bar: MultiProgressBar):
-        self._file_path = file_path
+    def __init__(self, file_path, status_bar: MultiProgressBar, operation_factory=Operation,
+                 tag_filter: TagFilter = None, reuse=None, decode_cache: DwarfDecodeCache = decode_cache,
+                 recent_first=False, debug_dirs=None, name_index=False):
+        """
+        :param operation_factory: creates the Operation every task stores its tags with,
+                                  e.g. a MemoryOperation to keep them out of the database
+        :param tag_filter: the compile units, files and kinds of tags indexed, all of them if None
+        :param reuse: an IncrementalIndex, the compile units whose tags it keeps are not parsed again
+        :param decode_cache: caches the strings and abbreviation tables decoded by the tasks
+        :param recent_first: the compile units whose source files were modified most recently are parsed first,
+                             they are found all before the first one is parsed
+        :param debug_dirs: searched for the debug file of a stripped binary, see find_separate_debug_file,
+                           DEBUG_DIRS if None
+        :param name_index: only the global names listed by the .gdb_index of the binary are parsed, see
+                           DwarfNameIndexParseTask, the binaries without one are parsed fully
+        """
+        # the binary indexed
+        self.file_path = file_path
         self._elf_file = ELFFile(open(file_path, 'rb'))
+        # the DWARF of a stripped binary is read from its debug file, the binary is still the one indexed
+        self.debug_file_path = None
+        if not has_debug_sections(self._elf_file):
+            debug_file_path = find_separate_debug_file(
+                self._elf_file, file_path, debug_dirs if debug_dirs is not None else DEBUG_DIRS
+            )
+            if debug_file_path is not None:
+                self._elf_file.stream.close()
+                self._elf_file = ELFFile(open(debug_file_path, 'rb'))
+                self.debug_file_path = debug_file_path
         self._status_bar = status_bar
+        self._operation_factory = operation_factory
+        self._tag_filter = tag_filter
+        self._reuse = reuse
+        self._decode_cache = decode_cache
+        self._recent_first = recent_first
+        self._name_index = name_index
+        self._dwarf_info = None
+        # of the .debug_types sections
+        self._types_infos = list()
+
+    def has_debug_info(self):
+        return has_debug_sections(self._elf_file)
+
+    def close(self):
+        """
+        Called once the tasks have run, e.g. by a process indexing again and again
+        """
+        if self._dwarf_info is not None:
+            DwarfInfoParseTask.clear_dwarf_buffer(self._dwarf_info)
+        for types_info in self._types_infos:
+            DwarfInfoParseTask.clear_dwarf_buffer(types_info)
+        self._elf_file.stream.close()
+
+    def _get_build_id(self):
+        return get_build_id(self._elf_file)
+
+    def get_binary_id(self):
+        """
+        :return: the NT_GNU_BUILD_ID of the binary, or a hash of its debug sections if it has no build-id
+        """
+        build_id = self._get_build_id()
+        if build_id is not None:
+            return 'build-id-' + build_id
+        digest = hashlib.sha1()
+        for section in self._elf_file.iter_sections():
+            if section.name.startswith('.debug_') or section.name.startswith('.zdebug_'):
+                digest.update(section.name.encode())
+                digest.update(section.data())
+        return 'sha1-' + digest.hexdigest()
+
+    def get_binary_stamp(self):
+        """
+        :return: the build-id, or the size and modification time of the binary, cheaper than get_binary_id
+                 to tell whether the binary has changed
+        """
+        build_id = self._get_build_id()
+        if build_id is not None:
+            return 'build-id-' + build_id
+        stat = os.stat(self.file_path)
+        return 'stat-{}-{}'.format(stat.st_size, stat.st_mtime_ns)
+
+    def _get_index_names(self, status_bar_index):
+        """
+        :return: .debug_info offset of the compile unit -> set of the global names it defines, listed by
+                 the .gdb_index of the binary, None if it has none
+        """
+        try:
+            gdb_index = GdbIndex.from_elf_file(self._elf_file)
+        except GdbIndexError as e:
+            self._status_bar.info(status_bar_index, 'Warning: {} in {}, all its DIEs are parsed.'.format(
+                e, self.file_path
+            ))
+            return None
+        if gdb_index is None:
+            self._status_bar.info(status_bar_index, 'No .gdb_index in {}, all its DIEs are parsed.'.format(
+                self.file_path
+            ))
+            return None
+        return gdb_index.get_names_by_cu()
+
+    def _get_type_units(self, dwarf_info: DWARFInfo):
+        """
+        :return: offset of the line program -> the TypeUnit emitted with the compile unit of the line program,
+                 every signature once
+        """
+        type_units = defaultdict(list)
+        signatures = set()
+        for type_unit in iter_type_units(self._elf_file, dwarf_info):
+            if type_unit.signature in signatures:
+                continue
+            signatures.add(type_unit.signature)
+            if len(self._types_infos) == 0 or self._types_infos[-1] is not type_unit.dwarfinfo:
+                self._types_infos.append(type_unit.dwarfinfo)
+                DwarfInfoParseTask.set_type_units_buffer(type_unit.dwarfinfo)
+            type_units[type_unit.get_stmt_list()].append(type_unit)
+        return type_units
 
     @staticmethod
-    def _get_file_id_map(cu: CompileUnit, op: Operation):
+    def _get_skeleton_cu_path(cu: CompileUnit, comp_dir):
+        """
+        :return: absolute path of the source file of a skeleton compile unit, which has no DW_AT_name,
+                 the first file of its line program
+        """
         line_program = cu.dwarfinfo.line_program_for_CU(cu)
-        index = 1
-        file_map = dict()
-        for file_entry in line_program['file_entry']:
-            file_name = bytes2str(file_entry.name)
-            dir_index = file_entry.dir_index
-            if dir_index > 0:
-                dir_path = line_program['include_directory'][dir_index - 1]
-            else:
-                dir_path = b'.'
-            file_map[index] = op.add_file(file_name, bytes2str(dir_path))
-            index += 1
-        file_id_map = dict()
-        for key in file_map:
-            file_id_map[key] = file_map[key].id
-        return file_id_map
+        if line_program is None or len(line_program['file_entry']) == 0:
+            return comp_dir
+        file_entry = line_program['file_entry'][0]
+        dir_index = file_entry.dir_index
+        dir_path = line_program['include_directory'][dir_index - 1] if dir_index > 0 else b'.'
+        return TagFilter.get_path(comp_dir, bytes2str(dir_path), bytes2str(file_entry.name))
 
-    def has_debug_info(self):
-        return self._elf_file.has_dwarf_info()
+    @staticmethod
+    def _get_source_mtime(cu_path):
+        try:
+            return os.stat(cu_path).st_mtime_ns
+        except OSError:
+            return -1
 
     def iter_tasks(self):
         if not self.has_debug_info():
             raise DwarfParseTaskGenerateError("Cannot find debug info")
 
         dwarf_info = self._elf_file.get_dwarf_info()
+        self._decode_cache.install(dwarf_info)
+        self._dwarf_info = dwarf_info
         DwarfInfoParseTask.set_dwarf_info_buffer(dwarf_info)
         status_bar_index = self._status_bar.get_an_index()
-
-        macro_cu_list = list()
-        macro_file_id_map_list = list()
-        cu_id = 0
-
-        op = Operation()
-        cus = list()
-        file_id_maps = list()
-        cu_index = 0
+        type_units = self._get_type_units(dwarf_info)
+        # .debug_info offset of the compile unit -> the global names it defines, None if every DIE is parsed
+        index_names = self._get_index_names(status_bar_index) if self._name_index else None
+
+        tag_filter = self._tag_filter
+        type_resolver = TypeReferenceResolver()
+        op = self._operation_factory()
+        binary_id, committed_cus = op.add_binary(self.file_path, self.get_binary_stamp())
+        if committed_cus is None:
+            op.close()
+            self._status_bar.info(status_bar_index, '{} is in the database already, skipped.'.format(self.file_path))
+            self._status_bar.return_an_index(status_bar_index)
+            return
+        # the parse tasks of the compile units with macros in the order of the macro lists, None if excluded
+        macro_parse_tasks = list()
+        # (modification time of the source file, task) if the recently modified ones are parsed first
+        held_tasks = list()
+        # the .dwo files of the split compile units which cannot be found
+        missing_dwo_paths = list()
+        cu_count = 0
         cu_offset = 0
+        # every task builds the file map of its compile unit, so it is yielded as soon as the compile unit is found
         for cu in dwarf_info.iter_CUs():
-            cu_index += 1
-            cus.append(cu)
-            file_id_maps.append(DwarfParseTaskGenerator._get_file_id_map(cu, op))
-            cu_offset += cu['unit_length'] + cu.structs.initial_length_field_size()
+            top_die = cu.get_top_DIE()
+            comp_dir, cu_path = DwarfInfoParseTask._get_cu_path(top_die)
+            # a skeleton compile unit of -gsplit-dwarf, its DIEs are in a .dwo file
+            dwo_path = get_dwo_path(top_die, self.file_path)
+            if dwo_path is not None and 'DW_AT_name' not in top_die.attributes:
+                cu_path = self._get_skeleton_cu_path(cu, comp_dir)
+            # parsed by the task of the compile unit they were emitted with, whose file map they share
+            cu_type_units = type_units.pop(top_die.attributes['DW_AT_stmt_list'].value, ()) \
+                if dwo_path is None and 'DW_AT_stmt_list' in top_die.attributes else ()
+            cu_size = cu['unit_length'] + cu.structs.initial_length_field_size()
+            cu_offset += cu_size
             self._status_bar.update(
                 status_bar_index,
-                (cu_offset / dwarf_info.debug_info_sec.size) * 0.5,
-                "Processing compile unit and file map {} / {}".format(
-                    cu_offset,
-                    dwarf_info.debug_info_sec.size
-                )
+                cu_offset / dwarf_info.debug_info_sec.size,
+                "Generating tasks {} / {}".format(cu_offset, dwarf_info.debug_info_sec.size)
             )
-
-        self._status_bar.update(status_bar_index, 0.5, "Committing file map...")
-
-        op.commit()
+            # the types of the headers it shares with the compile units accepted may only be in its type units,
+            # the tags in the files excluded are dropped by its file map then
+            if tag_filter is not None and tag_filter.filters_paths() and not tag_filter.accepts_path(cu_path) \
+                    and len(cu_type_units) == 0:
+                if 'DW_AT_macro_info' in top_die.attributes:
+                    macro_parse_tasks.append(None)
+                continue
+            if index_names is not None and dwo_path is None and cu.cu_offset not in index_names \
+                    and len(cu_type_units) == 0:
+                # it defines no global name
+                if 'DW_AT_macro_info' in top_die.attributes:
+                    macro_parse_tasks.append(None)
+                continue
+            if cu.cu_offset in committed_cus:
+                # committed by the interrupted run being resumed, its macros are committed apart
+                cu_id, macros_done = committed_cus[cu.cu_offset]
+                if 'DW_AT_macro_info' in top_die.attributes:
+                    task = None if macros_done else DwarfFileMapTask(
+                        cu, comp_dir, cu_id, self._status_bar, type_resolver, self._operation_factory(), tag_filter
+                    )
+                    macro_parse_tasks.append(task)
+                    if task is not None:
+                        yield task
+                continue
+            if self._reuse is not None and \
+                    self._reuse.find_compile_unit(self.file_path, cu, top_die, comp_dir) is not None:
+                # unchanged since its tags were parsed from the binary linked before, they are kept with its macros
+                if 'DW_AT_macro_info' in top_die.attributes:
+                    macro_parse_tasks.append(None)
+                continue
+            if dwo_path is not None and not os.path.isfile(dwo_path):
+                missing_dwo_paths.append(dwo_path)
+                if 'DW_AT_macro_info' in top_die.attributes:
+                    macro_parse_tasks.append(None)
+                continue
+            # the compile units of all the binaries indexed together have distinct ids
+            if dwo_path is not None:
+                # the DIE offsets of every .dwo file start from 0, they are resolved apart from the binary
+                task = DwarfDwoParseTask(
+                    cu, dwo_path, comp_dir, op.new_compile_unit_ids(1), self._status_bar, TypeReferenceResolver(),
+                    self._operation_factory(), tag_filter, binary_id
+                )
+            elif index_names is not None:
+                task = DwarfNameIndexParseTask(
+                    cu, index_names.get(cu.cu_offset, frozenset()), comp_dir, op.new_compile_unit_ids(1),
+                    self._status_bar, type_resolver, self._operation_factory(), tag_filter, binary_id, cu_type_units
+                )
+            else:
+                task = DwarfInfoParseTask(
+                    cu, comp_dir, op.new_compile_unit_ids(1), self._status_bar, type_resolver,
+                    self._operation_factory(), tag_filter, binary_id, cu_type_units
+                )
+            if self._reuse is not None:
+                self._reuse.add_compile_unit(self.file_path, top_die, comp_dir, task.index)
+            # before the task is started, which reads the compile unit with streams of its own
+            if 'DW_AT_macro_info' in top_die.attributes:
+                macro_parse_tasks.append(task)
+            cu_count += 1
+            # like cus_total, only the compile units parsed count, e.g. not the ones committed before --resume
+            self._status_bar.record('cus_total')
+            self._status_bar.record('bytes_total', cu_size)
+            if self._recent_first:
+                held_tasks.append((self._get_source_mtime(cu_path), task))
+            else:
+                yield task
         op.close()
-
-        self._status_bar.update(status_bar_index, 0.9, "File map committed...")
-
-        for cu, file_id_map in zip(cus, file_id_maps):
-            self._status_bar.update(status_bar_index, 0.9 + (cu_id / len(cus)) * 0.1, "Generating tasks {}...".format(cu_id))
-            yield DwarfInfoParseTask(cu, file_id_map, cu_id, self._status_bar)
-            if 'DW_AT_macro_info' in cu.get_top_DIE().attributes:
-                macro_cu_list.append(cu_id)
-                macro_file_id_map_list.append(file_id_map)
-            cu_id += 1
-
-        self._status_bar.update(status_bar_index, 1, "Generating tasks {}...".format(cu_id + 1))
-        yield DwarfMacroParseTask(
-            Macro.get_macro_info_from_elffile(self._elf_file), macro_cu_list, macro_file_id_map_list, self._status_bar
-        )
+        if len(type_units) != 0:
+            self._status_bar.info(status_bar_index, 'Warning: {} type units of no compile unit, skipped.'.format(
+                sum(len(units) for units in type_units.values())
+            ))
+        if len(missing_dwo_paths) != 0:
+            self._status_bar.info(status_bar_index, 'Warning: {} .dwo files not found, e.g. {}, skipped.'.format(
+                len(missing_dwo_paths), missing_dwo_paths[0]
+            ))
+        # the developers are working on the sources modified most recently, sorted stably
+        held_tasks.sort(key=lambda item: item[0], reverse=True)
+        for _, task in held_tasks:
+            yield task
+
+        self._status_bar.update(status_bar_index, 1, "Generating tasks {}...".format(cu_count))
+        macro = Macro.get_macro_info_from_elffile(self._elf_file) \
+            if tag_filter is None or tag_filter.accepts_kind(TagType.Macro) else None
+        if macro is not None:
+            yield DwarfMacroParseTask(macro, macro_parse_tasks, self._status_bar, self._operation_factory())
+        yield TypeReferenceResolveTask(type_resolver, self._status_bar, self._operation_factory(), binary_id)
         self._status_bar.update(status_bar_index, 1, "Done")
         self._status_bar.return_an_index(status_bar_index)
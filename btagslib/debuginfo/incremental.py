@@ -0,0 +1,194 @@
+from elftools.dwarf.compileunit import CompileUnit
+from elftools.common.py3compat import bytes2str
+import time
+import os
+from .dwarfformat import DwarfParseTaskGenerator
+from btagslib.elftoolsext.dwarfcache import DwarfDecodeCache, decode_cache
+from .runner import open_task_generators, get_runner
+from .tagfilter import TagFilter
+from btagslib.db.memory import TagRecordStore, MemoryOperation
+from btagslib.terminal.statusbar import MultiProgressBar
+from btagslib.statpoller import StatPoller
+
+
+class IncrementalIndex:
+    """
+    Keeps the tags of binaries in a TagRecordStore while they are linked again and again, and only parses
+    the compile units which may have changed since the last update.
+
+    A compile unit is known by its compile directory, source file and producer (the compiler and its
+    switches), not by its DIEs: every address, string offset and line program offset in them moves when
+    anything linked before it changes. Like make, it is taken for unchanged if none of the files of its
+    line program has been modified since the binary its tags were parsed from was linked.
+    """
+    def __init__(self, status_bar: MultiProgressBar, jobs=1, tag_filter: TagFilter = None,
+                 decode_cache: DwarfDecodeCache = decode_cache, max_memory=None, debug_dirs=None,
+                 name_index=False):
+        """
+        :param max_memory: bytes to stay under while parsing, see Runner
+        :param debug_dirs: searched for the debug files of stripped binaries, see DwarfParseTaskGenerator
+        :param name_index: only the global names listed by the .gdb_index of the binaries are parsed
+        """
+        self.store = TagRecordStore()
+        self._decode_cache = decode_cache
+        self._status_bar = status_bar
+        self._jobs = jobs
+        self._max_memory = max_memory
+        self._debug_dirs = debug_dirs
+        self._name_index = name_index
+        self._tag_filter = tag_filter
+        # binary path -> {compile unit key: (compile unit id, modification time of the binary parsed)}
+        self._compile_units = dict()
+        # binary path -> stamp of the binary, see DwarfParseTaskGenerator.get_binary_stamp
+        self._stamps = dict()
+        # of the update running: the compile units found in the binaries and the modification times
+        self._found = dict()
+        self._linked = dict()
+        self._file_mtimes = dict()
+        self.parsed_count = 0
+        self.reused_count = 0
+
+    def update(self, paths):
+        """
+        Brings the tags of the binaries up to date, the tags of the compile units no longer
+        in them are dropped
+        :param paths: the binaries which may have changed, all of them the first time
+        :return: whether any tags have changed
+        """
+        self._found = dict()
+        self._linked = dict()
+        self._file_mtimes = dict()
+        self.parsed_count = 0
+        self.reused_count = 0
+        task_generators = list()
+        stamps = dict()
+        for task_generator in open_task_generators(paths, self._status_bar, self._open):
+            path = task_generator.file_path
+            stamps[path] = task_generator.get_binary_stamp()
+            # e.g. touched, or linked again from the same objects
+            if stamps[path] == self._stamps.get(path):
+                task_generator.close()
+                continue
+            self._found[path] = dict()
+            task_generators.append(task_generator)
+        if len(task_generators) == 0:
+            return False
+
+        try:
+            get_runner(task_generators, self._jobs, self._status_bar, self._max_memory).run()
+        except BaseException:
+            # the tags kept stay as they were, the compile units are parsed again on the next update
+            for path in self._found:
+                kept_ids = self._get_kept_ids(path)
+                self.store.remove_compile_units(
+                    cu_id for cu_id, _ in self._found[path].values() if cu_id not in kept_ids
+                )
+            raise
+        finally:
+            for task_generator in task_generators:
+                task_generator.close()
+
+        for path in self._found:
+            kept_ids = set(cu_id for cu_id, _ in self._found[path].values())
+            self.store.remove_compile_units(cu_id for cu_id in self._get_kept_ids(path) if cu_id not in kept_ids)
+            self._compile_units[path] = self._found[path]
+            self._stamps[path] = stamps[path]
+        return True
+
+    def _open(self, path):
+        # before the binary is read, a binary linked again meanwhile is parsed again on the next update
+        self._linked[path] = os.stat(path).st_mtime_ns
+        return DwarfParseTaskGenerator(
+            path, self._status_bar, lambda: MemoryOperation(self.store), self._tag_filter, self,
+            self._decode_cache, debug_dirs=self._debug_dirs, name_index=self._name_index
+        )
+
+    def _get_kept_ids(self, path):
+        return set(cu_id for cu_id, _ in self._compile_units.get(path, dict()).values())
+
+    @staticmethod
+    def _get_key(top_die, comp_dir, found):
+        """
+        :return: the key of the compile unit, the same source may be compiled into a binary several times
+        """
+        attributes = top_die.attributes
+        key = (
+            comp_dir,
+            # a skeleton compile unit of -gsplit-dwarf has the name of its .dwo file instead
+            bytes2str(attributes['DW_AT_name'].value) if 'DW_AT_name' in attributes else
+            bytes2str(attributes['DW_AT_GNU_dwo_name'].value) if 'DW_AT_GNU_dwo_name' in attributes else '',
+            bytes2str(attributes['DW_AT_producer'].value) if 'DW_AT_producer' in attributes else ''
+        )
+        occurrence = 0
+        while key + (occurrence,) in found:
+            occurrence += 1
+        return key + (occurrence,)
+
+    def _get_file_mtime(self, path):
+        mtime = self._file_mtimes.get(path, 0)
+        if mtime == 0:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime = None
+            self._file_mtimes[path] = mtime
+        return mtime
+
+    def _is_unchanged(self, cu: CompileUnit, comp_dir, linked):
+        line_program = cu.dwarfinfo.line_program_for_CU(cu)
+        if line_program is None:
+            return False
+        for file_entry in line_program['file_entry']:
+            dir_index = file_entry.dir_index
+            dir_path = line_program['include_directory'][dir_index - 1] if dir_index > 0 else b'.'
+            file_path = TagFilter.get_path(comp_dir, bytes2str(dir_path), bytes2str(file_entry.name))
+            mtime = self._get_file_mtime(file_path)
+            # a file which cannot be found may have changed as well
+            if mtime is None or mtime >= linked:
+                return False
+        return True
+
+    def find_compile_unit(self, path, cu: CompileUnit, top_die, comp_dir):
+        """
+        Called by the task generator for every compile unit of a binary being updated
+        :return: id of the compile unit whose tags are kept, None if it has to be parsed
+        """
+        found = self._found[path]
+        key = self._get_key(top_die, comp_dir, found)
+        kept = self._compile_units.get(path, dict()).get(key)
+        if kept is None or not self._is_unchanged(cu, comp_dir, kept[1]):
+            return None
+        found[key] = kept
+        self.reused_count += 1
+        return kept[0]
+
+    def add_compile_unit(self, path, top_die, comp_dir, cu_id):
+        """
+        Called by the task generator for every compile unit of a binary being updated which is parsed
+        """
+        found = self._found[path]
+        found[self._get_key(top_die, comp_dir, found)] = (cu_id, self._linked[path])
+        self.parsed_count += 1
+
+
+class BinaryWatcher:
+    """
+    Polls the binaries like LookupServer polls the database, a binary is taken for linked
+    once it has stopped changing, see StatPoller
+    """
+    def __init__(self, paths, interval=1.0):
+        self._interval = interval
+        self._poller = StatPoller(paths)
+
+    def wait_changed(self):
+        """
+        Blocks until a binary has changed
+        :return: the paths of the binaries changed
+        """
+        while True:
+            time.sleep(self._interval)
+            changed = self._poller.poll()
+            if len(changed) != 0:
+                for path, stat in changed.items():
+                    self._poller.take(path, stat)
+                return list(changed)
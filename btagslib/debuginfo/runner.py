@@ -1,9 +1,17 @@
 from concurrent.futures.thread import ThreadPoolExecutor as PoolExecutor
 from concurrent.futures import as_completed
+from collections import deque
+from threading import Condition
 from btagslib.terminal.statusbar import MultiProgressBar, get_status_bar_decorator
+from btagslib.profiling.profiler import profiler, get_rss
 
 
 class Task:
+    # if set, the runner starts the task only after every task generated before it has finished
+    wait_for_previous = False
+    # bytes the task is expected to take while it runs, limited by the memory budget of the runner if not 0
+    memory_estimate = 0
+
     def _before_run(self):
         pass
 
@@ -23,31 +31,196 @@ class RunnerError(Exception):
     pass
 
 
+class ChainedTaskGenerator:
+    """
+    The tasks of several task generators, e.g. of many binaries, run by one Runner.
+    The tasks waiting for the previous ones are held back until the other generators
+    are exhausted, otherwise they would keep the tasks of the next generators out of the pool.
+    """
+    def __init__(self, task_generators):
+        self._task_generators = task_generators
+
+    def iter_tasks(self):
+        held_back = list()
+        for task_generator in self._task_generators:
+            for task in task_generator.iter_tasks():
+                if task.wait_for_previous:
+                    held_back.append(task)
+                else:
+                    yield task
+        for task in held_back:
+            yield task
+
+
+class MemoryBudget:
+    """
+    Admits the tasks while the memory they are estimated to take fits into the budget along with the memory
+    of the process, first come first served: a task too large to run beside the ones running waits for them
+    to finish rather than being overtaken by smaller ones for ever, and the ones after it wait behind it.
+    A task is always admitted if no other is running, even if it does not fit.
+
+    The memory of the process is sampled while the tasks are admitted, it covers what is taken besides the
+    tasks, e.g. the caches and the tags kept in memory, and the tasks taking more than estimated.
+    """
+    # seconds between two samples of the memory while a task is waiting
+    poll_interval = 0.1
+
+    def __init__(self, max_memory):
+        """
+        :param max_memory: bytes the process should stay under
+        """
+        self._max_memory = max_memory
+        self._condition = Condition()
+        # the tasks waiting to be admitted, in the order they asked
+        self._waiting = deque()
+        # sum of the estimates of the tasks admitted and not released yet
+        self._used = 0
+        self._running = 0
+        self._closed = False
+        # what is taken besides the tasks
+        self._base = get_rss() or 0
+
+    def _fits(self, memory_estimate):
+        if self._running == 0:
+            return True
+        rss = get_rss()
+        # the estimates of the tasks running are counted in full, they may not have taken it all yet
+        return max(self._base + self._used, rss or 0) + memory_estimate <= self._max_memory
+
+    def acquire(self, memory_estimate):
+        """
+        Blocks until the task is admitted
+        """
+        if memory_estimate == 0:
+            # e.g. the tasks waiting for the others, they would hold the others back
+            return
+        with self._condition:
+            ticket = object()
+            self._waiting.append(ticket)
+            try:
+                while not self._closed and (self._waiting[0] is not ticket or not self._fits(memory_estimate)):
+                    self._condition.wait(self.poll_interval)
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+            if self._closed:
+                raise RunnerError("Cancelled before started")
+            self._used += memory_estimate
+            self._running += 1
+
+    def release(self, memory_estimate):
+        if memory_estimate == 0:
+            return
+        with self._condition:
+            self._used -= memory_estimate
+            self._running -= 1
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        The tasks waiting are not admitted any more, e.g. the run is interrupted
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
 class Runner:
-    def __init__(self, task_generator, concurrency_level, status_bar: MultiProgressBar):
+    def __init__(self, task_generator, concurrency_level, status_bar: MultiProgressBar, max_memory=None):
+        """
+        :param concurrency_level: the most tasks run at once
+        :param max_memory: bytes the process should stay under, fewer tasks are run at once when they are
+                           estimated to take more, see MemoryBudget
+        """
         self.task_generator = task_generator
         self._concurrency_level = concurrency_level
+        self._memory_budget = MemoryBudget(max_memory) if max_memory is not None else None
         self._status_bar = status_bar
         self._status_bar_index = status_bar.get_an_index()
         self._status_bar_decorator = get_status_bar_decorator(status_bar, self._status_bar_index)
         self.task_submitted = list()
+        self.task_deferred = list()
 
     def submit_task(self, executor: PoolExecutor):
         i = 0
         for task in self.task_generator.iter_tasks():
             i += 1
-            self.task_submitted.append(executor.submit(task.start))
+            if task.wait_for_previous or len(self.task_deferred) != 0:
+                # waiting here would hold back the generation of the tasks after it
+                self.task_deferred.append(task)
+            else:
+                self.task_submitted.append(executor.submit(profiler.call, self._start_task, task))
+
+    def _start_task(self, task: Task):
+        if self._memory_budget is None:
+            task.start()
+            return
+        self._memory_budget.acquire(task.memory_estimate)
+        try:
+            task.start()
+        finally:
+            self._memory_budget.release(task.memory_estimate)
 
     def run(self):
         with PoolExecutor(max_workers=self._concurrency_level) as executor:
-            add_task_future = executor.submit(self.submit_task, executor)
             try:
-                add_task_future.result()
-            except Exception as e:
-                raise RunnerError("Error when add task: {}".format(e))
-
-            @self._status_bar_decorator(0, 1, len(self.task_submitted), "Task finished {0}/{1}", True)
-            def get_result(future):
-                future.result()
-            for future in as_completed(self.task_submitted):
-                get_result(future)
+                self._run_tasks(executor)
+            except BaseException:
+                # on an error or Ctrl-C the tasks not started yet are dropped rather than waited for,
+                # the running ones finish their commits, and the run can be resumed from there
+                for future in self.task_submitted:
+                    future.cancel()
+                if self._memory_budget is not None:
+                    self._memory_budget.close()
+                raise
+            finally:
+                self._status_bar.return_an_index(self._status_bar_index)
+
+    def _run_tasks(self, executor: PoolExecutor):
+        # the tasks are generated in this thread rather than in the pool, so every worker
+        # parses as soon as the first task is generated, even if there is only one
+        try:
+            profiler.call(self.submit_task, executor)
+        except Exception as e:
+            raise RunnerError("Error when add task: {}".format(e))
+
+        @self._status_bar_decorator(0, 1, len(self.task_submitted), "Task finished {0}/{1}", True)
+        def get_result(future):
+            future.result()
+        for future in as_completed(self.task_submitted):
+            get_result(future)
+
+        for task in self.task_deferred:
+            if task.wait_for_previous:
+                self._wait_submitted()
+            self.task_submitted.append(executor.submit(profiler.call, self._start_task, task))
+        self._wait_submitted()
+
+    def _wait_submitted(self):
+        for future in self.task_submitted:
+            future.result()
+
+
+def open_task_generators(paths, status_bar: MultiProgressBar, task_generator_factory):
+    """
+    :param task_generator_factory: called with the path of every binary, creates its task generator
+    :return: the task generators of the binaries with debug info, the other ones are closed and skipped
+    """
+    task_generators = list()
+    for path in paths:
+        task_generator = task_generator_factory(path)
+        if task_generator.has_debug_info():
+            task_generators.append(task_generator)
+        else:
+            task_generator.close()
+            status_bar.info(None, 'No debug info found in {}, skipped.'.format(path))
+    return task_generators
+
+
+def get_runner(task_generators, concurrency_level, status_bar: MultiProgressBar, max_memory=None):
+    """
+    :return: the Runner of the tasks of all the task generators, the compile units of all the binaries
+             share one pool, files and tags of shared headers are stored once
+    """
+    task_generator = task_generators[0] if len(task_generators) == 1 else ChainedTaskGenerator(task_generators)
+    return Runner(task_generator, concurrency_level, status_bar, max_memory)
@@ -0,0 +1,64 @@
+from fnmatch import fnmatchcase
+import hashlib
+from os.path import normpath, join, dirname
+
+
+class TagFilter:
+    """
+    Decides before the DIEs are parsed which compile units, files and kinds of tags
+    are indexed, so nothing is decoded for the others.
+
+    A path is accepted if it or one of its parent directories matches an include glob,
+    or there is no include glob, and neither it nor a parent directory matches an
+    exclude glob, e.g. --exclude /usr/include drops the system headers.
+    """
+    def __init__(self, includes=None, excludes=None, kinds=None):
+        """
+        :param includes: globs of the absolute paths indexed
+        :param excludes: globs of the absolute paths not indexed
+        :param kinds: the TagType of the tags indexed, all of them if None
+        """
+        self._includes = [normpath(glob) for glob in includes] if includes is not None else []
+        self._excludes = [normpath(glob) for glob in excludes] if excludes is not None else []
+        self._kinds = set(kinds) if kinds is not None else None
+        # path -> accepted, the same headers are included by most compile units
+        self._accepted = dict()
+
+    def get_id(self):
+        """
+        :return: a digest of the filters, the databases of a binary indexed with different filters are cached apart
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((self._includes, self._excludes, sorted(self._kinds or []))).encode())
+        return digest.hexdigest()[:16]
+
+    def filters_paths(self):
+        return len(self._includes) != 0 or len(self._excludes) != 0
+
+    @staticmethod
+    def get_path(comp_dir, *parts):
+        """
+        :return: the absolute path of a file of a compile unit, the parts are relative to *comp_dir*
+        """
+        return normpath(join(comp_dir, *parts))
+
+    @staticmethod
+    def _matches(path, globs):
+        while True:
+            if any(fnmatchcase(path, glob) for glob in globs):
+                return True
+            parent = dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def accepts_path(self, path):
+        accepted = self._accepted.get(path)
+        if accepted is None:
+            accepted = (len(self._includes) == 0 or self._matches(path, self._includes)) and \
+                not self._matches(path, self._excludes)
+            self._accepted[path] = accepted
+        return accepted
+
+    def accepts_kind(self, tag_type):
+        return self._kinds is None or tag_type in self._kinds
@@ -0,0 +1,120 @@
+from threading import Lock
+
+
+REFERENCE_FORMS = frozenset(['DW_FORM_ref1', 'DW_FORM_ref2', 'DW_FORM_ref4', 'DW_FORM_ref8', 'DW_FORM_ref_udata'])
+
+
+def get_signature_key(signature):
+    """
+    :return: key of the type unit of the signature, the DIE offsets are positive so it is negative
+    """
+    return -1 - signature
+
+
+def get_type_ref_offset(die, key_base=0):
+    """
+    :param key_base: of the type unit of the DIE, see TypeUnit
+    :return: .debug_info offset of the DIE referenced by DW_AT_type, or its key if it is in a type unit,
+             None if there is no such reference
+    """
+    attr = die.attributes.get('DW_AT_type')
+    if attr is None:
+        return None
+    if attr.form in REFERENCE_FORMS:
+        return attr.value + die.cu.cu_offset + key_base
+    elif attr.form == 'DW_FORM_ref_addr':
+        return attr.value
+    elif attr.form == 'DW_FORM_ref_sig8':
+        return get_signature_key(attr.value)
+    return None
+
+
+class TypeReferenceResolver:
+    """
+    Resolves DW_AT_type references to tags for a whole binary, keyed by integer
+    DIE offsets, so a reference may cross compile units (DW_FORM_ref_addr).
+
+    The DIEs of the type units are keyed by their offset in .debug_types plus a base, and a
+    type unit by its signature, see get_signature_key.
+
+    DIEs which are not tags themselves (pointer, const, volatile types...) are
+    links to the DIE they reference, *find* follows the links to the first DIE
+    which is a tag. Like union-find, every link walked is then pointed straight
+    at the end of the chain, so each chain is walked once per binary.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._links = dict()
+        self._tag_ids = dict()
+        self._pending = list()
+
+    def add_links(self, offset_ref_offset_pairs):
+        with self._lock:
+            self._links.update(offset_ref_offset_pairs)
+
+    def add_tags(self, offset_tag_id_pairs):
+        with self._lock:
+            self._tag_ids.update(offset_tag_id_pairs)
+
+    def add_pending(self, tag_id_ref_offset_pairs):
+        """
+        Remember tags whose assoc_to_tag is the tag at the referenced offset
+        """
+        with self._lock:
+            self._pending.extend(tag_id_ref_offset_pairs)
+
+    def _find_end(self, offset):
+        """
+        Called with the lock held
+        :return: offset of the DIE the chain starting at *offset* ends at
+        """
+        path = list()
+        visited = set()
+        while offset not in self._tag_ids and offset in self._links and offset not in visited:
+            visited.add(offset)
+            path.append(offset)
+            offset = self._links[offset]
+        for linked in path:
+            self._links[linked] = offset
+        return offset
+
+    def find(self, offset):
+        """
+        :return: id of the tag *offset* resolves to, None if the chain ends without one
+        """
+        with self._lock:
+            return self._tag_ids.get(self._find_end(offset))
+
+    def resolve_local(self, begin, end):
+        """
+        Given the links and tags of one compile unit only, resolve the references which stay in it,
+        most of them do, so they are committed with the compile unit.
+        :param begin: .debug_info offset of the compile unit
+        :param end: .debug_info offset after the compile unit
+        :return: list of (tag id, id of the tag it is associated to), and the pending references leaving
+                 the compile unit, for the resolver of the whole binary
+        """
+        resolved = list()
+        leaving = list()
+        with self._lock:
+            for tag_id, ref_offset in self._pending:
+                offset = self._find_end(ref_offset)
+                assoc_tag_id = self._tag_ids.get(offset)
+                if assoc_tag_id is not None:
+                    if assoc_tag_id != tag_id:
+                        resolved.append((tag_id, assoc_tag_id))
+                elif not begin <= offset < end:
+                    leaving.append((tag_id, ref_offset))
+        return resolved, leaving
+
+    def iter_resolved(self):
+        """
+        :return: iterator of (tag id, id of the tag it is associated to)
+        """
+        for tag_id, ref_offset in self._pending:
+            assoc_tag_id = self.find(ref_offset)
+            if assoc_tag_id is not None and assoc_tag_id != tag_id:
+                yield tag_id, assoc_tag_id
+
+    def pending_count(self):
+        return len(self._pending)
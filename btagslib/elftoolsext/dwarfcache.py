@@ -0,0 +1,92 @@
+from elftools.dwarf.dwarfinfo import DWARFInfo
+from elftools.common.py3compat import bytes2str
+from collections import OrderedDict
+from itertools import count
+from threading import Lock
+import sys
+
+
+class LRUCache(object):
+    """
+    A thread safe dict which forgets the least recently used items beyond *max_size*.
+    The loader is called with the lock held, so it may use streams shared by all threads.
+    """
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._items = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                value = loader()
+                self._items[key] = value
+                if len(self._items) > self._max_size:
+                    self._items.popitem(last=False)
+            else:
+                self.hits += 1
+                self._items.move_to_end(key)
+            return value
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DwarfDecodeCache(object):
+    """
+    Process wide caches of what all compile units of a binary share:
+    the strings of .debug_str by offset and the abbreviation tables of
+    .debug_abbrev by offset.
+
+    *install* redirects the string and abbreviation table lookups of a
+    DWARFInfo to these caches, so the DIE parser of every task benefits.
+    The module wide decode_cache is used unless another one is installed,
+    e.g. by an Indexer keeping its caches warm between runs.
+    """
+    def __init__(self, max_strings=1 << 20, max_abbrev_tables=4096):
+        self._raw_strings = LRUCache(max_strings)
+        self._names = LRUCache(max_strings)
+        self._abbrev_tables = LRUCache(max_abbrev_tables)
+        self._tokens = count()
+
+    def install(self, dwarf_info: DWARFInfo):
+        if hasattr(dwarf_info, '_btags_cache_token'):
+            return
+        token = next(self._tokens)
+        dwarf_info._btags_cache_token = token
+        dwarf_info._btags_decode_cache = self
+        get_string_from_table = dwarf_info.get_string_from_table
+        get_abbrev_table = dwarf_info.get_abbrev_table
+
+        dwarf_info.get_string_from_table = lambda offset: self._raw_strings.get(
+            (token, offset), lambda: get_string_from_table(offset)
+        )
+        dwarf_info.get_abbrev_table = lambda offset: self._abbrev_tables.get(
+            (token, offset), lambda: get_abbrev_table(offset)
+        )
+
+    def get_name(self, dwarf_info: DWARFInfo, offset):
+        """
+        :return: the interned str at *offset* of .debug_str, decoded once per binary
+        """
+        self.install(dwarf_info)
+        token = dwarf_info._btags_cache_token
+        return self._names.get(
+            (token, offset), lambda: sys.intern(bytes2str(dwarf_info.get_string_from_table(offset)).strip())
+        )
+
+
+decode_cache = DwarfDecodeCache()
+
+
+def get_decode_cache(dwarf_info: DWARFInfo):
+    """
+    :rtype: DwarfDecodeCache
+    :return: the cache installed on the DWARFInfo, or its copies, decode_cache if none is
+    """
+    return getattr(dwarf_info, '_btags_decode_cache', decode_cache)
@@ -0,0 +1,75 @@
+from elftools.elf.elffile import ELFFile
+from collections import defaultdict
+import struct
+
+
+# the kinds of the symbols of the version 7 and 8 of the index, in bits 28 to 30 of a CU vector entry
+SYMBOL_KINDS = {0: 'none', 1: 'type', 2: 'variable', 3: 'function', 4: 'other'}
+
+
+class GdbIndexError(Exception):
+    pass
+
+
+class GdbIndex(object):
+    """
+    The .gdb_index section, e.g. of ``gold --gdb-index`` or ``gdb-add-index``: a hash table of the global
+    names, every one with the compile units or type units defining it. It tells which compile units define
+    which names without reading their DIEs.
+    """
+    def __init__(self, data):
+        if len(data) < 24:
+            raise GdbIndexError('Truncated .gdb_index')
+        self.version, cu_list_offset, types_list_offset, _, symbol_table_offset, constant_pool_offset = \
+            struct.unpack_from('<6I', data, 0)
+        # the versions before 7 do not tell the symbol kinds, and have been superseded for years
+        if self.version not in (7, 8):
+            raise GdbIndexError('Unsupported .gdb_index version {}'.format(self.version))
+        self._data = data
+        # .debug_info offset of every compile unit
+        self.cu_offsets = [
+            struct.unpack_from('<Q', data, offset)[0] for offset in range(cu_list_offset, types_list_offset, 16)
+        ]
+        self._symbol_table_offset = symbol_table_offset
+        self._constant_pool_offset = constant_pool_offset
+
+    @staticmethod
+    def from_elf_file(elf_file: ELFFile):
+        """
+        :return: the GdbIndex of the ELF file, None if it has none
+        """
+        section = elf_file.get_section_by_name('.gdb_index')
+        return GdbIndex(section.data()) if section is not None else None
+
+    def _get_string(self, offset):
+        end = self._data.index(b'\0', offset)
+        return self._data[offset:end].decode('utf-8', 'replace')
+
+    def iter_symbols(self):
+        """
+        :return: iterator of (name, list of (index of the compile unit, symbol kind, whether it is static)),
+                 the indexes past the compile units are of type units
+        """
+        data = self._data
+        for slot in range(self._symbol_table_offset, self._constant_pool_offset, 8):
+            name_offset, vector_offset = struct.unpack_from('<2I', data, slot)
+            if name_offset == 0 and vector_offset == 0:
+                continue
+            vector_offset += self._constant_pool_offset
+            count = struct.unpack_from('<I', data, vector_offset)[0]
+            entries = list()
+            for value in struct.unpack_from('<%dI' % count, data, vector_offset + 4):
+                entries.append((value & 0xffffff, SYMBOL_KINDS.get((value >> 28) & 7, 'none'), bool(value >> 31)))
+            yield self._get_string(self._constant_pool_offset + name_offset), entries
+
+    def get_names_by_cu(self):
+        """
+        :return: .debug_info offset of the compile unit -> set of the names it defines
+        """
+        names = defaultdict(set)
+        cu_count = len(self.cu_offsets)
+        for name, entries in self.iter_symbols():
+            for cu_index, _, _ in entries:
+                if cu_index < cu_count:
+                    names[self.cu_offsets[cu_index]].add(name)
+        return names
@@ -0,0 +1,187 @@
+from elftools.elf.elffile import ELFFile
+from elftools.dwarf.dwarfinfo import DWARFInfo, DwarfConfig, DebugSectionDescriptor
+from elftools.dwarf.structs import DWARFStructs
+from elftools.dwarf.enums import ENUM_DW_AT
+from elftools.common.py3compat import bytes2str
+from io import BytesIO
+import struct
+import zlib
+import os
+
+
+# the attributes of -gsplit-dwarf before DWARF 5, not known to older pyelftools
+for _name, _code in (('DW_AT_GNU_dwo_name', 0x2130), ('DW_AT_GNU_dwo_id', 0x2131),
+                     ('DW_AT_GNU_ranges_base', 0x2132), ('DW_AT_GNU_addr_base', 0x2133),
+                     ('DW_AT_GNU_pubnames', 0x2134), ('DW_AT_GNU_pubtypes', 0x2135)):
+    ENUM_DW_AT.setdefault(_name, _code)
+
+_create_dw_form = DWARFStructs._create_dw_form
+
+
+def _create_split_dw_form(self):
+    """
+    The index forms of the .dwo files, an index into .debug_str_offsets.dwo or .debug_addr
+    """
+    _create_dw_form(self)
+    for form in ('DW_FORM_GNU_str_index', 'DW_FORM_GNU_addr_index', 'DW_FORM_strx', 'DW_FORM_addrx'):
+        self.Dwarf_dw_form.setdefault(form, self.Dwarf_uleb128(''))
+
+
+DWARFStructs._create_dw_form = _create_split_dw_form
+
+STR_INDEX_FORMS = frozenset(['DW_FORM_GNU_str_index', 'DW_FORM_strx'])
+
+# where the debug files of the stripped binaries are installed, e.g. by the -dbg packages
+DEBUG_DIRS = ('/usr/lib/debug',)
+
+
+class DwoFileError(Exception):
+    pass
+
+
+class DwoFile(object):
+    """
+    A .dwo file of -gsplit-dwarf, the DIEs of a compile unit whose skeleton is in the binary.
+    Its sections are named .debug_*.dwo, and its strings are referred to by index.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            elf_file = ELFFile(BytesIO(stream.read()))
+        sections = dict()
+        for section in elf_file.iter_sections():
+            if section.name.startswith('.debug_') and section.name.endswith('.dwo'):
+                sections[section.name[:-len('.dwo')]] = section
+        if '.debug_info' not in sections or '.debug_abbrev' not in sections:
+            raise DwoFileError('No debug info found in {}'.format(path))
+
+        def get_section(name):
+            section = sections.get(name)
+            if section is None:
+                return None
+            return DebugSectionDescriptor(
+                stream=BytesIO(section.data()), name=section.name, global_offset=section['sh_offset'],
+                size=section['sh_size'], address=section['sh_addr']
+            )
+        self.dwarf_info = DWARFInfo(
+            config=DwarfConfig(
+                little_endian=elf_file.little_endian, default_address_size=elf_file.elfclass // 8,
+                machine_arch=elf_file.get_machine_arch()
+            ),
+            debug_info_sec=get_section('.debug_info'), debug_aranges_sec=None,
+            debug_abbrev_sec=get_section('.debug_abbrev'), debug_frame_sec=None, eh_frame_sec=None,
+            debug_str_sec=get_section('.debug_str'), debug_loc_sec=None, debug_ranges_sec=None,
+            debug_line_sec=get_section('.debug_line'), debug_pubtypes_sec=None, debug_pubnames_sec=None
+        )
+        str_offsets = sections.get('.debug_str_offsets')
+        self.dwarf_info._btags_str_offsets = str_offsets.data() if str_offsets is not None else b''
+        self.dwarf_info._btags_str_offsets_format = '<I' if elf_file.little_endian else '>I'
+
+    def get_compile_unit(self, dwo_id=None):
+        """
+        :param dwo_id: DW_AT_GNU_dwo_id of the skeleton, the first compile unit is taken if None
+        :return: the compile unit of the skeleton
+        """
+        for cu in self.dwarf_info.iter_CUs():
+            attribute = cu.get_top_DIE().attributes.get('DW_AT_GNU_dwo_id')
+            if dwo_id is None or attribute is None or attribute.value == dwo_id:
+                return cu
+        raise DwoFileError('No compile unit {:#x} found in {}'.format(dwo_id, self.path))
+
+
+def get_str_offset(dwarf_info: DWARFInfo, index):
+    """
+    :return: the offset in .debug_str of the string of a DW_FORM_GNU_str_index attribute
+    """
+    str_offsets = getattr(dwarf_info, '_btags_str_offsets', b'')
+    if 4 * index + 4 > len(str_offsets):
+        raise DwoFileError('String index {} out of .debug_str_offsets.dwo'.format(index))
+    return struct.unpack_from(dwarf_info._btags_str_offsets_format, str_offsets, 4 * index)[0]
+
+
+def get_dwo_path(top_die, binary_path):
+    """
+    :param top_die: of a skeleton compile unit
+    :return: the path of the .dwo file of the compile unit, None if it is not a skeleton. It is looked for
+             where it was compiled, then beside the binary, the path where it was compiled if it is nowhere
+    """
+    attributes = top_die.attributes
+    if 'DW_AT_GNU_dwo_name' not in attributes:
+        return None
+    dwo_name = bytes2str(attributes['DW_AT_GNU_dwo_name'].value)
+    comp_dir = bytes2str(attributes['DW_AT_comp_dir'].value) if 'DW_AT_comp_dir' in attributes else ''
+    dwo_path = os.path.join(comp_dir, dwo_name)
+    if os.path.isfile(dwo_path):
+        return dwo_path
+    # the build tree may have been moved along with the binary
+    binary_dir = os.path.dirname(os.path.abspath(binary_path))
+    for path in (os.path.join(binary_dir, dwo_name), os.path.join(binary_dir, os.path.basename(dwo_name))):
+        if os.path.isfile(path):
+            return path
+    return dwo_path
+
+
+def has_debug_sections(elf_file: ELFFile):
+    """
+    :return: whether the ELF file has DWARF, not only the .eh_frame pyelftools takes for it
+    """
+    return elf_file.get_section_by_name('.debug_info') is not None or \
+        elf_file.get_section_by_name('.zdebug_info') is not None
+
+
+def get_build_id(elf_file: ELFFile):
+    """
+    :return: the NT_GNU_BUILD_ID of the ELF file, None if it has none
+    """
+    for section in elf_file.iter_sections():
+        if section['sh_type'] != 'SHT_NOTE':
+            continue
+        for note in section.iter_notes():
+            if note['n_type'] == 'NT_GNU_BUILD_ID':
+                return note['n_desc']
+    return None
+
+
+def _get_crc32(path):
+    crc = 0
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(1 << 20), b''):
+            crc = zlib.crc32(block, crc)
+    return crc & 0xffffffff
+
+
+def find_separate_debug_file(elf_file: ELFFile, binary_path, debug_dirs=DEBUG_DIRS):
+    """
+    Looks the debug file of a stripped binary up like gdb: by the build-id in the .build-id directories
+    of the debug directories, then by the .gnu_debuglink section beside the binary, in its .debug directory
+    and under the debug directories, checked by its CRC
+    :return: the path of the debug file, None if there is none
+    """
+    build_id = get_build_id(elf_file)
+    if build_id is not None and len(build_id) > 2:
+        for debug_dir in debug_dirs:
+            path = os.path.join(debug_dir, '.build-id', build_id[:2], build_id[2:] + '.debug')
+            if os.path.isfile(path):
+                return path
+    section = elf_file.get_section_by_name('.gnu_debuglink')
+    if section is None:
+        return None
+    data = section.data()
+    name_end = data.find(b'\0')
+    if name_end <= 0:
+        return None
+    file_name = bytes2str(data[:name_end])
+    crc_offset = (name_end + 4) & ~3
+    if crc_offset + 4 > len(data):
+        return None
+    crc = struct.unpack_from('<I' if elf_file.little_endian else '>I', data, crc_offset)[0]
+    binary_dir = os.path.dirname(os.path.realpath(binary_path))
+    candidates = [os.path.join(binary_dir, file_name), os.path.join(binary_dir, '.debug', file_name)]
+    candidates.extend(
+        os.path.join(debug_dir, binary_dir.lstrip(os.sep), file_name) for debug_dir in debug_dirs
+    )
+    for path in candidates:
+        if os.path.isfile(path) and os.path.realpath(path) != os.path.realpath(binary_path) \
+                and _get_crc32(path) == crc:
+            return path
+    return None
@@ -0,0 +1,98 @@
+from elftools.elf.elffile import ELFFile
+from elftools.elf.relocation import RelocationHandler, RelocationSection
+from elftools.dwarf.dwarfinfo import DWARFInfo, DebugSectionDescriptor
+from elftools.dwarf.compileunit import CompileUnit
+from elftools.dwarf.structs import DWARFStructs
+from elftools.common.utils import struct_parse
+from copy import copy
+from io import BytesIO
+
+
+class TypeUnit(CompileUnit):
+    """
+    A type unit of .debug_types (-fdebug-types-section), which pyelftools does not read. The compile units
+    refer to the type it defines by its signature (DW_FORM_ref_sig8), its DIEs are read from its own
+    .debug_types section like the ones of a compile unit.
+    """
+    def __init__(self, header, dwarfinfo, structs, cu_offset, cu_die_offset, key_base):
+        """
+        :param key_base: added to the DIE offsets in the section, so they do not collide with the offsets of
+                         .debug_info or of the other .debug_types sections, see get_key
+        """
+        super(TypeUnit, self).__init__(header, dwarfinfo, structs, cu_offset, cu_die_offset)
+        self.key_base = key_base
+
+    @property
+    def signature(self):
+        return self.header['signature']
+
+    @property
+    def size(self):
+        return self['unit_length'] + self.structs.initial_length_field_size()
+
+    def get_type_key(self):
+        """
+        :return: key of the DIE of the type defined by the type unit
+        """
+        return self.key_base + self.cu_offset + self.header['type_offset']
+
+    def get_stmt_list(self):
+        """
+        :return: offset of its line program, which is the one of the compile unit it was emitted with
+        """
+        attribute = self.get_top_DIE().attributes.get('DW_AT_stmt_list')
+        return attribute.value if attribute is not None else None
+
+
+def _parse_type_unit(dwarf_info: DWARFInfo, offset, key_base):
+    stream = dwarf_info.debug_info_sec.stream
+    initial_length = struct_parse(dwarf_info.structs.Dwarf_uint32(''), stream, offset)
+    dwarf_format = 64 if initial_length == 0xFFFFFFFF else 32
+    structs = DWARFStructs(little_endian=dwarf_info.config.little_endian, dwarf_format=dwarf_format, address_size=4)
+    # the header of a compile unit followed by the signature and the offset of the type DIE
+    header = struct_parse(structs.Dwarf_CU_header, stream, offset)
+    if header['address_size'] == 8:
+        structs = DWARFStructs(little_endian=dwarf_info.config.little_endian, dwarf_format=dwarf_format,
+                               address_size=8)
+    header['signature'] = struct_parse(structs.Dwarf_uint64(''), stream)
+    header['type_offset'] = struct_parse(structs.Dwarf_offset(''), stream)
+    return TypeUnit(header, dwarf_info, structs, offset, stream.tell(), key_base)
+
+
+def iter_type_units(elf_file: ELFFile, dwarf_info: DWARFInfo):
+    """
+    A relocatable object has a .debug_types section for every type unit, in its COMDAT group,
+    a binary has them all in one
+    :param dwarf_info: of the .debug_info of the ELF file, the type units share its abbreviations and strings
+    :return: iterator of TypeUnit, every one of a DWARFInfo of its .debug_types section
+    """
+    compressed = bool(elf_file.get_section_by_name('.zdebug_info'))
+    section_name = '.zdebug_types' if compressed else '.debug_types'
+    key_base = dwarf_info.debug_info_sec.size
+    # the sections of an object share their name, pyelftools would find the relocations of the first one
+    reloc_sections = dict()
+    reloc_handler = None
+    for section in elf_file.iter_sections():
+        if isinstance(section, RelocationSection):
+            reloc_sections[section['sh_info']] = section
+    for index, section in enumerate(elf_file.iter_sections()):
+        if section.name != section_name:
+            continue
+        stream = BytesIO(section.data())
+        if index in reloc_sections:
+            reloc_handler = reloc_handler or RelocationHandler(elf_file)
+            reloc_handler.apply_section_relocations(stream, reloc_sections[index])
+        types_sec = DebugSectionDescriptor(
+            stream=stream, name=section.name, global_offset=section['sh_offset'], size=section['sh_size'],
+            address=section['sh_addr']
+        )
+        if compressed:
+            types_sec = elf_file._decompress_dwarf_section(types_sec)
+        types_info = copy(dwarf_info)
+        types_info.debug_info_sec = types_sec
+        offset = 0
+        while offset < types_sec.size:
+            type_unit = _parse_type_unit(types_info, offset, key_base)
+            yield type_unit
+            offset += type_unit.size
+        key_base += types_sec.size
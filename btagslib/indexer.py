@@ -0,0 +1,150 @@
+import os
+from os.path import dirname
+from btagslib.db.operation import Database, Operation
+from btagslib.debuginfo.dwarfformat import DwarfParseTaskGenerator
+from btagslib.debuginfo.incremental import IncrementalIndex
+from btagslib.debuginfo.runner import open_task_generators, get_runner
+from btagslib.debuginfo.tagfilter import TagFilter
+from btagslib.elftoolsext.dwarfcache import DwarfDecodeCache
+from btagslib.tagfile.ctag import CtagWriter
+from btagslib.tagfile.writer import TagFileGenerator, DirectTagFileGenerator
+from btagslib.tagfile.partial import replace_tag_files
+from btagslib.terminal.jsonprogress import CallbackProgressReporter
+
+
+class Indexer:
+    """
+    Indexes binaries in process, e.g. for an IDE backend indexing again and again without starting btags
+    every time. An indexer owns its database engine, id allocators and decode caches, so several of them
+    can be used in one process, and they are kept warm from one run to the next::
+
+        with Indexer('tag.sqlite', jobs=4) as indexer:
+            indexer.index(['build/app', 'build/lib'])
+            indexer.write_tag_file('tags')
+
+    Without a database the tags are kept in memory like by btags --direct, and a binary indexed again
+    once it has been linked again is parsed incrementally like by btags --watch.
+    """
+    def __init__(self, db_path=None, jobs=1, tag_filter: TagFilter = None, progress=None, progress_interval=1.0,
+                 max_memory=None, debug_dirs=None):
+        """
+        :param db_path: the database filled, the binaries in it already are not parsed again,
+                        the tags are kept in memory if None
+        :param progress: called with the records of JsonProgressReporter by the worker threads,
+                         e.g. {"event": "progress", "cus_done": 10, "cus_total": 42, ...}
+        :param max_memory: bytes to stay under while parsing, fewer compile units are parsed at once
+                           when they are estimated to take more, see Runner
+        :param debug_dirs: searched for the debug files of stripped binaries, /usr/lib/debug if None
+        """
+        self._jobs = jobs
+        self._max_memory = max_memory
+        self._debug_dirs = debug_dirs
+        self._tag_filter = tag_filter
+        # a line for every worker, the runner and the task generator, like btags
+        self._status_bar = CallbackProgressReporter(jobs + 2, progress, progress_interval)
+        self._decode_cache = DwarfDecodeCache()
+        self.db_path = db_path
+        self.database = Database(db_path) if db_path is not None else None
+        self._incremental_index = IncrementalIndex(
+            self._status_bar, jobs, tag_filter, self._decode_cache, max_memory, debug_dirs
+        ) if db_path is None else None
+
+    @property
+    def store(self):
+        """
+        :return: the TagRecordStore of the tags kept in memory, None if they are stored in the database
+        """
+        return self._incremental_index.store if self._incremental_index is not None else None
+
+    def index(self, paths):
+        """
+        Parses the binaries into the database, or into memory. A binary in the database already is skipped,
+        and raises BinaryChangedError if it has changed since. In memory, only the compile units which may
+        have changed since are parsed again, see IncrementalIndex.
+        :param paths: binary files, or directories searched for ELF files
+        """
+        binary_paths = get_binary_paths(paths)
+        if self._incremental_index is not None:
+            self._incremental_index.update(binary_paths)
+            return
+        task_generators = open_task_generators(binary_paths, self._status_bar, lambda path: DwarfParseTaskGenerator(
+            path, self._status_bar, lambda: Operation(self.database), self._tag_filter,
+            decode_cache=self._decode_cache, debug_dirs=self._debug_dirs
+        ))
+        if len(task_generators) == 0:
+            return
+        try:
+            get_runner(task_generators, self._jobs, self._status_bar, self._max_memory).run()
+        finally:
+            for task_generator in task_generators:
+                task_generator.close()
+
+    def write_tag_file(self, tag_path, work_dir=None, comp_dir=None):
+        """
+        Generates the ctags file of all the binaries indexed, it replaces *tag_path* at once
+        :param work_dir: the paths in the tag file are relative to it, the directory of *tag_path* if None
+        :param comp_dir: the directory the binaries are compiled under, see btags -c
+        """
+        self.write_tag_files([(CtagWriter, tag_path)], work_dir, comp_dir)
+
+    def write_tag_files(self, tag_files, work_dir=None, comp_dir=None):
+        """
+        Generates several tag files of all the binaries indexed in one pass over the tags, e.g.
+        ``[(CtagWriter, 'tags'), (EtagWriter, 'TAGS'), (JsonLinesWriter, 'tags.jsonl')]``
+        :param tag_files: list of the TagWriter class and the path of every tag file
+        :param work_dir: the paths in the tag files are relative to it, the directory of the first one if None
+        """
+        if self.database is not None:
+            # the database may hold binaries indexed before without the filters
+            generator = TagFileGenerator(self.db_path, self._status_bar, self.database, self._tag_filter)
+        else:
+            generator = DirectTagFileGenerator(self.store, self._status_bar)
+        try:
+            replace_tag_files(
+                generator, tag_files, dirname(tag_files[0][1]) if work_dir is None else work_dir, comp_dir
+            )
+        finally:
+            generator.close()
+
+    def close(self):
+        if self.database is not None:
+            self.database.close()
+        self._status_bar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def get_binary_paths(paths):
+    """
+    :param paths: binary files, or directories searched for ELF files
+    :return: the binary files, each once
+    """
+    binary_paths = list()
+    for path in paths:
+        if not os.path.isdir(path):
+            binary_paths.append(path)
+            continue
+        for root, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                file_path = os.path.join(root, file_name)
+                # libfoo.so links to libfoo.so.1, indexed under its own name
+                if os.path.islink(file_path) or not os.path.isfile(file_path):
+                    continue
+                # the DWARF of the split compile units, read along with the binaries
+                if file_name.endswith('.dwo'):
+                    continue
+                with open(file_path, 'rb') as f:
+                    if f.read(4) == b'\x7fELF':
+                        binary_paths.append(file_path)
+    unique_paths = list()
+    real_paths = set()
+    for path in binary_paths:
+        if os.path.realpath(path) not in real_paths:
+            real_paths.add(os.path.realpath(path))
+            unique_paths.append(path)
+    return unique_paths
@@ -0,0 +1,213 @@
+from threading import Lock, get_ident
+from collections import OrderedDict, defaultdict
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def get_peak_rss():
+    """
+    :return: peak resident set size of this process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_rss():
+    """
+    :return: current resident set size of this process in bytes, None if unknown
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StageRecord:
+    __slots__ = ['name', 'cu', 'items', 'start', 'wall', 'cpu', 'peak_rss', 'thread']
+
+    def __init__(self, name, cu, items):
+        self.name = name
+        self.cu = cu
+        self.items = items
+        self.start = 0
+        self.wall = 0
+        self.cpu = 0
+        self.peak_rss = None
+        self.thread = get_ident()
+
+
+class _NullStage:
+    """
+    Returned when profiling is disabled, so the instrumented code
+    pays nothing more than a method call.
+    """
+    items = None
+    cu = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _Stage:
+    def __init__(self, profiler, record: StageRecord):
+        self._profiler = profiler
+        self._record = record
+        self._cpu_start = 0
+
+    @property
+    def items(self):
+        return self._record.items
+
+    @items.setter
+    def items(self, value):
+        self._record.items = value
+
+    def __enter__(self):
+        self._record.start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._record.wall = time.perf_counter() - self._record.start
+        self._record.cpu = time.thread_time() - self._cpu_start
+        self._record.peak_rss = get_peak_rss()
+        self._profiler.add_record(self._record)
+        return False
+
+
+class Profiler:
+    """
+    Collects wall time, CPU time, item counts and peak RSS of the parsing
+    and tag generating stages. Use as following:
+        >>> with profiler.stage('parse', cu=index) as stage:
+        >>>     "Do something"
+        >>>     stage.items = parsed_count
+    Stages are only recorded after *enable* is called.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        self._records = list()
+        self._origin = time.perf_counter()
+        self._cprofile = False
+        self._cprofiles = list()
+
+    def enable(self, cprofile=False):
+        self.enabled = True
+        self._cprofile = cprofile
+        self._origin = time.perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self._records = list()
+            self._cprofiles = list()
+        self._origin = time.perf_counter()
+
+    def stage(self, name, cu=None, items=None):
+        if not self.enabled:
+            return _NullStage()
+        return _Stage(self, StageRecord(name, cu, items))
+
+    def add_record(self, record: StageRecord):
+        with self._lock:
+            self._records.append(record)
+
+    def call(self, func, *args):
+        """
+        Call *func*, under a cProfile profiler of its own if cProfile output is wanted,
+        since cProfile only sees the thread it is enabled in.
+        """
+        if not self._cprofile:
+            return func(*args)
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(func, *args)
+        finally:
+            with self._lock:
+                self._cprofiles.append(prof)
+
+    def get_stage_summary(self):
+        summary = OrderedDict()
+        for record in self._records:
+            if record.name not in summary:
+                summary[record.name] = dict(calls=0, wall=0, cpu=0, items=0, peak_rss=None)
+            stage = summary[record.name]
+            stage['calls'] += 1
+            stage['wall'] += record.wall
+            stage['cpu'] += record.cpu
+            stage['items'] += record.items or 0
+            if record.peak_rss is not None:
+                stage['peak_rss'] = max(stage['peak_rss'] or 0, record.peak_rss)
+        return summary
+
+    def get_slowest_cus(self, top_n):
+        cu_wall = defaultdict(float)
+        cu_items = defaultdict(int)
+        for record in self._records:
+            if record.cu is not None:
+                cu_wall[record.cu] += record.wall
+                cu_items[record.cu] = max(cu_items[record.cu], record.items or 0)
+        slowest = sorted(cu_wall.items(), key=lambda pair: pair[1], reverse=True)[:top_n]
+        return [(cu, wall, cu_items[cu]) for cu, wall in slowest]
+
+    def print_report(self, stream, top_n=10):
+        stream.write('%-16s %8s %12s %12s %12s %12s %10s\n' %
+                     ('stage', 'calls', 'wall(s)', 'cpu(s)', 'items', 'items/s', 'rss(MB)'))
+        for name, stage in self.get_stage_summary().items():
+            rate = stage['items'] / stage['wall'] if stage['wall'] > 0 else 0
+            rss = '%.1f' % (stage['peak_rss'] / 1024 / 1024) if stage['peak_rss'] is not None else '-'
+            stream.write('%-16s %8d %12.3f %12.3f %12d %12.1f %10s\n' %
+                         (name, stage['calls'], stage['wall'], stage['cpu'], stage['items'], rate, rss))
+        slowest = self.get_slowest_cus(top_n)
+        if len(slowest) != 0:
+            stream.write('\nTop %d slowest compile units:\n' % len(slowest))
+            stream.write('%-8s %12s %12s\n' % ('cu', 'wall(s)', 'items'))
+            for cu, wall, items in slowest:
+                stream.write('%-8s %12.3f %12d\n' % (cu, wall, items))
+        stream.flush()
+
+    def dump_pstats(self, path):
+        # pstats alone takes longer to import than a query takes to run
+        import pstats
+        stats = None
+        for prof in self._cprofiles:
+            if stats is None:
+                stats = pstats.Stats(prof)
+            else:
+                stats.add(prof)
+        if stats is not None:
+            stats.dump_stats(path)
+
+    def dump_chrome_trace(self, path):
+        events = list()
+        pid = os.getpid()
+        for record in self._records:
+            args = dict()
+            if record.cu is not None:
+                args['cu'] = record.cu
+            if record.items is not None:
+                args['items'] = record.items
+            events.append(dict(
+                name=record.name, cat='btags', ph='X', pid=pid, tid=record.thread,
+                ts=(record.start - self._origin) * 1e6, dur=record.wall * 1e6, args=args
+            ))
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+
+
+profiler = Profiler()
@@ -0,0 +1,33 @@
+import socket
+import json
+
+
+class LookupServerError(Exception):
+    pass
+
+
+class LookupClient:
+    """
+    Sends requests to a LookupServer, e.g. client.request('find', name='main')
+    """
+    def __init__(self, socket_path, timeout=None):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(socket_path)
+        self._stream = self._socket.makefile('rwb')
+
+    def request(self, op, **arguments):
+        """
+        :return: dict of the response
+        """
+        arguments['op'] = op
+        self._stream.write((json.dumps(arguments) + '\n').encode())
+        self._stream.flush()
+        line = self._stream.readline()
+        if len(line) == 0:
+            raise LookupServerError("Connection closed by the server")
+        return json.loads(line.decode())
+
+    def close(self):
+        self._stream.close()
+        self._socket.close()
@@ -0,0 +1,178 @@
+from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+from threading import Thread, Event, Lock
+import sqlite3
+import socket
+import json
+import sys
+import os
+from btagslib.db.record import TAG_TYPE_NAMES, match_to_dict
+from btagslib.statpoller import StatPoller, get_file_stat
+from .tagindex import TagIndex, TagIndexError
+from .client import LookupServerError
+
+
+class LookupRequestHandler(StreamRequestHandler):
+    """
+    Answers the requests of one connection, a JSON object per line in both directions
+    """
+    def handle(self):
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            try:
+                request = json.loads(line.decode())
+            except ValueError as e:
+                response = dict(ok=False, error='Bad request: {}'.format(e))
+            else:
+                response = self.server.answer(request)
+            self.wfile.write((json.dumps(response, sort_keys=True) + '\n').encode())
+
+
+class LookupServer(ThreadingMixIn, UnixStreamServer):
+    """
+    Serves the lookups of a TagIndex on a Unix socket, so a client does not pay
+    for starting python and reading the database on every lookup, e.g.
+
+        {"op": "find", "name": "parse", "prefix": true, "types": ["Function"], "limit": 20}
+        {"ok": true, "tags": [{"id": 12, "name": "parse_args", "kind": "Function", ...}]}
+
+    The ops are find (with the arguments of TagQuery.find), get, members and
+    children (with tag_id and limit), stats and reload.
+
+    The database is polled, once it has changed and then stayed the same for
+    a poll interval, a new index is loaded and replaces the old one, the
+    requests being answered meanwhile still use the old one.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, db_path, reload_interval=1.0, log=sys.stderr):
+        self.socket_path = socket_path
+        self.db_path = db_path
+        self._reload_interval = reload_interval
+        self._reload_lock = Lock()
+        self._stopped = Event()
+        self._log = log
+        # the commits in WAL mode are in the -wal file until it is checkpointed, the database may not change
+        self._db_paths = [db_path, db_path + '-wal']
+        self._poller = StatPoller(self._db_paths)
+        self._index = TagIndex.load(db_path)
+        self._remove_stale_socket(socket_path)
+        super(LookupServer, self).__init__(socket_path, LookupRequestHandler)
+
+    @staticmethod
+    def _remove_stale_socket(socket_path):
+        if not os.path.exists(socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # nobody listens, left behind by a server which was killed
+            os.remove(socket_path)
+        else:
+            raise LookupServerError("{} is served by another process".format(socket_path))
+        finally:
+            probe.close()
+
+    def _write_log(self, message):
+        if self._log is not None:
+            self._log.write(message + '\n')
+            self._log.flush()
+
+    def get_index(self):
+        """
+        :rtype: TagIndex
+        """
+        return self._index
+
+    def reload(self):
+        """
+        :return: whether a new index replaced the old one
+        """
+        with self._reload_lock:
+            db_stats = [get_file_stat(path) for path in self._db_paths]
+            try:
+                index = TagIndex.load(self.db_path)
+            except (TagIndexError, sqlite3.Error) as e:
+                self._write_log('Keeping the loaded tags, cannot reload {}: {}'.format(self.db_path, e))
+                return False
+            self._index = index
+            for path, db_stat in zip(self._db_paths, db_stats):
+                self._poller.take(path, db_stat)
+        self._write_log('Reloaded {} tags from {}'.format(len(index), self.db_path))
+        return True
+
+    def _watch(self):
+        while not self._stopped.wait(self._reload_interval):
+            if len(self._poller.poll()) != 0:
+                self.reload()
+
+    def start_watching(self):
+        Thread(target=self._watch, name='btags-db-watcher', daemon=True).start()
+
+    @staticmethod
+    def _get_types(types):
+        """
+        :param types: TagType values or their names, e.g. "Function"
+        """
+        if types is None:
+            return None
+        type_values = dict((name.lower(), value) for value, name in TAG_TYPE_NAMES.items())
+        return [type_values[tag_type.lower()] if isinstance(tag_type, str) else tag_type for tag_type in types]
+
+    @staticmethod
+    def _get_tag_id(request):
+        tag_id = request['tag_id']
+        if not isinstance(tag_id, int) or isinstance(tag_id, bool):
+            raise TagIndexError('tag_id should be an integer, got {}'.format(json.dumps(tag_id)))
+        return tag_id
+
+    @staticmethod
+    def _get_limit(request):
+        """
+        :return: the limit of the request, None if there is none
+        """
+        limit = request.get('limit')
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit <= 0):
+            raise TagIndexError('limit should be a positive integer, got {}'.format(json.dumps(limit)))
+        return limit
+
+    def answer(self, request):
+        """
+        :param request: dict decoded from a request line
+        :return: dict of the response
+        """
+        index = self._index
+        op = request.get('op') if isinstance(request, dict) else None
+        try:
+            if op == 'find':
+                matches = index.find(
+                    request['name'], prefix=request.get('prefix', False), ignore_case=request.get('ignore_case', False),
+                    substring=request.get('substring', False), types=self._get_types(request.get('types')),
+                    file=request.get('file'), compile_unit=request.get('compile_unit'), limit=self._get_limit(request)
+                )
+            elif op == 'get':
+                match = index.get(self._get_tag_id(request))
+                matches = [match] if match is not None else []
+            elif op == 'members':
+                matches = index.members(self._get_tag_id(request), self._get_limit(request))
+            elif op == 'children':
+                matches = index.children(self._get_tag_id(request), self._get_limit(request))
+            elif op == 'stats':
+                return dict(ok=True, db_path=self.db_path, **index.get_stats())
+            elif op == 'reload':
+                return dict(ok=self.reload())
+            else:
+                return dict(ok=False, error='Unknown op {}'.format(op))
+        except KeyError as e:
+            return dict(ok=False, error='Missing or unknown argument {}'.format(e))
+        except (TypeError, ValueError, TagIndexError) as e:
+            return dict(ok=False, error=str(e))
+        return dict(ok=True, tags=[match_to_dict(match) for match in matches])
+
+    def server_close(self):
+        self._stopped.set()
+        super(LookupServer, self).server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
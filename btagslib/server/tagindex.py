@@ -0,0 +1,274 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from os.path import basename, normpath, exists
+import os
+import sqlite3
+from btagslib.db.connection import SCHEMA_VERSION, get_schema_version
+from btagslib.db.record import TagMatch, MEMBER_TYPES, fold_case
+
+
+class TagIndexError(Exception):
+    pass
+
+
+# None in the integer columns
+NULL = -1
+
+
+class TagIndex:
+    """
+    Every tag of a tag info database held in memory, to answer lookups without SQLite.
+
+    The tags are ordered like TagQuery.find returns them, by name, file and line,
+    and every column is a flat array of ints, so millions of tags stay compact.
+    The tags of names[n] are the positions [name_tag_start[n], name_tag_start[n + 1]).
+    Exact names are found by a dict, prefixes by bisecting the sorted names.
+    """
+    def __init__(self):
+        # distinct names sorted, their positions, and the same folded for case insensitive lookups, see fold_case
+        self._names = list()
+        self._name_positions = dict()
+        self._lower_names = list()
+        self._lower_positions = array('i')
+        self._name_tag_start = array('i', [0])
+        # Name id -> string, the scopes of the tags are in table Name too
+        self._strings = list()
+
+        self._ids = array('i')
+        self._types = array('b')
+        self._file_ids = array('i')
+        self._line_nos = array('i')
+        self._compile_unit_ids = array('i')
+        self._parent_ids = array('i')
+        self._assoc_ids = array('i')
+        self._scope_ids = array('i')
+        # the tag ids sorted and their positions, the ids of databases written by older runs are sparse
+        self._sorted_ids = array('i')
+        self._sorted_id_positions = array('i')
+
+        # (tag id, id of a member or child) sorted by tag id
+        self._member_keys = array('i')
+        self._member_ids = array('i')
+        self._child_keys = array('i')
+        self._child_ids = array('i')
+        # (tag id, id of another compile unit of the tag) sorted by tag id, see TagCompileUnit
+        self._linked_keys = array('i')
+        self._linked_compile_unit_ids = array('i')
+
+        self._files = dict()
+        self._compile_units = dict()
+
+    @classmethod
+    def load(cls, db_path):
+        """
+        :rtype: TagIndex
+        """
+        if not exists(db_path):
+            raise TagIndexError("Database {} does not exist".format(db_path))
+        # plain sqlite3, for millions of rows the result rows of SQLAlchemy cost more than reading them
+        connection = sqlite3.connect(db_path)
+        try:
+            if get_schema_version(connection) < SCHEMA_VERSION:
+                raise TagIndexError("Database {} is of an older version, open it with btags first".format(db_path))
+            index = cls()
+            index._load(connection.cursor())
+        finally:
+            connection.close()
+        return index
+
+    @staticmethod
+    def _int(value):
+        return NULL if value is None else value
+
+    @staticmethod
+    def _none(value):
+        return None if value == NULL else value
+
+    def _load(self, cursor):
+        max_name_id = cursor.execute('SELECT coalesce(max(id), 0) FROM "Name"').fetchone()[0]
+        self._strings = [None] * (max_name_id + 1)
+        positions_by_name_id = array('i', [NULL]) * (max_name_id + 1)
+        for name_id, name in cursor.execute('SELECT id, name FROM "Name" ORDER BY name'):
+            positions_by_name_id[name_id] = len(self._names)
+            self._name_positions[name] = len(self._names)
+            self._strings[name_id] = name
+            self._names.append(name)
+
+        lower_order = sorted(range(len(self._names)), key=lambda position: fold_case(self._names[position]))
+        self._lower_names = [fold_case(self._names[position]) for position in lower_order]
+        self._lower_positions = array('i', lower_order)
+
+        to_int = self._int
+        name_tag_start = array('i', [0]) * (len(self._names) + 1)
+        for row in cursor.execute(
+            'SELECT t.id, t.name_id, t.type, t.file_id, t.line_no, t.compile_unit_id, t.parent_tag_id, '
+            't.assoc_to_tag_id, t.scope_id FROM "Tag" t JOIN "Name" n ON n.id = t.name_id '
+            'ORDER BY n.name, t.file_id, t.line_no'
+        ):
+            tag_id, name_id, tag_type, file_id, line_no, compile_unit_id, parent_id, assoc_id, scope_id = row
+            # the tags come in the order of the names, counted here and summed below
+            name_tag_start[positions_by_name_id[name_id] + 1] += 1
+            self._ids.append(tag_id)
+            self._types.append(to_int(tag_type))
+            self._file_ids.append(to_int(file_id))
+            self._line_nos.append(to_int(line_no))
+            self._compile_unit_ids.append(to_int(compile_unit_id))
+            self._parent_ids.append(to_int(parent_id))
+            self._assoc_ids.append(to_int(assoc_id))
+            self._scope_ids.append(to_int(scope_id))
+        for position in range(1, len(name_tag_start)):
+            name_tag_start[position] += name_tag_start[position - 1]
+        self._name_tag_start = name_tag_start
+
+        ids = self._ids
+        self._sorted_id_positions = array('i', sorted(range(len(ids)), key=ids.__getitem__))
+        self._sorted_ids = array('i', (ids[position] for position in self._sorted_id_positions))
+
+        for key, tag_id in cursor.execute(
+            'SELECT assoc_to_tag_id, id FROM "Tag" WHERE assoc_to_tag_id IS NOT NULL AND type IN ({}) '
+            'ORDER BY assoc_to_tag_id, line_no, id'.format(', '.join(str(tag_type) for tag_type in MEMBER_TYPES))
+        ):
+            self._member_keys.append(key)
+            self._member_ids.append(tag_id)
+        for key, tag_id in cursor.execute(
+            'SELECT parent_tag_id, id FROM "Tag" WHERE parent_tag_id IS NOT NULL ORDER BY parent_tag_id, line_no, id'
+        ):
+            self._child_keys.append(key)
+            self._child_ids.append(tag_id)
+        for key, compile_unit_id in cursor.execute(
+            'SELECT tag_id, compile_unit_id FROM "TagCompileUnit" ORDER BY tag_id, compile_unit_id'
+        ):
+            self._linked_keys.append(key)
+            self._linked_compile_unit_ids.append(compile_unit_id)
+
+        for file_id, file_directory, file_name in cursor.execute(
+            'SELECT id, file_directory, file_name FROM "File"'
+        ):
+            self._files[file_id] = (file_directory, file_name)
+        for compile_unit_id, object_name in cursor.execute('SELECT id, object_name FROM "CompileUnit"'):
+            self._compile_units[compile_unit_id] = object_name
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_stats(self):
+        return dict(tags=len(self._ids), names=len(self._names), files=len(self._files))
+
+    @staticmethod
+    def _get_prefix_end(prefix):
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def _find_name_positions(self, name, prefix, ignore_case, substring):
+        """
+        :return: positions of the matched names, in the order of the names
+        """
+        if substring:
+            # no index for substrings, a scan of the names is still much faster than a query
+            if ignore_case:
+                name = fold_case(name)
+                return [position for position, candidate in enumerate(self._names) if name in fold_case(candidate)]
+            return [position for position, candidate in enumerate(self._names) if name in candidate]
+        if ignore_case:
+            names, name = self._lower_names, fold_case(name)
+        else:
+            names = self._names
+        if not prefix:
+            if not ignore_case:
+                position = self._name_positions.get(name)
+                return [position] if position is not None else []
+            begin, end = bisect_left(names, name), bisect_right(names, name)
+        elif len(name) != 0:
+            begin, end = bisect_left(names, name), bisect_left(names, self._get_prefix_end(name))
+        else:
+            begin, end = 0, len(names)
+        if ignore_case:
+            return sorted(self._lower_positions[begin:end])
+        return range(begin, end)
+
+    def _accept(self, position, types, file, compile_unit):
+        if types is not None and self._types[position] not in types:
+            return False
+        if file is not None:
+            tag_file = self._files.get(self._file_ids[position])
+            if tag_file is None or tag_file[1] != basename(file):
+                return False
+            if basename(file) != file and not os.path.join(*tag_file).endswith(normpath(file)):
+                return False
+        if compile_unit is not None:
+            tag_id = self._ids[position]
+            begin, end = bisect_left(self._linked_keys, tag_id), bisect_right(self._linked_keys, tag_id)
+            compile_unit_ids = [self._compile_unit_ids[position]]
+            compile_unit_ids.extend(self._linked_compile_unit_ids[begin:end])
+            if isinstance(compile_unit, int):
+                return compile_unit in compile_unit_ids
+            compile_unit = normpath(compile_unit)
+            return any(
+                object_name is not None and object_name.endswith(compile_unit)
+                for object_name in (self._compile_units.get(compile_unit_id) for compile_unit_id in compile_unit_ids)
+            )
+        return True
+
+    def _get_match(self, position, name=None):
+        if name is None:
+            name = self._names[bisect_right(self._name_tag_start, position) - 1]
+        tag_file = self._files.get(self._file_ids[position], (None, None))
+        scope_id = self._scope_ids[position]
+        return TagMatch(
+            self._ids[position], name, self._none(self._types[position]),
+            self._strings[scope_id] if scope_id != NULL else None, tag_file[0], tag_file[1],
+            self._none(self._line_nos[position]), self._none(self._compile_unit_ids[position]),
+            self._none(self._parent_ids[position]), self._none(self._assoc_ids[position])
+        )
+
+    def find(self, name, prefix=False, ignore_case=False, substring=False,
+             types=None, file=None, compile_unit=None, limit=None):
+        """
+        The same lookup as TagQuery.find
+        :rtype: list[TagMatch]
+        """
+        if len(name) == 0 and not prefix:
+            raise TagIndexError("Name should not be empty")
+        types = set(types) if types is not None else None
+        matches = list()
+        for name_position in self._find_name_positions(name, prefix, ignore_case, substring):
+            tag_name = self._names[name_position]
+            for position in range(self._name_tag_start[name_position], self._name_tag_start[name_position + 1]):
+                if self._accept(position, types, file, compile_unit):
+                    matches.append(self._get_match(position, tag_name))
+                    if limit is not None and len(matches) >= limit:
+                        return matches
+        return matches
+
+    def _get_position(self, tag_id):
+        """
+        :return: position of the tag, None if there is no such tag
+        """
+        index = bisect_left(self._sorted_ids, tag_id)
+        if index == len(self._sorted_ids) or self._sorted_ids[index] != tag_id:
+            return None
+        return self._sorted_id_positions[index]
+
+    def get(self, tag_id):
+        """
+        :rtype: TagMatch
+        """
+        position = self._get_position(tag_id)
+        return self._get_match(position) if position is not None else None
+
+    def _get_related(self, keys, ids, tag_id, limit):
+        begin, end = bisect_left(keys, tag_id), bisect_right(keys, tag_id)
+        if limit is not None:
+            end = min(end, begin + limit)
+        return [self._get_match(self._get_position(related_id)) for related_id in ids[begin:end]]
+
+    def members(self, tag_id, limit=None):
+        """
+        The same lookup as TagQuery.members
+        """
+        return self._get_related(self._member_keys, self._member_ids, tag_id, limit)
+
+    def children(self, tag_id, limit=None):
+        """
+        The same lookup as TagQuery.children
+        """
+        return self._get_related(self._child_keys, self._child_ids, tag_id, limit)
@@ -0,0 +1,48 @@
+import os
+
+
+def get_file_stat(path):
+    """
+    :return: what changes when the file is written or replaced, None if it cannot be found
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class StatPoller:
+    """
+    Polls files, e.g. binaries or databases: once a file has changed and then stayed the same
+    for a poll, it is taken for written. The poller does not sleep, the caller polls it every interval.
+    """
+    def __init__(self, paths):
+        # path -> stat of the file as it was taken last
+        self._stats = dict((path, get_file_stat(path)) for path in paths)
+        # path -> stat of the file changed at the last poll
+        self._changed_stats = dict()
+
+    def poll(self):
+        """
+        :return: dict of path -> stat of the files which changed and then stayed the same, see take
+        """
+        changed = dict()
+        for path, taken_stat in self._stats.items():
+            stat = get_file_stat(path)
+            if stat is None or stat == taken_stat:
+                self._changed_stats.pop(path, None)
+            elif stat != self._changed_stats.get(path):
+                # may still be being written, wait until it stops changing
+                self._changed_stats[path] = stat
+            else:
+                changed[path] = stat
+                del self._changed_stats[path]
+        return changed
+
+    def take(self, path, stat):
+        """
+        Records the file as it was used, it is reported again by poll until then
+        :param stat: returned by poll or get_file_stat before the file was read
+        """
+        self._stats[path] = stat
@@ -0,0 +1,28 @@
+from btagslib.tagfile.writer import TagWriter
+
+
+class EtagWriter(TagWriter):
+    """
+    Writes the TAGS file of Emacs. Its tags are grouped by file in sections headed by the size of the section,
+    so they are kept until every tag has been written.
+
+    No source is read, so the tag lines carry no text to search for: Emacs goes to the line given
+    and looks the explicit tag name up.
+    """
+    def __init__(self, stream):
+        super().__init__(stream)
+        # path -> the tag lines of the file
+        self._sections = dict()
+
+    def write(self, tag, path, line_no):
+        lines = self._sections.get(path)
+        if lines is None:
+            lines = self._sections[path] = list()
+        lines.append('\x7f%s\x01%d,\n' % (tag.name, line_no))
+        return True
+
+    def end(self):
+        for path in sorted(self._sections):
+            section = ''.join(self._sections[path])
+            self._stream.write('\x0c\n%s,%d\n%s' % (path, len(section.encode()), section))
+        self._sections = dict()
@@ -0,0 +1,24 @@
+import json
+from btagslib.db.record import TAG_TYPE_NAMES, MEMBER_TYPES
+from btagslib.tagfile.writer import TagWriter
+
+
+class JsonLinesWriter(TagWriter):
+    """
+    Writes a JSON object a line for every tag, e.g. for a code search index::
+
+        {"kind": "Member", "line_no": 12, "name": "x", "parent": "point", "path": "src/point.h", "scope": null}
+
+    The parent is the qualified name of the structure, function or enumeration of a member, parameter or
+    enumerator, or of the tag enclosing it.
+    """
+    def write(self, tag, path, line_no):
+        parent_tag = tag.assoc_to_tag if tag.type in MEMBER_TYPES else None
+        if parent_tag is None:
+            parent_tag = tag.parent_tag
+        record = dict(
+            name=tag.name, kind=TAG_TYPE_NAMES.get(tag.type), scope=tag.scope, path=path, line_no=line_no,
+            parent=self.get_qualified_name(parent_tag) if parent_tag is not None else None
+        )
+        self._stream.write(json.dumps(record, sort_keys=True) + '\n')
+        return True
@@ -0,0 +1,16 @@
+from btagslib.db.record import TagType
+
+
+# TagType -> the kind letter of ctags, the tags of the other types have no kind
+CTAG_KINDS = {
+    TagType.Class: 'c',
+    TagType.Macro: 'd',
+    TagType.EnumerationMember: 'e',
+    TagType.Enumeration: 'g',
+    TagType.Member: 'm',
+    TagType.Function: 'p',
+    TagType.Structure: 's',
+    TagType.Typedef: 't',
+    TagType.Union: 'u',
+    TagType.Variable: 'v',
+}
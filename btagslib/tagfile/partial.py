@@ -0,0 +1,93 @@
+from os.path import basename, dirname, abspath, join
+from threading import Thread, Event
+import time
+import uuid
+import os
+from btagslib.terminal.jsonprogress import CallbackProgressReporter
+
+
+def replace_tag_files(generator, tag_files, *args):
+    """
+    Generates the tag files aside and moves them over their paths, so an editor never reads one half written
+    :param generator: of the tags, e.g. a DirectTagFileGenerator
+    :param tag_files: list of the TagWriter class and the path of every tag file, they are generated in one pass
+    :param args: passed on to get_tag_files after the writers
+    """
+    tmp_paths = list()
+    streams = list()
+    try:
+        for _, tag_path in tag_files:
+            tmp_paths.append(
+                join(dirname(abspath(tag_path)), '.{}.{}'.format(basename(tag_path), uuid.uuid4().hex[:8]))
+            )
+            streams.append(open(tmp_paths[-1], 'x'))
+        generator.get_tag_files(
+            [writer_class(stream) for (writer_class, _), stream in zip(tag_files, streams)], *args
+        )
+        for stream in streams:
+            stream.close()
+        for tmp_path, (_, tag_path) in zip(tmp_paths, tag_files):
+            os.replace(tmp_path, tag_path)
+    except BaseException:
+        for stream in streams:
+            stream.close()
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+
+class PartialTagFileWriter:
+    """
+    Generates the tag files every interval while the binaries are being parsed, with the tags committed so far,
+    so the symbols of the compile units parsed first can be jumped to long before the run ends. Every partial
+    tag file is complete and sorted, it replaces the previous one at once.
+
+    Generating it competes with the parse tasks, so it waits at least twice as long as the last one took.
+    """
+    def __init__(self, generator_factory, tag_files, interval, *args):
+        """
+        :param generator_factory: called with a status bar, creates the TagFileGenerator of the tags so far
+        :param tag_files: list of the TagWriter class and the path of every tag file
+        :param args: passed on to get_tag_files after the writers
+        """
+        self._generator_factory = generator_factory
+        self._tag_files = tag_files
+        self._interval = interval
+        self._args = args
+        self._stopped = Event()
+        self._thread = None
+        # the records of the partial tag files would be mixed up with the ones of the run
+        self._status_bar = CallbackProgressReporter(1)
+        self.count = 0
+
+    def _write(self):
+        generator = self._generator_factory(self._status_bar)
+        try:
+            replace_tag_files(generator, self._tag_files, *self._args)
+        finally:
+            generator.close()
+        self.count += 1
+
+    def _run(self):
+        wait = self._interval
+        while not self._stopped.wait(wait):
+            start_time = time.time()
+            try:
+                self._write()
+            except Exception:
+                # only the final tag file has to be there, e.g. the database was busy
+                pass
+            wait = max(self._interval, 2 * (time.time() - start_time))
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='btags-partial-tag-file', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Waits for the partial tag files being generated, the final ones replace them
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,234 @@
+from btagslib.db.model import *
+from btagslib.db.operation import Operation, Database
+from btagslib.db.record import TagRecord, FileRecord
+from btagslib.db.memory import TagRecordStore, TagRecordView
+from btagslib.debuginfo.tagfilter import TagFilter
+from btagslib.terminal.statusbar import MultiProgressBar, get_status_bar_decorator
+from btagslib.profiling.profiler import profiler
+import os
+
+
+class LackInfoException(Exception):
+    pass
+
+
+class TagWriter:
+    """
+    Writes a tag file of one format to its stream. A TagFileGenerator reads and sorts the tags once
+    and hands them to all its writers, so generating several tag files costs a single pass.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, tag, path, line_no):
+        """
+        Called for every tag, ordered by name, file name and line number
+        :param tag: a TagRecordView
+        :param path: of the file of the tag, relative to the work directory
+        :param line_no: of the tag, or of the closest parent with one
+        :return: whether the tag is written
+        """
+        raise NotImplementedError
+
+    def end(self):
+        """
+        Called once every tag has been written, for the formats which are not written tag by tag
+        """
+        pass
+
+    @staticmethod
+    def get_qualified_name(tag):
+        return tag.name if tag.scope is None else '%s::%s' % (tag.scope, tag.name)
+
+
+class TagFileGenerator:
+    """
+    Generates tag files of the tags of a database
+    """
+    def __init__(self, db_path, status_bar: MultiProgressBar, database: Database = None,
+                 tag_filter: TagFilter = None):
+        """
+        :param database: the Database of *db_path* if it is open, e.g. by an Indexer
+        :param tag_filter: only the tags of the kinds and files it accepts are written, for a database
+                           filled before without it or with other filters
+        """
+        self._op = Operation(database if database is not None else Operation.prepare(db_path))
+        self._session = self._op.session()
+        self._tag_filter = tag_filter
+        self._init_generator(status_bar)
+
+    def _init_generator(self, status_bar: MultiProgressBar):
+        self._status_bar = status_bar
+        self._status_bar_index = status_bar.get_an_index()
+        self._status_bar_decorator = get_status_bar_decorator(status_bar, self._status_bar_index)
+        self._work_dir = os.curdir
+        self._comp_dir = None
+        # file id -> path relative to the work directory, the tags of a file share it
+        self._paths = dict()
+
+    def close(self):
+        self._op.close()
+        self._status_bar.return_an_index(self._status_bar_index)
+
+    def get_tag_files(self, writers, work_dir=os.curdir, comp_dir=None):
+        """
+        :type writers: list[TagWriter]
+        :param work_dir: the paths in the tag files are relative to it
+        :param comp_dir: the directory the binaries are compiled under, the paths are computed from it if not None
+        """
+        self._work_dir = work_dir
+        self._comp_dir = comp_dir
+        self._paths = dict()
+        store = TagRecordStore()
+        with profiler.stage('query') as stage:
+            records = self._load_tags(store)
+            stage.items = len(records)
+        self._write_tags(writers, [TagRecordView(record, store) for record in records], len(store.tags))
+
+    def _load_tags(self, store: TagRecordStore):
+        """
+        Read every file and tag into *store*, the parents and associated tags are looked up there
+        :return: the tags with a file, ordered by name, file name and line number
+        """
+        file = File.__table__
+        tag = Tag.__table__
+        name = Name.__table__
+        scope = Name.__table__.alias('scope')
+        files = [
+            FileRecord(*row) for row in self._session.execute(
+                select([file.c.id, file.c.file_name, file.c.file_directory, file.c.file_dir_rel_to_comp_dir])
+            )
+        ]
+        query = select([
+            tag.c.id, name.c.name, tag.c.type, tag.c.file_id, tag.c.compile_unit_id, tag.c.line_no,
+            tag.c.parent_tag_id, tag.c.assoc_to_tag_id, scope.c.name, tag.c.scope_type
+        ]).select_from(
+            tag.join(name, tag.c.name_id == name.c.id).
+            outerjoin(scope, tag.c.scope_id == scope.c.id).
+            outerjoin(file, tag.c.file_id == file.c.id)
+        ).order_by(name.c.name, file.c.file_name, tag.c.line_no)
+        records = [TagRecord(*row) for row in self._session.execute(query)]
+        store.add(files, records)
+        records = [record for record in records if store.get_file(record.file_id) is not None]
+        if self._tag_filter is not None:
+            records = self._filter_tags(records, store)
+        return records
+
+    def _filter_tags(self, records, store: TagRecordStore):
+        """
+        Keeps the tags a run with the filters would have parsed, the tags dropped are still looked up
+        as parents and associated tags in *store*
+        """
+        tag_filter = self._tag_filter
+        records = [record for record in records if tag_filter.accepts_kind(record.type)]
+        if not tag_filter.filters_paths():
+            return records
+        # the directories of the files are relative to the compile directory of their compile unit
+        comp_dirs = dict()
+        accepted_compile_unit_ids = set()
+        for compile_unit_id, comp_dir, comp_file in self._session.execute(
+                'SELECT id, comp_dir, comp_file FROM "CompileUnit"'
+        ):
+            comp_dirs[compile_unit_id] = comp_dir
+            if tag_filter.accepts_path(TagFilter.get_path(comp_dir, comp_file)):
+                accepted_compile_unit_ids.add(compile_unit_id)
+        # the compile units excluded are not parsed, but a tag of a header is parsed by any of them including it
+        linked_tag_ids = set(
+            tag_id for tag_id, compile_unit_id in
+            self._session.execute('SELECT tag_id, compile_unit_id FROM "TagCompileUnit"')
+            if compile_unit_id in accepted_compile_unit_ids
+        )
+
+        def accepts(record):
+            if record.compile_unit_id not in accepted_compile_unit_ids and record.id not in linked_tag_ids:
+                return False
+            file = store.get_file(record.file_id)
+            return tag_filter.accepts_path(TagFilter.get_path(
+                comp_dirs.get(record.compile_unit_id, os.sep), file.file_directory, file.file_name
+            ))
+        return [record for record in records if accepts(record)]
+
+    def _get_path(self, tag):
+        file = tag.file
+        if file is None:
+            raise LackInfoException
+        path = self._paths.get(file.id)
+        if path is None:
+            # the actual absolute path is computed from the compile directory
+            if self._comp_dir is not None:
+                file_path = os.path.abspath(
+                    os.path.join(self._comp_dir, file.file_dir_rel_to_comp_dir, file.file_name)
+                )
+            else:
+                file_path = os.path.join(file.file_directory, file.file_name)
+            path = os.path.relpath(file_path, self._work_dir)
+            self._paths[file.id] = path
+        return path
+
+    @staticmethod
+    def _get_line_no(tag):
+        while tag.line_no is None and tag.parent_tag is not None:
+            tag = tag.parent_tag
+        if tag.line_no is None:
+            raise LackInfoException
+        return tag.line_no
+
+    def _write_tags(self, writers, all_tags, tag_len):
+        """
+        :param all_tags: the tags ordered by name, file name and line number
+        """
+        prev_tag = None
+
+        @self._status_bar_decorator(0, 1, tag_len, "Generating tags {0}/{1}")
+        def gen_tag(cur_tag):
+            try:
+                path = self._get_path(cur_tag)
+                line_no = self._get_line_no(cur_tag)
+            except LackInfoException:
+                return
+            written = False
+            for writer in writers:
+                if writer.write(cur_tag, path, line_no):
+                    written = True
+            if written:
+                self._status_bar.record('tags_written')
+
+        with profiler.stage('tag_file', items=len(all_tags)):
+            for tag in all_tags:
+                if prev_tag is not None and \
+                                prev_tag.name == tag.name and \
+                                prev_tag.file.file_name == tag.file.file_name and \
+                                prev_tag.file.file_directory == tag.file.file_directory and \
+                                prev_tag.line_no == tag.line_no:
+                    continue
+                else:
+                    gen_tag(tag)
+                    prev_tag = tag
+            for writer in writers:
+                writer.end()
+
+
+class DirectTagFileGenerator(TagFileGenerator):
+    """
+    Generates tag files of the tags of a TagRecordStore, without a database.
+    """
+    def __init__(self, store: TagRecordStore, status_bar: MultiProgressBar):
+        self._store = store
+        self._init_generator(status_bar)
+
+    def close(self):
+        self._status_bar.return_an_index(self._status_bar_index)
+
+    def get_tag_files(self, writers, work_dir=os.curdir, comp_dir=None):
+        self._work_dir = work_dir
+        self._comp_dir = comp_dir
+        self._paths = dict()
+        store = self._store
+        with profiler.stage('sort') as stage:
+            # the order of the query of TagFileGenerator, tags without a file are not written either
+            records = [record for record in store.tags if store.get_file(record.file_id) is not None]
+            records.sort(key=lambda record: (
+                record.name, store.get_file(record.file_id).file_name, -1 if record.line_no is None else record.line_no
+            ))
+            stage.items = len(records)
+        self._write_tags(writers, [TagRecordView(record, store) for record in records], len(store.tags))
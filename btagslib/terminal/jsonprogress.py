@@ -0,0 +1,109 @@
+from .terminalcontroller import TerminalController
+from threading import Lock
+import json
+import time
+
+
+class JsonProgressReporter:
+    """
+    A non-interactive replacement of MultiProgressBar. Instead of drawing
+    bars on a terminal, it periodically writes one JSON object per line::
+
+        {"event": "progress", "elapsed": 12.5, "cus_done": 10, "cus_total": 42,
+         "dies": 35012, "dies_per_sec": 2800.9, "tags": 8120, "tags_per_sec": 649.6,
+         "bytes_done": 120034, "bytes_total": 503112, "eta": 39.8, "message": "..."}
+
+    It accepts the same calls as MultiProgressBar, so it can be handed to
+    the task generator, the runner and the tag file formats unchanged.
+    """
+    COUNTERS = ['cus_done', 'cus_total', 'dies', 'tags', 'bytes_done', 'bytes_total', 'tags_written']
+
+    def __init__(self, bar_count, out, interval=1.0):
+        self.term = TerminalController(out)
+        self._bar_count = bar_count
+        self._out = out
+        self._out_lock = Lock()
+        self._interval = interval
+        self._start_time = time.time()
+        self._last_emit = 0
+        self._last_message = None
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self.index_lock = Lock()
+        self.allocated_index = set()
+
+    def _write(self, record):
+        self._out.write(json.dumps(record, sort_keys=True) + '\n')
+        self._out.flush()
+
+    def _progress_record(self):
+        elapsed = time.time() - self._start_time
+        record = dict(self._counters)
+        record['event'] = 'progress'
+        record['elapsed'] = round(elapsed, 3)
+        record['dies_per_sec'] = round(self._counters['dies'] / elapsed, 1) if elapsed > 0 else 0
+        record['tags_per_sec'] = round(self._counters['tags'] / elapsed, 1) if elapsed > 0 else 0
+        bytes_done = self._counters['bytes_done']
+        bytes_total = self._counters['bytes_total']
+        if 0 < bytes_done <= bytes_total:
+            record['eta'] = round(elapsed * (bytes_total - bytes_done) / bytes_done, 1)
+        else:
+            record['eta'] = None
+        record['message'] = self._last_message
+        return record
+
+    def _emit_if_due(self, force=False):
+        now = time.time()
+        if force or now - self._last_emit >= self._interval:
+            self._last_emit = now
+            self._write(self._progress_record())
+
+    def record(self, key, amount=1):
+        with self._out_lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._emit_if_due()
+
+    def update(self, index, percent, message):
+        assert percent <= 1
+        with self._out_lock:
+            if message is not None:
+                self._last_message = message
+            self._emit_if_due()
+
+    def get_an_index(self):
+        with self.index_lock:
+            for i in range(self._bar_count):
+                if i not in self.allocated_index:
+                    self.allocated_index.add(i)
+                    return i
+        assert False
+
+    def return_an_index(self, index):
+        with self.index_lock:
+            assert index in self.allocated_index
+            self.allocated_index.remove(index)
+
+    def info(self, index, str, color=None):
+        with self._out_lock:
+            self._write(dict(event='info', elapsed=round(time.time() - self._start_time, 3), message=str))
+
+    def close(self):
+        with self._out_lock:
+            self._emit_if_due(True)
+
+
+class CallbackProgressReporter(JsonProgressReporter):
+    """
+    Hands the records of JsonProgressReporter to a callable instead of writing them, for the
+    applications running btags in process, see Indexer. The callable is called by the worker
+    threads, one at a time.
+    """
+    def __init__(self, bar_count, callback=None, interval=1.0):
+        """
+        :param callback: called with every record, nothing is reported if None
+        """
+        super(CallbackProgressReporter, self).__init__(bar_count, None, interval)
+        self._callback = callback
+
+    def _write(self, record):
+        if self._callback is not None:
+            self._callback(record)
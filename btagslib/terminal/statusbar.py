@@ -115,10 +115,20 @@ class MultiProgressBar:
             assert index in self.allocated_index
             self.allocated_index.remove(index)
 
-    def __del__(self):
+    def record(self, key, amount=1):
+        """
+        Counters such as processed DIEs or tags are only reported by
+        the non-interactive reporters, the bars have nowhere to show them.
+        """
+        pass
+
+    def close(self):
         os.system("stty echo icanon")
         os.system("tput cnorm")
 
+    def __del__(self):
+        self.close()
+
     def info(self, index, str, color=None):
         if color is None:
             color = self.term.NORMAL
@@ -161,7 +171,7 @@ def get_status_bar_decorator(status_bar: MultiProgressBar, index: int):
                 cur_step[0] += 1
                 if force or cur_step[0] % mydiv == 0 or total_step - cur_step[0] <= mydiv:
                     status_bar.update(index, (cur_step[0] / total_step) * span + base,
-                                      message.format(cur_step, total_step))
+                                      message.format(cur_step[0], total_step))
                 step_func(*args)
             return wrapper
         return decorator
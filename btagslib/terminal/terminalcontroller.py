@@ -94,7 +94,7 @@ class TerminalController:
             return
 
         # If the stream isn't a tty, then assume it has no capabilities.
-        if not term_stream.isatty(): return
+        if term_stream is None or not term_stream.isatty(): return
 
         # Check the terminal type.  If we fail, then assume that the
         # terminal has no capabilities.
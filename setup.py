@@ -26,7 +26,7 @@ setup(
         'Programming Language :: Python :: 3.6',
     ],
     keywords='dwarf ctags tag binary',
-    packages=find_packages(exclude=['tests*']),
+    packages=find_packages(exclude=['tests*', 'benchmarks*']),
     install_requires=['SQLAlchemy', 'pyelftools'],
     python_requires='>=3',
     entry_points={
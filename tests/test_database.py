@@ -0,0 +1,201 @@
+"""
+Databases written by older versions are migrated, and the database of an interrupted run is resumed
+"""
+import subprocess
+import unittest
+import tempfile
+import sqlite3
+import shutil
+import sys
+import os
+
+from btagslib.db.connection import SCHEMA_VERSION, get_schema_version
+from btagslib.db.operation import Database
+from btagslib.db.query import TagQuery
+from btagslib.db.record import TagType
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the schema of version 1, the names, scopes and types are columns of table Tag, the types are strings
+SCHEMA_V1 = [
+    'CREATE TABLE "File" (id INTEGER PRIMARY KEY, file_name TEXT NOT NULL, file_directory TEXT NOT NULL, '
+    'file_dir_rel_to_comp_dir TEXT NOT NULL)',
+    'CREATE TABLE "CompileUnit" (id INTEGER PRIMARY KEY, comp_dir VARCHAR NOT NULL, comp_file VARCHAR NOT NULL, '
+    'object_name TEXT NOT NULL)',
+    'CREATE TABLE "CompileUnitFile" (id INTEGER PRIMARY KEY, compile_unit_id INTEGER NOT NULL, '
+    'file_id INTEGER NOT NULL)',
+    'CREATE TABLE "Tag" (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, file_id INTEGER, compile_unit_id INTEGER, '
+    'line_no INTEGER, column_no INTEGER, parent_tag_id INTEGER, assoc_to_tag_id INTEGER, type VARCHAR, '
+    'scope VARCHAR)',
+    'INSERT INTO "File" VALUES (1, \'p.h\', \'/src\', \'.\')',
+    'INSERT INTO "CompileUnit" VALUES (0, \'/src\', \'a.c\', \'/src/a.c\')',
+    'INSERT INTO "Tag" VALUES (1, \'point\', 1, 0, 2, NULL, NULL, NULL, \'5\', NULL)',
+    'INSERT INTO "Tag" VALUES (2, \'x\', 1, 0, 3, NULL, 1, 1, \'11\', \'point\')',
+    'INSERT INTO "Tag" VALUES (3, \'main\', 1, 0, 7, NULL, NULL, NULL, \'2\', NULL)',
+]
+
+HEADER = """
+#define POINT_DIMENSIONS 2
+struct point {
+    int x;
+    int y;
+};
+typedef struct point point_t;
+"""
+
+SOURCE_A = """
+#include "p.h"
+int point_len(point_t *p) { return p->x + p->y; }
+int main(void) { point_t p = { 1, POINT_DIMENSIONS }; return point_len(&p); }
+"""
+
+SOURCE_B = """
+#include "p.h"
+#define B_SCALE 3
+int b_scale(struct point p) { return p.y * B_SCALE; }
+"""
+
+
+class MigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, 'tag.sqlite')
+        connection = sqlite3.connect(self.db_path)
+        for statement in SCHEMA_V1:
+            connection.execute(statement)
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def get_columns(self, connection, table):
+        return set(row[1] for row in connection.execute('PRAGMA table_info("{}")'.format(table)))
+
+    def test_migrate(self):
+        Database(self.db_path).close()
+        connection = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(get_schema_version(connection), SCHEMA_VERSION)
+            self.assertEqual(
+                sorted(row[0] for row in connection.execute('SELECT name FROM "Name"')), ['main', 'point', 'x']
+            )
+            self.assertTrue({'name_id', 'scope_id', 'scope_type'} <= self.get_columns(connection, 'Tag'))
+            self.assertNotIn('name', self.get_columns(connection, 'Tag'))
+            self.assertTrue({'binary_id', 'offset', 'macros_done'} <= self.get_columns(connection, 'CompileUnit'))
+            self.assertEqual(
+                connection.execute('SELECT DISTINCT typeof(type) FROM "Tag"').fetchall(), [('integer',)]
+            )
+            self.assertEqual(
+                connection.execute('SELECT count(*) FROM "TagCompileUnit"').fetchone()[0], 0
+            )
+        finally:
+            connection.close()
+        query = TagQuery(self.db_path)
+        try:
+            member = query.find('x')[0]
+            self.assertEqual(
+                (member.type, member.scope, member.file_name, member.line_no, member.parent_tag_id),
+                (TagType.Member, 'point', 'p.h', 3, 1)
+            )
+            self.assertEqual([match.name for match in query.members(1)], ['x'])
+        finally:
+            query.close()
+
+    def test_migrate_on_connect(self):
+        # the readers migrate a database of an older version when they open it
+        query = TagQuery(self.db_path)
+        try:
+            self.assertEqual(query.find('point')[0].type, TagType.Structure)
+        finally:
+            query.close()
+
+    def test_id_counters_after_migration(self):
+        # the tags added later continue after the migrated ones
+        database = Database(self.db_path)
+        try:
+            self.assertEqual(database.tag_id_counter, 3)
+            self.assertEqual(database.name_id_counter, 3)
+            self.assertEqual(database.compile_unit_id_counter, 1)
+        finally:
+            database.close()
+
+
+@unittest.skipIf(shutil.which('gcc') is None, 'needs gcc')
+class ResumeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        for file_name, source in (('p.h', HEADER), ('a.c', SOURCE_A), ('b.c', SOURCE_B)):
+            with open(os.path.join(cls.work_dir, file_name), 'w') as stream:
+                stream.write(source)
+        subprocess.check_call(['gcc', '-g3', '-gdwarf-4', '-o', 'app', 'a.c', 'b.c'], cwd=cls.work_dir)
+        cls.db_path = os.path.join(cls.work_dir, 'tag.sqlite')
+        cls.tag_path = os.path.join(cls.work_dir, 'tags')
+        cls.tags = cls.get_tags('-n', '-d', cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    @classmethod
+    def run_btags(cls, *args):
+        """
+        :return: the CompletedProcess of btags generating the tag file of the binary
+        """
+        return subprocess.run(
+            [sys.executable, '-m', 'btagslib.cli.btags', '-P', 'json', '--no-cache', '-t', cls.tag_path] +
+            list(args) + ['app'],
+            cwd=cls.work_dir, env=dict(os.environ, PYTHONPATH=ROOT),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+        )
+
+    @classmethod
+    def get_tags(cls, *args):
+        """
+        :return: the tag file generated for the binary
+        """
+        cls.run_btags(*args).check_returncode()
+        with open(cls.tag_path) as stream:
+            return stream.read()
+
+    def interrupt(self):
+        """
+        :return: the path of a copy of the database as if the run had been killed after committing
+                 the first compile unit, before its macros
+        """
+        db_path = os.path.join(self.work_dir, 'interrupted.sqlite')
+        shutil.copyfile(self.db_path, db_path)
+        connection = sqlite3.connect(db_path)
+        kept = connection.execute('SELECT min(id) FROM "CompileUnit"').fetchone()[0]
+        connection.execute('DELETE FROM "Tag" WHERE compile_unit_id != ? OR type = ?', (kept, TagType.Macro))
+        connection.execute(
+            'DELETE FROM "TagCompileUnit" WHERE compile_unit_id != ? OR tag_id NOT IN (SELECT id FROM "Tag")', (kept,)
+        )
+        connection.execute('DELETE FROM "CompileUnit" WHERE id != ?', (kept,))
+        connection.execute('UPDATE "CompileUnit" SET macros_done = NULL')
+        connection.execute('UPDATE "Binary" SET done = NULL')
+        connection.commit()
+        connection.close()
+        return db_path
+
+    def test_refuse_without_resume(self):
+        process = self.run_btags('-d', self.interrupt())
+        self.assertEqual(process.returncode, 2)
+        self.assertIn('--resume', process.stderr)
+
+    def test_resume(self):
+        db_path = self.interrupt()
+        connection = sqlite3.connect(db_path)
+        try:
+            self.assertEqual(connection.execute('SELECT count(*) FROM "CompileUnit"').fetchone()[0], 1)
+            self.assertEqual(self.get_tags('--resume', '-d', db_path), self.tags)
+            self.assertEqual(connection.execute('SELECT count(*) FROM "Binary" WHERE done').fetchone()[0], 1)
+        finally:
+            connection.close()
+        # complete, it is not parsed again
+        self.assertEqual(self.get_tags('-d', db_path), self.tags)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+The lookups of TagQuery in the database and of TagIndex in memory find the same tags
+"""
+import subprocess
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+from btagslib.db.query import TagQuery, TagQueryError
+from btagslib.server.tagindex import TagIndex
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = """
+struct point {
+    int x;
+    int y;
+};
+enum Shape { SHAPE_POINT, SHAPE_LINE };
+"""
+
+SOURCE_A = """
+#include "p.h"
+int Émile_count = 1;
+int point_len(struct point *p) { return p->x + Émile_count; }
+int main(void) { struct point p = { 1, 2 }; return point_len(&p); }
+"""
+
+SOURCE_B = """
+#include "p.h"
+int émile_other = 2;
+int POINT_MAX = 3;
+int b_entry(struct point p, enum Shape shape) { return p.y + shape + émile_other; }
+"""
+
+
+@unittest.skipIf(shutil.which('gcc') is None, 'needs gcc')
+class TagQueryIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        for file_name, source in (('p.h', HEADER), ('a.c', SOURCE_A), ('b.c', SOURCE_B)):
+            with open(os.path.join(cls.work_dir, file_name), 'w', encoding='utf-8') as stream:
+                stream.write(source)
+        subprocess.check_call(['gcc', '-g', '-gdwarf-4', '-o', 'app', 'a.c', 'b.c'], cwd=cls.work_dir)
+        cls.db_path = os.path.join(cls.work_dir, 'tag.sqlite')
+        subprocess.check_call(
+            [sys.executable, '-m', 'btagslib.cli.btags', '-P', 'json', '--no-cache', '-n', '-d', cls.db_path,
+             '-t', os.path.join(cls.work_dir, 'tags'), 'app'],
+            cwd=cls.work_dir, env=dict(os.environ, PYTHONPATH=ROOT),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        cls.query = TagQuery(cls.db_path)
+        cls.index = TagIndex.load(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.query.close()
+        shutil.rmtree(cls.work_dir)
+
+    def find(self, name, **kwargs):
+        """
+        :return: the names of the tags found, checked to be the same by TagQuery and TagIndex
+        """
+        matches = self.query.find(name, **kwargs)
+        self.assertEqual(matches, self.index.find(name, **kwargs), 'find({!r}, {})'.format(name, kwargs))
+        return [match.name for match in matches]
+
+    def test_exact(self):
+        self.assertEqual(self.find('point_len'), ['point_len'])
+        self.assertEqual(self.find('POINT_LEN'), [])
+        self.assertEqual(self.find('nothing'), [])
+
+    def test_prefix(self):
+        self.assertIn('point_len', self.find('point', prefix=True))
+        self.assertNotIn('POINT_MAX', self.find('point', prefix=True))
+        self.assertEqual(len(self.find('', prefix=True)), len(self.index))
+
+    def test_ignore_case(self):
+        self.assertEqual(set(self.find('point', ignore_case=True)), {'point'})
+        self.assertEqual(set(self.find('POINT', prefix=True, ignore_case=True)), {'point', 'point_len', 'POINT_MAX'})
+        self.assertEqual(set(self.find('shape_', prefix=True, ignore_case=True)), {'SHAPE_POINT', 'SHAPE_LINE'})
+
+    def test_ignore_case_folds_ascii_only(self):
+        # the names as they are read from the DWARF, beginning with a non ASCII letter
+        count = [name for name in self.find('mile_count', substring=True)][0]
+        other = [name for name in self.find('mile_other', substring=True)][0]
+        self.assertEqual(self.find(count.upper(), ignore_case=True), [count])
+        self.assertEqual(self.find(count[0].lower() + count[1:], ignore_case=True), [])
+        self.assertEqual(self.find(other[:-2].upper(), prefix=True, ignore_case=True), [other])
+        self.assertEqual(self.find(other[0].lower() + other[1:4], substring=True, ignore_case=True), [])
+
+    def test_substring(self):
+        self.assertEqual(set(self.find('_LINE', substring=True)), {'SHAPE_LINE'})
+        self.assertEqual(set(self.find('point', substring=True, ignore_case=True)),
+                         {'point', 'point_len', 'POINT_MAX', 'SHAPE_POINT'})
+
+    def test_substring_index(self):
+        db_path = os.path.join(self.work_dir, 'trigram.sqlite')
+        shutil.copyfile(self.db_path, db_path)
+        query = TagQuery(db_path)
+        try:
+            query.build_substring_index()
+        except TagQueryError as e:
+            query.close()
+            self.skipTest(str(e))
+        try:
+            names = self.index.find('mile_', substring=True)
+            for name, ignore_case in [('_LINE', False), ('point', True)] + [
+                (case(match.name), True) for match in names for case in (str.upper, str.lower)
+            ]:
+                self.assertEqual(
+                    query.find(name, substring=True, ignore_case=ignore_case),
+                    self.index.find(name, substring=True, ignore_case=ignore_case)
+                )
+        finally:
+            query.close()
+
+    def test_filters(self):
+        self.assertEqual(self.find('x', file='p.h'), ['x'])
+        self.assertEqual(self.find('x', file='a.c'), [])
+        self.assertEqual(self.find('POINT_MAX', compile_unit='b.c'), ['POINT_MAX'])
+        self.assertEqual(self.find('POINT_MAX', compile_unit='a.c'), [])
+        self.assertEqual(self.find('', prefix=True, limit=3), self.find('', prefix=True)[:3])
+
+    def test_filters_of_header_tags(self):
+        # the tags of p.h are stored once, for the compile unit committed first, and found for both
+        compile_unit_ids = [self.query.find(name)[0].compile_unit_id for name in ('point_len', 'b_entry')]
+        self.assertNotEqual(compile_unit_ids[0], compile_unit_ids[1])
+        for compile_unit in ['a.c', 'b.c'] + compile_unit_ids:
+            self.assertEqual(self.find('point', compile_unit=compile_unit), ['point'])
+            self.assertEqual(self.find('x', compile_unit=compile_unit), ['x'])
+
+    def test_related(self):
+        point = [match for match in self.query.find('point') if match.type is not None][0]
+        self.assertEqual(self.query.get(point.id), self.index.get(point.id))
+        self.assertEqual([match.name for match in self.query.members(point.id)], ['x', 'y'])
+        self.assertEqual(self.query.members(point.id), self.index.members(point.id))
+        self.assertEqual(self.query.children(point.id), self.index.children(point.id))
+        self.assertIsNone(self.index.get(-1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+TagFilter, and the tags written with --include, --exclude and --kinds are the same whether they are parsed
+with the filters or read from a database filled without them
+"""
+import subprocess
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+
+from btagslib.debuginfo.tagfilter import TagFilter
+from btagslib.db.record import TagType
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = """
+#define POINT_DIMENSIONS 2
+struct point {
+    int x;
+    int y;
+};
+enum Shape { SHAPE_POINT, SHAPE_LINE };
+int point_len(struct point *p);
+"""
+
+SOURCE = """
+#include "p.h"
+#define ORIGIN_X 0
+int point_len(struct point *p) { return p->x + p->y; }
+int main(void) {
+    struct point p = { ORIGIN_X, POINT_DIMENSIONS };
+    enum Shape s = SHAPE_LINE;
+    return point_len(&p) + s;
+}
+"""
+
+
+class TagFilterTest(unittest.TestCase):
+    def test_paths(self):
+        tag_filter = TagFilter(includes=['/src'], excludes=['/src/vendor', '*/gen_*.h'])
+        self.assertTrue(tag_filter.filters_paths())
+        self.assertTrue(tag_filter.accepts_path('/src/a.c'))
+        self.assertTrue(tag_filter.accepts_path('/src/lib/b.h'))
+        # the parent directories match as well
+        self.assertFalse(tag_filter.accepts_path('/src/vendor/c.h'))
+        self.assertFalse(tag_filter.accepts_path('/src/lib/gen_d.h'))
+        self.assertFalse(tag_filter.accepts_path('/usr/include/stdio.h'))
+        self.assertFalse(tag_filter.accepts_path('/srcs/e.c'))
+
+    def test_excludes_only(self):
+        tag_filter = TagFilter(excludes=['/usr/include'])
+        self.assertTrue(tag_filter.accepts_path('/home/a.c'))
+        self.assertFalse(tag_filter.accepts_path('/usr/include/sys/types.h'))
+        self.assertEqual(TagFilter.get_path('/build', '../src', 'a.c'), '/src/a.c')
+        self.assertEqual(TagFilter.get_path('/build', '/usr/include', 'stdio.h'), '/usr/include/stdio.h')
+
+    def test_kinds(self):
+        tag_filter = TagFilter(kinds=[TagType.Function, TagType.Structure])
+        self.assertFalse(tag_filter.filters_paths())
+        self.assertTrue(tag_filter.accepts_kind(TagType.Function))
+        self.assertFalse(tag_filter.accepts_kind(TagType.Macro))
+        self.assertTrue(TagFilter().accepts_kind(TagType.Macro))
+        self.assertTrue(TagFilter().accepts_path('/any/path.c'))
+
+    def test_id(self):
+        # the databases parsed with other filters are cached apart
+        self.assertEqual(TagFilter(kinds=[1, 2]).get_id(), TagFilter(kinds=[2, 1]).get_id())
+        self.assertNotEqual(TagFilter(kinds=[1]).get_id(), TagFilter(kinds=[2]).get_id())
+        self.assertNotEqual(TagFilter(includes=['/a']).get_id(), TagFilter(excludes=['/a']).get_id())
+
+
+@unittest.skipIf(shutil.which('gcc') is None, 'needs gcc')
+class FilteredDatabaseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        for file_name, source in (('p.h', HEADER), ('a.c', SOURCE)):
+            with open(os.path.join(cls.work_dir, file_name), 'w') as stream:
+                stream.write(source)
+        subprocess.check_call(['gcc', '-g3', '-gdwarf-4', '-o', 'app', 'a.c'], cwd=cls.work_dir)
+        cls.db_path = os.path.join(cls.work_dir, 'tag.sqlite')
+        cls.get_tags('-n', '-d', cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    @classmethod
+    def get_tags(cls, *args):
+        """
+        :return: the name, file and address of the tags of the tag file generated for the binary
+        """
+        tag_path = os.path.join(cls.work_dir, 'tags')
+        subprocess.check_call(
+            [sys.executable, '-m', 'btagslib.cli.btags', '-P', 'json', '--no-cache', '-t', tag_path] + list(args) +
+            ['app'],
+            cwd=cls.work_dir, env=dict(os.environ, PYTHONPATH=ROOT),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        with open(tag_path) as stream:
+            return [line.split('\t')[:3] for line in stream if not line.startswith('!')]
+
+    def assert_same_tags(self, *filters):
+        tags = self.get_tags('-d', self.db_path, *filters)
+        self.assertEqual(tags, self.get_tags('--direct', *filters), filters)
+        self.assertNotEqual(tags, self.get_tags('-d', self.db_path), filters)
+
+    def test_kinds(self):
+        for kinds in ('p,s', 'd', 'e,m'):
+            self.assert_same_tags('--kinds', kinds)
+
+    def test_paths(self):
+        self.assert_same_tags('--exclude', os.path.join(self.work_dir, 'p.h'))
+        self.assert_same_tags('--include', os.path.join(self.work_dir, 'a.c'))
+        # the compile unit is not parsed, nor is the header it includes
+        self.assert_same_tags('--include', os.path.join(self.work_dir, 'p.h'))
+
+
+if __name__ == '__main__':
+    unittest.main()
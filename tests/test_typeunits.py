@@ -0,0 +1,107 @@
+"""
+The tags of a binary with type units (-fdebug-types-section) are the ones of the same binary without
+"""
+import subprocess
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = """
+namespace outerns {
+namespace innerns {
+struct Widget {
+    struct Nested {
+        int depth;
+    };
+    int method(int a);
+    Nested n;
+};
+}
+class Klass {
+public:
+    int get(int k);
+    int v;
+};
+union U {
+    int f;
+    float g;
+};
+enum Color { RED, GREEN };
+}
+"""
+
+SOURCE = """
+#include "w.h"
+int outerns::innerns::Widget::method(int a) { return a + n.depth; }
+int outerns::Klass::get(int k) { return k + v; }
+int use(outerns::U u, outerns::Color c) {
+    outerns::innerns::Widget w;
+    outerns::Klass k;
+    return w.method(1) + k.get(2) + u.f + c;
+}
+int main() { outerns::U u; u.f = 1; return use(u, outerns::RED); }
+"""
+
+
+@unittest.skipIf(shutil.which('g++') is None, 'needs g++')
+class TypeUnitTagsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp()
+        with open(os.path.join(cls.work_dir, 'w.h'), 'w') as stream:
+            stream.write(HEADER)
+        with open(os.path.join(cls.work_dir, 'w.cpp'), 'w') as stream:
+            stream.write(SOURCE)
+        for binary, flags in (('tu', ['-fdebug-types-section']), ('notu', [])):
+            subprocess.check_call(
+                ['g++', '-g', '-gdwarf-4'] + flags + ['-o', binary, 'w.cpp'], cwd=cls.work_dir
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+
+    def get_tags(self, binary, *args):
+        """
+        :return: lines of the tag file generated for the binary
+        """
+        tag_path = os.path.join(self.work_dir, binary + '.tags')
+        env = dict(os.environ, PYTHONPATH=ROOT, XDG_CACHE_HOME=os.path.join(self.work_dir, 'cache'))
+        subprocess.check_call(
+            [sys.executable, '-m', 'btagslib.cli.btags', '-P', 'json', '-t', tag_path] + list(args) + [binary],
+            cwd=self.work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        with open(tag_path) as stream:
+            return stream.read().splitlines()
+
+    def test_same_tags(self):
+        self.assertEqual(self.get_tags('tu', '--direct'), self.get_tags('notu', '--direct'))
+
+    def test_nested_type_scope(self):
+        nested = [line for line in self.get_tags('tu', '--direct') if line.startswith('Nested\t')]
+        self.assertEqual(len(nested), 1)
+        self.assertIn('\tstruct:outerns::innerns::Widget\t', nested[0])
+
+    def test_same_tags_with_kinds(self):
+        for kinds in ('p', 's,m', 'e'):
+            self.assertEqual(
+                self.get_tags('tu', '--direct', '--kinds', kinds), self.get_tags('notu', '--direct', '--kinds', kinds)
+            )
+
+    def test_same_tags_from_database(self):
+        db_path = os.path.join(self.work_dir, 'tu.sqlite')
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        self.assertEqual(self.get_tags('tu', '-d', db_path), self.get_tags('notu', '--direct'))
+        # the second run reads the database cached by the first one
+        os.remove(db_path)
+        self.assertEqual(self.get_tags('tu', '-d', db_path), self.get_tags('notu', '--direct'))
+
+
+if __name__ == '__main__':
+    unittest.main()